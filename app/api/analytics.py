@@ -0,0 +1,364 @@
+import heapq
+import threading
+from collections import Counter
+from datetime import date
+from datetime import datetime
+from datetime import timezone
+from typing import Callable
+from typing import Collection
+from typing import Iterable
+
+from app.api.storage.base import Repository
+from app.api.storage.columnar import ColumnarOrderRepository
+from app.api.storage.columnar import OrderColumns
+from app.models.money import Cents
+from app.models.orders import Order
+
+# NumPy is optional. Without it, rollups are rebuilt from the order history one order at a time.
+try:
+    import numpy
+except ImportError:  # pragma: no cover - depends on the environment
+    numpy = None
+
+SECONDS_PER_DAY = 86400
+
+
+class DailyRollup:
+    """
+    The orders placed on one day, in UTC.
+
+    Attributes:
+
+        day (date): The day.
+        order_count (int): The number of orders placed on that day.
+        total_cents (Cents): The sum of their totals, before discounts.
+        discounted_cents (Cents): The sum of what was paid for them, after discounts.
+    """
+    day: date
+    order_count: int
+    total_cents: Cents
+    discounted_cents: Cents
+
+    def __init__(self, day: date, order_count: int = 0, total_cents: Cents = 0, discounted_cents: Cents = 0):
+        self.day = day
+        self.order_count = order_count
+        self.total_cents = total_cents
+        self.discounted_cents = discounted_cents
+
+    @property
+    def discount_cents(self) -> Cents:
+        return Cents(self.total_cents - self.discounted_cents)
+
+
+class OrderRollups:
+    """
+    Aggregates of the order history, kept up to date as orders are placed, so reading them never goes through the
+    order history.
+
+    Every aggregate is a counter keyed by what it counts: orders, revenue and discounts per day, how often every
+    drink and topping was ordered, and how often every topping was ordered on the same line as every drink. The
+    pairings are kept per drink, so the pairings of one drink are read without looking at the others.
+
+    Orders are added from FastAPI's threadpool, so the aggregates are guarded by a lock.
+
+    The rollups only count the orders of their own process: the orders in storage when they were last rebuilt, and
+    the orders the process placed since. With several worker processes sharing the "sqlite" backend, every worker
+    misses the orders the other workers placed since it last rebuilt its rollups.
+    """
+
+    def __init__(self):
+        self._days: dict[date, DailyRollup] = {}
+        self._drink_counts: Counter[int] = Counter()
+        self._topping_counts: Counter[int] = Counter()
+        self._pairings: dict[int, Counter[int]] = {}
+        # The orders added while the rollups are rebuilt, if they are, to count them on top of the rebuilt rollups.
+        self._recorded: list[Order] | None = None
+        self._lock = threading.Lock()
+        # Only one rebuild runs at a time, as each records the orders added while it runs.
+        self._rebuild_lock = threading.Lock()
+
+    def add(self, order: Order) -> None:
+        """
+        Count an order towards every aggregate.
+        """
+        with self._lock:
+            if self._recorded is not None:
+                self._recorded.append(order)
+            self._add(order)
+
+    def _add(self, order: Order) -> None:
+        # Called with the lock held.
+        day = order.created_at.astimezone(timezone.utc).date()
+        rollup = self._days.get(day)
+        if rollup is None:
+            rollup = self._days[day] = DailyRollup(day)
+        rollup.order_count += 1
+        rollup.total_cents += order.total_cents
+        rollup.discounted_cents += order.discounted_cents
+        for index, drink_line in enumerate(order.drink_ids):
+            topping_line = order.topping_ids[index] if index < len(order.topping_ids) else []
+            self._drink_counts.update(drink_line)
+            self._topping_counts.update(topping_line)
+            for drink_id in drink_line:
+                pairings = self._pairings.get(drink_id)
+                if pairings is None:
+                    pairings = self._pairings[drink_id] = Counter()
+                pairings.update(topping_line)
+
+    def replace(self, other: "OrderRollups") -> None:
+        """
+        Replace every aggregate with the aggregates of other rollups.
+        """
+        with self._lock:
+            self._replace(other)
+
+    def _replace(self, other: "OrderRollups") -> None:
+        # Called with the lock held.
+        self._days = other._days
+        self._drink_counts = other._drink_counts
+        self._topping_counts = other._topping_counts
+        self._pairings = other._pairings
+
+    def rebuild(self, backfill: Callable[[], tuple["OrderRollups", Collection[int]]]) -> None:
+        """
+        Replace every aggregate with rollups rebuilt from the order history, without losing the orders placed while
+        they are rebuilt. The orders added while "backfill" runs are recorded, and those the rebuilt rollups do not
+        count are counted on top of them, in the same step as the aggregates are replaced.
+
+        Args:
+
+            backfill (Callable[[], tuple[OrderRollups, Collection[int]]]): Builds the rollups of the order history,
+                and returns them with the IDs of the orders they count.
+        """
+        with self._rebuild_lock:
+            with self._lock:
+                self._recorded = []
+            try:
+                rebuilt, counted_ids = backfill()
+            except BaseException:
+                with self._lock:
+                    self._recorded = None
+                raise
+            with self._lock:
+                recorded, self._recorded = self._recorded, None
+                self._replace(rebuilt)
+                for order in recorded:
+                    if order.id not in counted_ids:
+                        self._add(order)
+
+    def clear(self) -> None:
+        self.replace(OrderRollups())
+
+    def summary(self) -> tuple[int, Cents, Cents]:
+        """
+        Get the number of orders, and the sum of their totals and of what was paid for them.
+
+        Returns:
+
+            tuple[int, Cents, Cents]: The number of orders, the sum of their totals and the sum of what was paid for
+                them, in cents.
+        """
+        with self._lock:
+            days = list(self._days.values())
+
+        return (sum(rollup.order_count for rollup in days), Cents(sum(rollup.total_cents for rollup in days)),
+                Cents(sum(rollup.discounted_cents for rollup in days)))
+
+    def daily(self, since: date | None = None, until: date | None = None) -> list[DailyRollup]:
+        """
+        Get the rollup of every day with orders, in order, optionally within a range of days.
+
+        Args:
+
+            since (date | None): If provided, only days from this day on are returned. Default is None.
+            until (date | None): If provided, only days before this day are returned. Default is None.
+
+        Returns:
+
+            list[DailyRollup]: A copy of the rollup of every day.
+        """
+        with self._lock:
+            days = [DailyRollup(rollup.day, rollup.order_count, rollup.total_cents, rollup.discounted_cents)
+                    for rollup in self._days.values()
+                    if (since is None or rollup.day >= since) and (until is None or rollup.day < until)]
+
+        return sorted(days, key=lambda rollup: rollup.day)
+
+    def top_drinks(self, k: int | None = None) -> list[tuple[int, int]]:
+        """
+        Get the most ordered drinks, as (drink ID, count) pairs, most ordered first, then by ID.
+        """
+        with self._lock:
+            return _top(self._drink_counts, k)
+
+    def top_toppings(self, k: int | None = None) -> list[tuple[int, int]]:
+        """
+        Get the most ordered toppings, as (topping ID, count) pairs, most ordered first, then by ID.
+        """
+        with self._lock:
+            return _top(self._topping_counts, k)
+
+    def pairings(self, drink_id: int | None = None, k: int | None = None) -> list[tuple[int, int, int]]:
+        """
+        Get how often toppings were ordered on the same line as drinks, most often first.
+
+        Args:
+
+            drink_id (int | None): If provided, only the pairings of this drink are returned. Default is None.
+            k (int | None): The maximum number of pairings to return. Default is None, which returns all of them.
+
+        Returns:
+
+            list[tuple[int, int, int]]: (drink ID, topping ID, count) triples.
+        """
+        with self._lock:
+            if drink_id is not None:
+                return [(drink_id, topping_id, count)
+                        for topping_id, count in _top(self._pairings.get(drink_id, {}), k)]
+            ranked = [(count, -drink_id, -topping_id)
+                      for drink_id, toppings in self._pairings.items() for topping_id, count in toppings.items()]
+
+        ranked = sorted(ranked, reverse=True) if k is None else heapq.nlargest(k, ranked)
+        return [(-negated_drink_id, -negated_topping_id, count)
+                for count, negated_drink_id, negated_topping_id in ranked]
+
+
+def _top(counts: dict[int, int], k: int | None) -> list[tuple[int, int]]:
+    # IDs are negated, so equal counts are ordered by ascending ID.
+    ranked = [(count, -key) for key, count in counts.items()]
+    # A heap only has to keep the top "k" entries, instead of sorting every entry.
+    ranked = sorted(ranked, reverse=True) if k is None else heapq.nlargest(k, ranked)
+
+    return [(-negated_key, count) for count, negated_key in ranked]
+
+
+def rebuild_rollups(orders: Iterable[Order]) -> OrderRollups:
+    """
+    Build the rollups of an order history one order at a time. Works with every storage backend.
+
+    Args:
+
+        orders (Iterable[Order]): The order history.
+
+    Returns:
+
+        OrderRollups: The rollups of the orders.
+    """
+    rollups = OrderRollups()
+    for order in orders:
+        rollups.add(order)
+
+    return rollups
+
+
+def rebuild_rollups_from_columns(columns: OrderColumns) -> OrderRollups:
+    """
+    Build the rollups of an order history kept in columns with NumPy, in a few operations over whole columns instead
+    of a loop over orders. Deleted rows must have been removed from the columns.
+
+    Args:
+
+        columns (OrderColumns): The order history.
+
+    Returns:
+
+        OrderRollups: The rollups of the orders.
+    """
+    rollups = OrderRollups()
+    if not len(columns.ids):
+        return rollups
+
+    # The amounts and times of the orders, grouped by day.
+    days = (numpy.frombuffer(columns.created_at, dtype=numpy.float64) // SECONDS_PER_DAY).astype(numpy.int64)
+    unique_days, day_index = numpy.unique(days, return_inverse=True)
+    order_counts = numpy.bincount(day_index)
+    # Weighted counts are floats, which hold sums of cents exactly up to 2 ** 53.
+    total_cents = numpy.bincount(day_index, weights=numpy.frombuffer(columns.total_cents, dtype=numpy.int64))
+    discounted_cents = numpy.bincount(day_index, weights=numpy.frombuffer(columns.discounted_cents, dtype=numpy.int64))
+    for day, order_count, total, discounted in zip(unique_days.tolist(), order_counts.tolist(),
+                                                   total_cents.astype(numpy.int64).tolist(),
+                                                   discounted_cents.astype(numpy.int64).tolist()):
+        moment = datetime.fromtimestamp(day * SECONDS_PER_DAY, timezone.utc).date()
+        rollups._days[moment] = DailyRollup(moment, order_count, total, discounted)
+
+    drink_ids = numpy.frombuffer(columns.drink_ids, dtype=numpy.int32)
+    topping_ids = numpy.frombuffer(columns.topping_ids, dtype=numpy.int32)
+    rollups._drink_counts = _count_values(drink_ids)
+
+    # The drink and the topping lines of an order are counted separately, as an order can have fewer topping lines
+    # than drink lines. Line "i" of an order pairs drink line "drink_line_offsets[row] + i" with topping line
+    # "topping_line_offsets[row] + i", if the order has that many topping lines.
+    drink_line_offsets = numpy.frombuffer(columns.drink_line_offsets, dtype=numpy.int64)
+    topping_line_offsets = numpy.frombuffer(columns.topping_line_offsets, dtype=numpy.int64)
+    drink_offsets = numpy.frombuffer(columns.drink_offsets, dtype=numpy.int64)
+    topping_offsets = numpy.frombuffer(columns.topping_offsets, dtype=numpy.int64)
+    drink_lines = numpy.arange(len(drink_offsets) - 1)
+    rows = numpy.searchsorted(drink_line_offsets, drink_lines, side="right") - 1
+    positions = drink_lines - drink_line_offsets[rows]
+    has_toppings = positions < topping_line_offsets[rows + 1] - topping_line_offsets[rows]
+    topping_lines = topping_line_offsets[rows] + positions
+    topping_lines[~has_toppings] = 0
+    topping_starts = numpy.where(has_toppings, topping_offsets[topping_lines], 0)
+    topping_counts = numpy.where(has_toppings, topping_offsets[topping_lines + 1] - topping_starts, 0)
+
+    # As when an order is added, only the toppings of lines with drinks are counted: topping lines beyond the drink
+    # lines of their order are left out.
+    rollups._topping_counts = _count_values(topping_ids[_ranges(topping_starts, topping_counts)])
+
+    # Every drink is paired with every topping of its line: each drink is repeated once per topping of its line, and
+    # next to it goes each topping of the line in turn.
+    drink_line_of_value = numpy.repeat(drink_lines, numpy.diff(drink_offsets))
+    pairs_per_drink = topping_counts[drink_line_of_value]
+    paired_drinks = numpy.repeat(drink_ids, pairs_per_drink)
+    paired_toppings = topping_ids[_ranges(topping_starts[drink_line_of_value], pairs_per_drink)]
+    # Each pair is counted as one integer key, which is much faster to count than rows of two IDs.
+    topping_id_span = int(topping_ids.max()) + 1 if len(topping_ids) else 1
+    keys, counts = numpy.unique(paired_drinks.astype(numpy.int64) * topping_id_span + paired_toppings,
+                                return_counts=True)
+    for key, count in zip(keys.tolist(), counts.tolist()):
+        drink_id, topping_id = divmod(key, topping_id_span)
+        pairings = rollups._pairings.get(drink_id)
+        if pairings is None:
+            pairings = rollups._pairings[drink_id] = Counter()
+        pairings[topping_id] = count
+
+    return rollups
+
+
+def backfill_rollups(orders: Repository[Order]) -> tuple[OrderRollups, Collection[int]]:
+    """
+    Build the rollups of every stored order, with NumPy over the order columns when both are available, or else one
+    order at a time.
+
+    Args:
+
+        orders (Repository[Order]): The order storage.
+
+    Returns:
+
+        tuple[OrderRollups, Collection[int]]: The rollups of the orders, and the IDs of the orders they count.
+    """
+    if numpy is not None and isinstance(orders, ColumnarOrderRepository):
+        columns = orders.copy_columns()
+        return rebuild_rollups_from_columns(columns), set(columns.ids)
+
+    counted_ids = set()
+
+    def counted_orders() -> Iterable[Order]:
+        for order in orders:
+            counted_ids.add(order.id)
+            yield order
+
+    return rebuild_rollups(counted_orders()), counted_ids
+
+
+def _ranges(starts, lengths):
+    # The positions of several runs of an array, each given by its start and length, one run after the other: the
+    # start of its run, plus the position within the run.
+    run_offsets = numpy.cumsum(lengths) - lengths
+    return numpy.repeat(starts, lengths) + numpy.arange(int(lengths.sum())) - numpy.repeat(run_offsets, lengths)
+
+
+def _count_values(values) -> Counter[int]:
+    unique, counts = numpy.unique(values, return_counts=True)
+    return Counter(dict(zip(unique.tolist(), counts.tolist())))
@@ -0,0 +1,6 @@
+import threading
+
+# Drinks and toppings are changed, and toppings deleted, under this lock, so a topping cannot be deleted while a drink
+# is changed to list it, nor come back because an update of it was written after it was deleted. It is reentrant, as
+# deleting a topping from the catalog also deletes it through the topping operations.
+CATALOG_LOCK = threading.RLock()
@@ -1,11 +1,67 @@
+from typing import Iterable
+
 from app.models.drinks import Drink
+from app.models.toppings import Topping
+from app.api.crud_operations.catalog_lock import CATALOG_LOCK
+from app.api.crud_operations.topping_operations import TOPPINGS
+from app.api.crud_operations.topping_operations import delete_topping
+from app.api.imports import CatalogImportError
+from app.api.imports import check_replaced_ids
 from app.api.schemas.drinks import DrinkCreate
+from app.api.schemas.drinks import DrinkImport
 from app.api.schemas.drinks import DrinkUpdate
+from app.api.metrics import timed
+from app.api.storage.backends import create_repository
+from app.api.storage.base import Repository
+from app.api.storage.indexes import ReferenceIndex
+from app.api.storage.indexes import SearchIndex
+from app.api.storage.snapshots import Snapshot
+from app.api.storage.snapshots import SnapshotPublisher
+from app.api.storage.tables import DRINK_TABLE
+from app.config import settings
+
+# Create the storage for the drinks, indexed by drink ID, using the configured storage backend.
+DRINKS: Repository[Drink] = create_repository(DRINK_TABLE)
+# An immutable snapshot of all drinks, which is what the catalog endpoints read from. Every function changing the
+# drinks publishes a new snapshot.
+DRINKS_SNAPSHOT: SnapshotPublisher[Drink] = SnapshotPublisher(DRINKS)
+# The IDs of the drinks listing each topping, keyed by topping ID. Kept up to date by every function changing the
+# drinks, so deleting a topping only looks at the drinks which list it, instead of at every drink.
+DRINKS_BY_TOPPING = ReferenceIndex()
+# The names and prices of the drinks, indexed for searching. Kept up to date by every function changing the drinks.
+DRINK_SEARCH_INDEX = SearchIndex()
+
+
+class UnknownToppingsError(Exception):
+    """
+    Raised when a drink lists toppings which do not exist.
+    """
 
-# Create an in-memory storage for the drinks.
-DRINKS: list[Drink] = []
+    def __init__(self, topping_ids: list[int]):
+        super().__init__(f"Unknown topping IDs: {topping_ids}")
+        self.topping_ids = topping_ids
 
 
+class ToppingInUseError(Exception):
+    """
+    Raised when deleting a topping which drinks still list, without removing it from them.
+    """
+
+    def __init__(self, topping_id: int, drink_ids: list[int]):
+        super().__init__(f"Topping {topping_id} is used by the drinks {drink_ids}")
+        self.topping_id = topping_id
+        self.drink_ids = drink_ids
+
+
+def _check_toppings_exist(topping_ids: list[int]) -> None:
+    # Called with the catalog lock held.
+    found = TOPPINGS.get_many(topping_ids)
+    missing = sorted({topping_id for topping_id in topping_ids if topping_id not in found})
+    if missing:
+        raise UnknownToppingsError(missing)
+
+
+@timed("drinks.create_drink")
 def create_drink(drink: DrinkCreate) -> Drink:
     """
     Create a new drink with the provided details.
@@ -17,17 +73,27 @@ def create_drink(drink: DrinkCreate) -> Drink:
     Returns:
 
         Drink: The newly created drink.
+
+    Raises:
+
+        UnknownToppingsError: If the drink lists toppings which do not exist.
     """
-    # Generate a new ID for the drink.
-    drink_id = len(DRINKS) + 1
-    # Creating a "Drink" object here.
-    new_drink = Drink(id=drink_id, name=drink.name, price=drink.price, toppings=drink.toppings)
-    # Adding the created "Drink" to the in-memory storage.
-    DRINKS.append(new_drink)
+    with CATALOG_LOCK:
+        _check_toppings_exist(drink.toppings)
+        # Generate a new ID for the drink.
+        drink_id = DRINKS.allocate_id()
+        # Creating a "Drink" object here.
+        new_drink = Drink(id=drink_id, name=drink.name, price=drink.price, toppings=drink.toppings)
+        # Adding the created "Drink" to the storage, and to the indexes.
+        DRINKS.add(new_drink)
+        DRINKS_BY_TOPPING.set(drink_id, new_drink.toppings)
+        DRINK_SEARCH_INDEX.add(drink_id, new_drink.name, new_drink.price_cents)
+        DRINKS_SNAPSHOT.publish()
 
     return new_drink
 
 
+@timed("drinks.update_drink")
 def update_drink(drink_id: int, drink: DrinkUpdate) -> Drink | None:
     """
     Update an existing drink's details.
@@ -40,22 +106,38 @@ def update_drink(drink_id: int, drink: DrinkUpdate) -> Drink | None:
     Returns:
 
         Drink | None: The updated drink if found, otherwise None.
+
+    Raises:
+
+        UnknownToppingsError: If the new toppings of the drink include toppings which do not exist.
     """
-    # Find the drink with the given ID and update its details.
-    for existing_drink in DRINKS:
-        # If the drinks ID matches the one provided.
-        if existing_drink.id == drink_id:
+    with CATALOG_LOCK:
+        # Find the drink with the given ID.
+        existing_drink = DRINKS.get(drink_id)
+        if existing_drink is None:
+            return None
+        _check_toppings_exist(drink.toppings)
+
+        # The existing drink may be part of a published snapshot, so it is replaced by a new "Drink" instead of changed.
+        updated_drink = Drink(
+            id=drink_id,
             # If provided, update the drinks name, or keep the original drink name.
-            existing_drink.name = drink.name or existing_drink.name
+            name=drink.name or existing_drink.name,
             # If provided, update the drinks price, or keep the original drink price.
-            existing_drink.price = drink.price or existing_drink.price
+            price=drink.price or existing_drink.price,
             # If provided, update the toppings of the drink, or keep the original drink toppings.
-            existing_drink.toppings = drink.toppings or existing_drink.toppings
-            return existing_drink
+            toppings=drink.toppings or existing_drink.toppings,
+        )
+        # Write the updated drink to the storage, and to the indexes.
+        DRINKS.add(updated_drink)
+        DRINKS_BY_TOPPING.set(drink_id, updated_drink.toppings)
+        DRINK_SEARCH_INDEX.add(drink_id, updated_drink.name, updated_drink.price_cents)
+        DRINKS_SNAPSHOT.publish()
 
-    return None
+    return updated_drink
 
 
+@timed("drinks.get_drink")
 def get_drink(drink_id: int) -> Drink | None:
     """
     Get a drink by its ID.
@@ -68,11 +150,39 @@ def get_drink(drink_id: int) -> Drink | None:
 
         Drink | None: The drink if found, otherwise None.
     """
-    # Searching for the drinks id - find and return the drink with the given ID.
-    return next((d for d in DRINKS if d.id == drink_id), None)
+    # Look up the drink by its ID.
+    return DRINKS.get(drink_id)
+
+
+@timed("drinks.get_drinks_by_ids")
+def get_drinks_by_ids(drink_ids: Iterable[int]) -> dict[int, Drink]:
+    """
+    Get several drinks by their IDs in one lookup.
+
+    Args:
+
+        drink_ids (Iterable[int]): The IDs of the drinks to retrieve.
+
+    Returns:
+
+        dict[int, Drink]: The drinks found, keyed by their ID. IDs which do not exist are left out.
+    """
+    return DRINKS.get_many(drink_ids)
+
+
+def get_drinks_snapshot() -> Snapshot[Drink]:
+    """
+    Get the current snapshot of all drinks, which is never changed once published.
 
+    Returns:
 
-def get_drinks(skip: int = 0, limit: int = 10) -> list[Drink]:
+        Snapshot[Drink]: The current snapshot of the drinks.
+    """
+    return DRINKS_SNAPSHOT.current
+
+
+@timed("drinks.get_drinks")
+def get_drinks(skip: int = 0, limit: int = 10, after_id: int | None = None) -> list[Drink]:
     """
     Get a list of drinks, with pagination.
 
@@ -80,15 +190,18 @@ def get_drinks(skip: int = 0, limit: int = 10) -> list[Drink]:
 
         skip (int): The number of drinks to skip. Default is 0.
         limit (int): The maximum number of drinks to return. Default is 10.
+        after_id (int | None): If provided, return the drinks following this ID instead of skipping drinks.
+            Default is None.
 
     Returns:
 
         list[Drink]: A list of drinks.
     """
-    # Return a slice of the list of drinks based on skip and limit.
-    return DRINKS[skip:skip + limit]
+    # Return a page of the current snapshot. Reading it never blocks on a writer.
+    return DRINKS_SNAPSHOT.current.select(skip=skip, limit=limit, after_id=after_id)
 
 
+@timed("drinks.delete_drink")
 def delete_drink(drink_id: int) -> Drink | None:
     """
     Delete a drink by its ID.
@@ -101,20 +214,179 @@ def delete_drink(drink_id: int) -> Drink | None:
 
         Drink | None: The deleted drink if found, otherwise None.
     """
-    # Find the drink with the given ID.
-    drink = get_drink(drink_id)
-    # If found, remove the drink from the list.
-    if drink:
-        DRINKS.remove(drink)
+    with CATALOG_LOCK:
+        # Remove the drink with the given ID, if it exists.
+        deleted_drink = DRINKS.delete(drink_id)
+        if deleted_drink:
+            DRINKS_BY_TOPPING.remove(drink_id)
+            DRINK_SEARCH_INDEX.remove(drink_id)
+            DRINKS_SNAPSHOT.publish()
+
+    return deleted_drink
+
+
+@timed("drinks.get_drinks_using_topping")
+def get_drinks_using_topping(topping_id: int) -> list[Drink]:
+    """
+    Get the drinks which list a topping, using the topping index rather than going through every drink.
+
+    Args:
+
+        topping_id (int): The ID of the topping.
+
+    Returns:
+
+        list[Drink]: The drinks listing the topping, in ID order.
+    """
+    drink_ids = DRINKS_BY_TOPPING.referrers(topping_id)
+    drinks = DRINKS.get_many(drink_ids)
+
+    return [drinks[drink_id] for drink_id in drink_ids if drink_id in drinks]
+
+
+@timed("drinks.search_drinks")
+def search_drinks(query: str = "",
+                  min_price_cents: int | None = None,
+                  max_price_cents: int | None = None,
+                  limit: int = 10) -> list[Drink]:
+    """
+    Search the drinks by the words of their name and by price, using the search index.
+
+    Args:
+
+        query (str): The words to search for, the last of which may be the start of a word. Default is "", which
+            matches every drink.
+        min_price_cents (int | None): The lowest price, in cents, if any. Default is None.
+        max_price_cents (int | None): The highest price, in cents, if any. Default is None.
+        limit (int): The maximum number of drinks to return. Default is 10.
+
+    Returns:
+
+        list[Drink]: The matching drinks, in the order of the matching word, or by price without a query.
+    """
+    drink_ids = DRINK_SEARCH_INDEX.search(query, min_price_cents=min_price_cents, max_price_cents=max_price_cents,
+                                          limit=limit)
+    drinks = DRINKS.get_many(drink_ids)
+
+    return [drinks[drink_id] for drink_id in drink_ids if drink_id in drinks]
+
+
+@timed("drinks.delete_topping_from_catalog")
+def delete_topping_from_catalog(topping_id: int, cascade: bool = False) -> Topping | None:
+    """
+    Delete a topping, keeping the drinks consistent: the topping is either removed from the drinks listing it, or
+    not deleted while drinks list it. Only the drinks listing the topping are looked at.
+
+    Args:
+
+        topping_id (int): The ID of the topping to delete.
+        cascade (bool): If True, the topping is removed from the drinks listing it. If False, a topping listed by
+            drinks is not deleted. Default is False.
+
+    Returns:
+
+        Topping | None: The deleted topping if found, otherwise None.
+
+    Raises:
+
+        ToppingInUseError: If drinks list the topping, and cascade is False.
+    """
+    with CATALOG_LOCK:
+        if topping_id not in TOPPINGS:
+            return None
+        drink_ids = DRINKS_BY_TOPPING.referrers(topping_id)
+        if drink_ids and not cascade:
+            raise ToppingInUseError(topping_id, drink_ids)
+
+        for drink in DRINKS.get_many(drink_ids).values():
+            toppings = [drink_topping_id for drink_topping_id in drink.toppings if drink_topping_id != topping_id]
+            DRINKS.add(Drink(id=drink.id, name=drink.name, price=drink.price, toppings=toppings))
+            DRINKS_BY_TOPPING.set(drink.id, toppings)
+        if drink_ids:
+            DRINKS_SNAPSHOT.publish()
+
+        return delete_topping(topping_id)
+
+
+@timed("drinks.import_drinks")
+def import_drinks(rows: list[DrinkImport]) -> list[Drink]:
+    """
+    Create and replace many drinks at once, e.g. to load a new seasonal menu.
+
+    Every row is checked before any is applied: the toppings of all rows are looked up in one call, and so are the
+    drinks the rows replace. The drinks are then written in one write and published as one snapshot, so readers see
+    the catalog either before or after the import, never in between.
+
+    Args:
+
+        rows (list[DrinkImport]): The drinks to create, or to replace for rows with an ID.
+
+    Returns:
+
+        list[Drink]: The created and replaced drinks, in the order of the rows.
+
+    Raises:
+
+        CatalogImportError: If rows list toppings which do not exist, or replace drinks which do not exist or which
+            another row replaces too. Nothing is changed then.
+    """
+    if not rows:
+        return []
+
+    with CATALOG_LOCK:
+        errors = check_replaced_ids(rows, DRINKS, "Drink")
+        found = TOPPINGS.get_many({topping_id for row in rows for topping_id in row.toppings})
+        for index, row in enumerate(rows):
+            missing = sorted({topping_id for topping_id in row.toppings if topping_id not in found})
+            if missing and index not in errors:
+                errors[index] = UnknownToppingsError(missing)
+        if errors:
+            raise CatalogImportError(errors)
+
+        drinks = [Drink(id=DRINKS.allocate_id() if row.id is None else row.id, name=row.name, price=row.price,
+                        toppings=row.toppings)
+                  for row in rows]
+        # Write every drink at once, then update the indexes, and swap in the new snapshot once.
+        DRINKS.add_many(drinks)
+        for new_drink in drinks:
+            DRINKS_BY_TOPPING.set(new_drink.id, new_drink.toppings)
+        DRINK_SEARCH_INDEX.add_many((new_drink.id, new_drink.name, new_drink.price_cents) for new_drink in drinks)
+        DRINKS_SNAPSHOT.publish()
+
+    return drinks
+
+
+def rebuild_drink_indexes(snapshot: Snapshot[Drink] | None = None) -> None:
+    """
+    Rebuild the indexes of the drinks from a snapshot of the drinks. Used on startup, and with every snapshot refreshed
+    after other worker processes changed the drinks in shared storage.
+
+    Args:
+
+        snapshot (Snapshot[Drink] | None): The snapshot to rebuild the indexes from. Default is None, which uses the
+            current snapshot.
+    """
+    snapshot = snapshot or DRINKS_SNAPSHOT.current
+    DRINKS_BY_TOPPING.rebuild((drink.id, drink.toppings) for drink in snapshot.items)
+    DRINK_SEARCH_INDEX.rebuild((drink.id, drink.name, drink.price_cents) for drink in snapshot.items)
+
 
-    return drink
+# Drinks in shared storage can be changed by other worker processes, which this worker only sees in refreshed
+# snapshots. Its own changes keep updating the indexes one drink at a time.
+if settings.storage_backend != "memory":
+    DRINKS_SNAPSHOT.subscribe(rebuild_drink_indexes, refreshes_only=True)
 
 
 def initialize_default_drinks_on_startup():
     """
-    Initialize the default drinks on startup.
+    Initialize the default drinks on startup. Drinks which already exist are left untouched.
     """
-    DRINKS.append(Drink(id=1, name="Black Coffee", price=4, toppings=[]))
-    DRINKS.append(Drink(id=2, name="Latte", price=5, toppings=[]))
-    DRINKS.append(Drink(id=3, name="Mocha", price=6, toppings=[]))
-    DRINKS.append(Drink(id=4, name="Tea", price=3, toppings=[]))
+    for default_drink in (
+        Drink(id=1, name="Black Coffee", price=4, toppings=[]),
+        Drink(id=2, name="Latte", price=5, toppings=[]),
+        Drink(id=3, name="Mocha", price=6, toppings=[]),
+        Drink(id=4, name="Tea", price=3, toppings=[]),
+    ):
+        if default_drink.id not in DRINKS:
+            DRINKS.add(default_drink)
+    DRINKS_SNAPSHOT.publish()
@@ -1,14 +1,41 @@
+import heapq
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Container
+from typing import Iterator
+
+from app.api.analytics import OrderRollups
+from app.api.analytics import backfill_rollups
+from app.api.metrics import timed
+from app.api.storage.backends import create_repository
+from app.api.storage.base import Repository
+from app.api.storage.columnar import ColumnarOrderRepository
+from app.api.storage.columnar import OrderColumns
+from app.api.storage.journal import OrderJournal
+from app.api.storage.tables import ORDER_TABLE
+from app.models.money import Cents
 from app.models.orders import Order
 
-# In-memory storage for orders
-ORDERS: list[Order] = []
-# Initialize the next order ID.
-NEXT_ORDER_ID = 1
+# Storage for orders, indexed by order ID, using the configured storage backend. In memory, the order history is
+# kept in compact columns rather than as Order objects, as it is by far the largest data set.
+ORDERS: Repository[Order] = create_repository(ORDER_TABLE, memory_factory=ColumnarOrderRepository)
+# The journal making in-memory orders durable, if enabled. Opened on startup by "open_order_journal".
+ORDER_JOURNAL: OrderJournal | None = None
+# How many times each topping has been ordered, keyed by topping ID. Kept up to date by "create_order", so reading
+# the most used toppings never has to go through the order history.
+TOPPING_USAGE: Counter[int] = Counter()
+# Orders are created from FastAPI's threadpool, so the usage counters are guarded by a lock.
+TOPPING_USAGE_LOCK = threading.Lock()
+# Revenue, discounts, drink and topping counts and drink and topping pairings of the order history. Kept up to date by
+# "create_order", so the analytics endpoints never go through the order history either.
+ORDER_ROLLUPS = OrderRollups()
 
 
+@timed("orders.create_order")
 def create_order(
-        drink_ids: list[list[int]], topping_ids: list[list[int]], total_amount: float,
-        discounted_amount: float) -> Order:
+        drink_ids: list[list[int]], topping_ids: list[list[int]], total_cents: Cents,
+        discounted_cents: Cents) -> Order:
     """
     Create a new order with the provided details.
 
@@ -16,27 +43,41 @@ def create_order(
 
         drink_ids (list[list[int]]): The IDs of the drinks in the order.
         topping_ids (list[list[int]]): The IDs of the toppings in the order.
-        total_amount (float): The total amount of the order.
-        discounted_amount (float): The discounted amount of the order.
+        total_cents (Cents): The total amount of the order, in cents.
+        discounted_cents (Cents): The discounted amount of the order, in cents.
 
     Returns:
 
         Order: The newly created order.
+
+    Raises:
+
+        JournalError: If the order journal is enabled, and the order could not be written to it. The order is not
+            created.
     """
-    # Python keyword - this will enable the variable, which exists outside this function, to be
-    # modified from inside this function.
-    global NEXT_ORDER_ID
-    # Create an Order object.
-    new_order = Order(id=NEXT_ORDER_ID, drink_ids=drink_ids, topping_ids=topping_ids, total_amount=total_amount,
-                      discounted_amount=discounted_amount)
-    # Add the Order to the in-memory storage.
-    ORDERS.append(new_order)
-    NEXT_ORDER_ID += 1
+    def new_order_with_id(order_id: int) -> Order:
+        return Order(id=order_id, drink_ids=drink_ids, topping_ids=topping_ids, total_cents=total_cents,
+                     discounted_cents=discounted_cents)
+
+    # Create an Order object with the next free order ID, and add it to the storage. Both happen in one step, so
+    # orders placed at the same time are still added in ID order. With the order journal, the order is made durable
+    # before it is added, so readers never see an order which is not kept.
+    if ORDER_JOURNAL is not None:
+        new_order = ORDER_JOURNAL.append_new(new_order_with_id)
+    else:
+        new_order = ORDERS.add_new(new_order_with_id)
+    # Count the toppings of the order towards the topping usage.
+    with TOPPING_USAGE_LOCK:
+        for topping_list in topping_ids:
+            TOPPING_USAGE.update(topping_list)
+    # Count the order towards the analytics rollups.
+    ORDER_ROLLUPS.add(new_order)
 
     return new_order
 
 
-def get_orders(skip: int = 0, limit: int = 10) -> list[Order]:
+@timed("orders.get_orders")
+def get_orders(skip: int = 0, limit: int = 10, after_id: int | None = None) -> list[Order]:
     """
     Get a list of orders, with pagination.
 
@@ -44,10 +85,213 @@ def get_orders(skip: int = 0, limit: int = 10) -> list[Order]:
 
         skip (int): The number of orders to skip. Default is 0.
         limit (int): The maximum number of orders to return. Default is 10.
+        after_id (int | None): If provided, return the orders following this ID instead of skipping orders.
+            Default is None.
 
     Returns:
 
         list[Order]: A list of orders.
     """
-    # Return a slice of the list of orders based on skip and limit.
-    return ORDERS[skip:skip + limit]
+    # A page following an ID is found through the ID index, without going through the skipped orders.
+    if after_id is not None:
+        return ORDERS.page_after(after_id=after_id, limit=limit)
+
+    # Return a page of the orders based on skip and limit.
+    return ORDERS.page(skip=skip, limit=limit)
+
+
+def iter_orders(min_id: int | None = None,
+                max_id: int | None = None,
+                since: datetime | None = None,
+                until: datetime | None = None,
+                batch_size: int = 1000) -> Iterator[Order]:
+    """
+    Iterate over the orders in ID order, optionally within an ID or time range. Orders are read from the storage one
+    batch at a time, so iterating over the whole history does not hold it in memory.
+
+    Args:
+
+        min_id (int | None): If provided, only orders with at least this ID are returned. Default is None.
+        max_id (int | None): If provided, only orders with at most this ID are returned. Default is None.
+        since (datetime | None): If provided, only orders placed at or after this time are returned. Default is None.
+        until (datetime | None): If provided, only orders placed before this time are returned. Default is None.
+        batch_size (int): How many orders are read from the storage at once. Default is 1000.
+
+    Returns:
+
+        Iterator[Order]: The orders.
+    """
+    after_id = (min_id or 1) - 1
+    while True:
+        batch = ORDERS.page_after(after_id=after_id, limit=batch_size)
+        for order in batch:
+            if max_id is not None and order.id > max_id:
+                return
+            if (since is None or order.created_at >= since) and (until is None or order.created_at < until):
+                yield order
+        if len(batch) < batch_size:
+            return
+        after_id = batch[-1].id
+
+
+@timed("orders.load_topping_usage")
+def load_topping_usage() -> None:
+    """
+    Count the topping usage of every stored order. Used on startup, when orders are kept in persistent storage.
+    """
+    usage = Counter()
+    for order in ORDERS:
+        for topping_list in order.topping_ids:
+            usage.update(topping_list)
+
+    with TOPPING_USAGE_LOCK:
+        TOPPING_USAGE.clear()
+        TOPPING_USAGE.update(usage)
+
+
+def open_order_journal(directory: str, commit_window: float = 0.002, snapshot_every: int = 100_000) -> int:
+    """
+    Replay the order journal in a directory into the order storage, and journal every order created from then on.
+    Only in-memory orders are journaled, as the "sqlite" backend is durable by itself.
+
+    Args:
+
+        directory (str): The directory of the journal, created if it does not exist.
+        commit_window (float): How long, in seconds, an order waits for other orders to share its fsync.
+            Default is 0.002.
+        snapshot_every (int): After how many orders a snapshot is written. Default is 100000.
+
+    Returns:
+
+        int: The number of orders replayed.
+    """
+    global ORDER_JOURNAL
+    if not isinstance(ORDERS, ColumnarOrderRepository):
+        raise ValueError("Only orders kept in memory can be journaled")
+
+    journal = OrderJournal(directory, ORDERS, commit_window=commit_window, snapshot_every=snapshot_every)
+    replayed = journal.replay()
+    ORDER_JOURNAL = journal
+
+    return replayed
+
+
+def close_order_journal() -> None:
+    """
+    Make every journaled order durable, and stop journaling orders.
+    """
+    global ORDER_JOURNAL
+    if ORDER_JOURNAL is not None:
+        ORDER_JOURNAL.close()
+        ORDER_JOURNAL = None
+
+
+def load_order_columns(columns: OrderColumns) -> int:
+    """
+    Load the orders of a snapshot file into the order storage. In memory, an empty order storage uses the columns in
+    place, so a memory-mapped snapshot is not copied. Otherwise, the orders which do not exist yet are added one by one.
+
+    Args:
+
+        columns (OrderColumns): The order columns of the snapshot.
+
+    Returns:
+
+        int: The number of orders loaded.
+    """
+    if isinstance(ORDERS, ColumnarOrderRepository) and not len(ORDERS):
+        ORDERS.load_base(columns)
+        return len(columns.ids)
+
+    loaded = 0
+    for row in range(len(columns.ids)):
+        if columns.ids[row] not in ORDERS:
+            ORDERS.add(columns.materialize(row))
+            loaded += 1
+
+    return loaded
+
+
+def get_order_columns() -> OrderColumns:
+    """
+    Get every stored order as columns, e.g. to write them to a snapshot file.
+
+    Returns:
+
+        OrderColumns: A copy of the orders, in ID order.
+    """
+    if isinstance(ORDERS, ColumnarOrderRepository):
+        return ORDERS.copy_columns()
+
+    columns = OrderColumns()
+    # Orders are iterated in ID order, so they are appended in the order the columns keep.
+    for order in ORDERS:
+        columns.append(order)
+
+    return columns
+
+
+@timed("orders.load_order_rollups")
+def load_order_rollups() -> None:
+    """
+    Rebuild the analytics rollups from every stored order. Used on startup, when orders are kept in persistent
+    storage, and to backfill the rollups, e.g. after they changed, or to count the orders other worker processes
+    placed. Orders placed while the rollups are rebuilt are still counted.
+    """
+    ORDER_ROLLUPS.rebuild(lambda: backfill_rollups(ORDERS))
+
+
+@timed("orders.get_order_totals")
+def get_order_totals() -> tuple[int, Cents, Cents]:
+    """
+    Get the number of orders, and the sum of their total and discounted amounts.
+
+    Returns:
+
+        tuple[int, Cents, Cents]: The number of orders, the sum of their total amounts and the sum of their
+            discounted amounts, in cents.
+    """
+    # The in-memory order columns are summed directly, without materializing any order.
+    if isinstance(ORDERS, ColumnarOrderRepository):
+        total_cents, discounted_cents = ORDERS.amount_totals()
+        return len(ORDERS), total_cents, discounted_cents
+
+    count = total_cents = discounted_cents = 0
+    for order in ORDERS:
+        count += 1
+        total_cents += order.total_cents
+        discounted_cents += order.discounted_cents
+
+    return count, Cents(total_cents), Cents(discounted_cents)
+
+
+@timed("orders.get_most_used_topping_ids")
+def get_most_used_topping_ids(k: int | None = None,
+                              only: Repository | Container[int] | None = None) -> list[int]:
+    """
+    Get the IDs of the most used toppings, most used first. Toppings used equally often are ordered by ID.
+
+    Args:
+
+        k (int | None): The maximum number of topping IDs to return. Default is None, which returns all of them.
+        only (Repository | Container[int] | None): If provided, only topping IDs in this repository or container are
+            returned, e.g. to leave out deleted toppings. Default is None.
+
+    Returns:
+
+        list[int]: The topping IDs, ordered by usage.
+    """
+    # The counts are copied under the lock, so placing orders never waits for the filtering below.
+    with TOPPING_USAGE_LOCK:
+        counts = list(TOPPING_USAGE.items())
+    if only is not None:
+        # A repository is asked about every used topping in one call, instead of once per topping.
+        if isinstance(only, Repository):
+            only = only.get_many(topping_id for topping_id, _ in counts)
+        counts = [(topping_id, count) for topping_id, count in counts if topping_id in only]
+    usage = [(count, -topping_id) for topping_id, count in counts]
+
+    # A heap only has to keep the top "k" entries, instead of sorting every topping.
+    ranked = sorted(usage, reverse=True) if k is None else heapq.nlargest(k, usage)
+
+    return [-negated_id for _, negated_id in ranked]
@@ -1,9 +1,29 @@
-from app.models.toppings import Topping
-
-# Create an in-memory storage for the drinks.
-TOPPINGS: list[Topping] = []
-
+from typing import Iterable
 
+from app.models.toppings import Topping
+from app.api.crud_operations.catalog_lock import CATALOG_LOCK
+from app.api.imports import CatalogImportError
+from app.api.imports import check_replaced_ids
+from app.api.schemas.toppings import ToppingImport
+from app.api.metrics import timed
+from app.api.storage.backends import create_repository
+from app.api.storage.base import Repository
+from app.api.storage.indexes import SearchIndex
+from app.api.storage.snapshots import Snapshot
+from app.api.storage.snapshots import SnapshotPublisher
+from app.api.storage.tables import TOPPING_TABLE
+from app.config import settings
+
+# Create the storage for the toppings, indexed by topping ID, using the configured storage backend.
+TOPPINGS: Repository[Topping] = create_repository(TOPPING_TABLE)
+# An immutable snapshot of all toppings, which is what the catalog endpoints read from. Every function changing the
+# toppings publishes a new snapshot.
+TOPPINGS_SNAPSHOT: SnapshotPublisher[Topping] = SnapshotPublisher(TOPPINGS)
+# The names and prices of the toppings, indexed for searching. Kept up to date by every function changing the toppings.
+TOPPING_SEARCH_INDEX = SearchIndex()
+
+
+@timed("toppings.create_topping")
 def create_topping(name: str, price: float) -> Topping:
     """
     Create a new topping with the provided details.
@@ -17,16 +37,20 @@ def create_topping(name: str, price: float) -> Topping:
 
         Topping: The newly created topping.
     """
-    # Generate a new ID for the topping.
-    topping_id = len(TOPPINGS) + 1
-    # Create a new topping object.
-    new_topping = Topping(id=topping_id, name=name, price=price)
-    # Add the new topping to the in-memory storage.
-    TOPPINGS.append(new_topping)
+    with CATALOG_LOCK:
+        # Generate a new ID for the topping.
+        topping_id = TOPPINGS.allocate_id()
+        # Create a new topping object.
+        new_topping = Topping(id=topping_id, name=name, price=price)
+        # Add the new topping to the storage, and to the search index.
+        TOPPINGS.add(new_topping)
+        TOPPING_SEARCH_INDEX.add(topping_id, new_topping.name, new_topping.price_cents)
+        TOPPINGS_SNAPSHOT.publish()
 
     return new_topping
 
 
+@timed("toppings.get_topping")
 def get_topping(topping_id: int) -> Topping | None:
     """
     Get a topping by its ID.
@@ -39,11 +63,39 @@ def get_topping(topping_id: int) -> Topping | None:
 
         Topping | None: The topping if found, otherwise None.
     """
-    # Searching for the toppings id - find and return the topping with the given ID.
-    return next((t for t in TOPPINGS if t.id == topping_id), None)
+    # Look up the topping by its ID.
+    return TOPPINGS.get(topping_id)
+
+
+@timed("toppings.get_toppings_by_ids")
+def get_toppings_by_ids(topping_ids: Iterable[int]) -> dict[int, Topping]:
+    """
+    Get several toppings by their IDs in one lookup.
+
+    Args:
+
+        topping_ids (Iterable[int]): The IDs of the toppings to retrieve.
+
+    Returns:
+
+        dict[int, Topping]: The toppings found, keyed by their ID. IDs which do not exist are left out.
+    """
+    return TOPPINGS.get_many(topping_ids)
 
 
-def get_toppings(skip: int = 0, limit: int = 10) -> list[Topping]:
+def get_toppings_snapshot() -> Snapshot[Topping]:
+    """
+    Get the current snapshot of all toppings, which is never changed once published.
+
+    Returns:
+
+        Snapshot[Topping]: The current snapshot of the toppings.
+    """
+    return TOPPINGS_SNAPSHOT.current
+
+
+@timed("toppings.get_toppings")
+def get_toppings(skip: int = 0, limit: int = 10, after_id: int | None = None) -> list[Topping]:
     """
     Get a list of toppings, with pagination.
 
@@ -51,15 +103,45 @@ def get_toppings(skip: int = 0, limit: int = 10) -> list[Topping]:
 
         skip (int): The number of toppings to skip. Default is 0.
         limit (int): The maximum number of toppings to return. Default is 10.
+        after_id (int | None): If provided, return the toppings following this ID instead of skipping toppings.
+            Default is None.
 
     Returns:
 
         list[Topping]: A list of toppings.
     """
-    # Return a slice of the list of toppings based on skip and limit.
-    return TOPPINGS[skip:skip + limit]
+    # Return a page of the current snapshot. Reading it never blocks on a writer.
+    return TOPPINGS_SNAPSHOT.current.select(skip=skip, limit=limit, after_id=after_id)
+
+
+@timed("toppings.search_toppings")
+def search_toppings(query: str = "",
+                    min_price_cents: int | None = None,
+                    max_price_cents: int | None = None,
+                    limit: int = 10) -> list[Topping]:
+    """
+    Search the toppings by the words of their name and by price, using the search index.
+
+    Args:
+
+        query (str): The words to search for, the last of which may be the start of a word. Default is "", which
+            matches every topping.
+        min_price_cents (int | None): The lowest price, in cents, if any. Default is None.
+        max_price_cents (int | None): The highest price, in cents, if any. Default is None.
+        limit (int): The maximum number of toppings to return. Default is 10.
+
+    Returns:
+
+        list[Topping]: The matching toppings, in the order of the matching word, or by price without a query.
+    """
+    topping_ids = TOPPING_SEARCH_INDEX.search(query, min_price_cents=min_price_cents,
+                                              max_price_cents=max_price_cents, limit=limit)
+    toppings = TOPPINGS.get_many(topping_ids)
 
+    return [toppings[topping_id] for topping_id in topping_ids if topping_id in toppings]
 
+
+@timed("toppings.delete_topping")
 def delete_topping(topping_id: int) -> Topping | None:
     """
     Delete a topping by its ID.
@@ -72,14 +154,17 @@ def delete_topping(topping_id: int) -> Topping | None:
 
         Topping | None: The deleted topping if found, otherwise None.
     """
-    # Find the topping with the given ID.
-    topping = next((t for t in TOPPINGS if t.id == topping_id), None)
-    # If found, remove the topping from the in-memory storage.
-    if topping:
-        TOPPINGS.remove(topping)
-    return topping
+    # Remove the topping with the given ID from the storage, if it exists.
+    with CATALOG_LOCK:
+        deleted_topping = TOPPINGS.delete(topping_id)
+        if deleted_topping:
+            TOPPING_SEARCH_INDEX.remove(topping_id)
+            TOPPINGS_SNAPSHOT.publish()
+
+    return deleted_topping
 
 
+@timed("toppings.update_topping")
 def update_topping(topping_id: int, name: str = None, price: float = None) -> Topping | None:
     """
     Update an existing topping's details.
@@ -94,25 +179,97 @@ def update_topping(topping_id: int, name: str = None, price: float = None) -> To
 
         Topping | None: The updated topping if found, otherwise None.
     """
-    # Find the topping with the given ID and update its details.
-    for existing_topping in TOPPINGS:
-        # If the topping ID is a match.
-        if existing_topping.id == topping_id:
-            if name is not None:
-                # Update the toppings name.
-                existing_topping.name = name
-            if price is not None:
-                # Update the toppings price.
-                existing_topping.price = price
-            return existing_topping
-    return None
+    # The topping is looked up and written under the catalog lock, so it cannot be deleted in between, and written
+    # back by the update.
+    with CATALOG_LOCK:
+        # Find the topping with the given ID.
+        existing_topping = TOPPINGS.get(topping_id)
+        if existing_topping is None:
+            return None
+
+        # The existing topping may be part of a published snapshot, so it is replaced by a new "Topping" instead of
+        # changed.
+        updated_topping = Topping(
+            id=topping_id,
+            # If provided, update the toppings name.
+            name=name if name is not None else existing_topping.name,
+            # If provided, update the toppings price.
+            price=price if price is not None else existing_topping.price,
+        )
+        # Write the updated topping to the storage, and to the search index.
+        TOPPINGS.add(updated_topping)
+        TOPPING_SEARCH_INDEX.add(topping_id, updated_topping.name, updated_topping.price_cents)
+        TOPPINGS_SNAPSHOT.publish()
+
+    return updated_topping
+
+
+@timed("toppings.import_toppings")
+def import_toppings(rows: list[ToppingImport]) -> list[Topping]:
+    """
+    Create and replace many toppings at once, the same way as "import_drinks" of the drink operations. It takes the
+    catalog lock, so a topping cannot be deleted while the import replaces it.
+
+    Args:
+
+        rows (list[ToppingImport]): The toppings to create, or to replace for rows with an ID.
+
+    Returns:
+
+        list[Topping]: The created and replaced toppings, in the order of the rows.
+
+    Raises:
+
+        CatalogImportError: If rows replace toppings which do not exist, or which another row replaces too. Nothing
+            is changed then.
+    """
+    if not rows:
+        return []
+
+    with CATALOG_LOCK:
+        errors = check_replaced_ids(rows, TOPPINGS, "Topping")
+        if errors:
+            raise CatalogImportError(errors)
+
+        toppings = [Topping(id=TOPPINGS.allocate_id() if row.id is None else row.id, name=row.name, price=row.price)
+                    for row in rows]
+        TOPPINGS.add_many(toppings)
+        TOPPING_SEARCH_INDEX.add_many((topping.id, topping.name, topping.price_cents) for topping in toppings)
+        TOPPINGS_SNAPSHOT.publish()
+
+    return toppings
+
+
+def rebuild_topping_indexes(snapshot: Snapshot[Topping] | None = None) -> None:
+    """
+    Rebuild the search index of the toppings from a snapshot of the toppings. Used on startup, and with every
+    snapshot refreshed after other worker processes changed the toppings in shared storage.
+
+    Args:
+
+        snapshot (Snapshot[Topping] | None): The snapshot to rebuild the index from. Default is None, which uses the
+            current snapshot.
+    """
+    snapshot = snapshot or TOPPINGS_SNAPSHOT.current
+    TOPPING_SEARCH_INDEX.rebuild((topping.id, topping.name, topping.price_cents) for topping in snapshot.items)
+
+
+# Toppings in shared storage can be changed by other worker processes, which this worker only sees in refreshed
+# snapshots. Its own changes keep updating the index one topping at a time.
+if settings.storage_backend != "memory":
+    TOPPINGS_SNAPSHOT.subscribe(rebuild_topping_indexes, refreshes_only=True)
 
 
 def initialize_default_toppings_on_startup():
     """
-    Initialize the default toppings on startup.
+    Initialize the default toppings on startup. Toppings which already exist are left untouched.
     """
-    TOPPINGS.append(Topping(id=1, name="Milk", price=2))
-    TOPPINGS.append(Topping(id=2, name="Hazelnut syrup", price=3))
-    TOPPINGS.append(Topping(id=3, name="Chocolate sauce", price=5))
-    TOPPINGS.append(Topping(id=4, name="Lemon", price=2))
+    for default_topping in (
+        Topping(id=1, name="Milk", price=2),
+        Topping(id=2, name="Hazelnut syrup", price=3),
+        Topping(id=3, name="Chocolate sauce", price=5),
+        Topping(id=4, name="Lemon", price=2),
+    ):
+        if default_topping.id not in TOPPINGS:
+            TOPPINGS.add(default_topping)
+    TOPPINGS_SNAPSHOT.publish()
@@ -0,0 +1,66 @@
+import csv
+import io
+import json
+from itertools import islice
+from typing import Iterable
+from typing import Iterator
+
+from app.api.schemas.orders import Order
+from app.models.orders import Order as OrderModel
+
+# How many orders are serialized into one chunk of the response.
+EXPORT_CHUNK_SIZE = 500
+# The columns of a CSV export. Lists of IDs are written as JSON.
+ORDER_CSV_COLUMNS = ["id", "created_at", "total_amount", "discounted_amount", "drink_ids", "topping_ids"]
+
+
+def _chunks(orders: Iterable[OrderModel]) -> Iterator[list[OrderModel]]:
+    orders = iter(orders)
+    while chunk := list(islice(orders, EXPORT_CHUNK_SIZE)):
+        yield chunk
+
+
+def export_orders_ndjson(orders: Iterable[OrderModel]) -> Iterator[bytes]:
+    """
+    Serialize orders as newline-delimited JSON, one order per line, the same way the order endpoints do.
+
+    Args:
+
+        orders (Iterable[Order]): The orders to serialize.
+
+    Returns:
+
+        Iterator[bytes]: The serialized orders, a chunk of lines at a time.
+    """
+    for chunk in _chunks(orders):
+        yield b"".join(
+            Order.model_validate(order, from_attributes=True).model_dump_json().encode() + b"\n" for order in chunk
+        )
+
+
+def export_orders_csv(orders: Iterable[OrderModel]) -> Iterator[bytes]:
+    """
+    Serialize orders as CSV, starting with a header row.
+
+    Args:
+
+        orders (Iterable[Order]): The orders to serialize.
+
+    Returns:
+
+        Iterator[bytes]: The serialized orders, a chunk of rows at a time.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(ORDER_CSV_COLUMNS)
+    yield buffer.getvalue().encode()
+
+    for chunk in _chunks(orders):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(
+            (order.id, order.created_at.isoformat(), order.total_amount, order.discounted_amount,
+             json.dumps(order.drink_ids), json.dumps(order.topping_ids))
+            for order in chunk
+        )
+        yield buffer.getvalue().encode()
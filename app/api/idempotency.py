@@ -0,0 +1,200 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from collections import deque
+from typing import Callable
+
+from app.api.metrics import Counter
+
+# A rough count of the bytes an entry takes besides its key and body: the entry object, its dict slot and its place
+# in the expiry queue. Used to keep the cache within its memory budget.
+ENTRY_OVERHEAD_BYTES = 400
+
+IDEMPOTENT_REQUESTS = Counter("idempotent_requests_total",
+                              "Requests with an Idempotency-Key, by whether they were processed, replayed from the "
+                              "cache, or waited for the same request in flight.", ("outcome",))
+
+
+class IdempotencyKeyReusedError(Exception):
+    """
+    Raised when an idempotency key is sent again with a different request.
+    """
+
+
+class IdempotentResult:
+    """
+    The response to a request with an idempotency key, ready to be sent again.
+    """
+    __slots__ = ("fingerprint", "status_code", "body", "expires_at", "size")
+
+    def __init__(self, fingerprint: str, status_code: int, body: bytes, expires_at: float, size: int):
+        self.fingerprint = fingerprint
+        self.status_code = status_code
+        self.body = body
+        self.expires_at = expires_at
+        self.size = size
+
+
+class _InFlight:
+    """
+    A request being processed, which requests with the same key wait for.
+    """
+    __slots__ = ("fingerprint", "done", "result")
+
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+        self.done = threading.Event()
+        self.result: IdempotentResult | None = None
+
+
+def fingerprint(body: bytes) -> str:
+    """
+    Hash a request body, to tell whether a key is sent again with the same request.
+    """
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+class IdempotencyCache:
+    """
+    The responses of requests with an idempotency key, so a retried request gets the response of the first attempt
+    instead of being processed again.
+
+    The cache is bounded by the bytes its entries take, dropping the least recently used first, and entries expire a
+    fixed time after they were stored. A request arriving while another with the same key is processed waits for its
+    response, instead of being processed as well. Server errors, i.e. 5xx responses, are not kept, so a retry after
+    one is processed again.
+
+    Example:
+        >>> cache = IdempotencyCache(max_bytes=1_000_000, ttl=3600)
+        >>> cache.run("key", fingerprint(b"{}"), lambda: (200, b'{"id": 1}'))
+        (200, b'{"id": 1}', False)
+        >>> cache.run("key", fingerprint(b"{}"), lambda: (200, b'{"id": 2}'))
+        (200, b'{"id": 1}', True)
+    """
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024, ttl: float = 24 * 60 * 60,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: OrderedDict[str, IdempotentResult] = OrderedDict()
+        # The keys in the order they were stored, which is the order they expire in.
+        self._expiry: deque[tuple[float, str]] = deque()
+        self._in_flight: dict[str, _InFlight] = {}
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size(self) -> int:
+        """
+        The estimated number of bytes the entries take.
+        """
+        return self._size
+
+    def run(self,
+            key: str,
+            request_fingerprint: str,
+            process: Callable[[], tuple[int, bytes]]) -> tuple[int, bytes, bool]:
+        """
+        Get the response to a request with an idempotency key: the stored response if the key was seen, the response
+        of the request in flight with the same key, or else the response of processing the request now.
+
+        Args:
+
+            key (str): The idempotency key.
+            request_fingerprint (str): The fingerprint of the request, see "fingerprint".
+            process (Callable[[], tuple[int, bytes]]): Processes the request, returning the status code and body.
+
+        Returns:
+
+            tuple[int, bytes, bool]: The status code and body of the response, and whether it is a replay of an
+                earlier response.
+
+        Raises:
+
+            IdempotencyKeyReusedError: If the key was sent with a different request.
+        """
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._expire(now)
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._check_fingerprint(entry.fingerprint, request_fingerprint)
+                    self._entries.move_to_end(key)
+                    IDEMPOTENT_REQUESTS.inc(labels=("replayed",))
+                    return entry.status_code, entry.body, True
+
+                in_flight = self._in_flight.get(key)
+                if in_flight is None:
+                    in_flight = self._in_flight[key] = _InFlight(request_fingerprint)
+                    break
+                self._check_fingerprint(in_flight.fingerprint, request_fingerprint)
+
+            # Another request with the same key is being processed; its response is this request's response.
+            in_flight.done.wait()
+            if in_flight.result is not None:
+                IDEMPOTENT_REQUESTS.inc(labels=("coalesced",))
+                return in_flight.result.status_code, in_flight.result.body, True
+            # Processing it failed with an exception, so this request is processed instead.
+
+        try:
+            status_code, body = process()
+        except BaseException:
+            with self._lock:
+                del self._in_flight[key]
+            in_flight.done.set()
+            raise
+
+        size = len(key) + len(body) + ENTRY_OVERHEAD_BYTES
+        result = IdempotentResult(request_fingerprint, status_code, body, self._clock() + self.ttl, size)
+        with self._lock:
+            del self._in_flight[key]
+            if status_code < 500 and size <= self.max_bytes:
+                self._store(key, result)
+        in_flight.result = result
+        in_flight.done.set()
+        IDEMPOTENT_REQUESTS.inc(labels=("processed",))
+
+        return status_code, body, False
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._expiry.clear()
+            self._size = 0
+
+    @staticmethod
+    def _check_fingerprint(stored: str, received: str) -> None:
+        if stored != received:
+            raise IdempotencyKeyReusedError("The Idempotency-Key was already used with a different request")
+
+    def _store(self, key: str, result: IdempotentResult) -> None:
+        # Called with the lock held.
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._size -= previous.size
+        self._entries[key] = result
+        self._expiry.append((result.expires_at, key))
+        self._size += result.size
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= evicted.size
+        # Evicted entries stay in the expiry queue until they would have expired, so it is compacted once it is
+        # mostly stale, which keeps it within twice the number of entries.
+        if len(self._expiry) > 2 * len(self._entries) + 16:
+            self._expiry = deque(sorted((entry.expires_at, entry_key) for entry_key, entry in self._entries.items()))
+
+    def _expire(self, now: float) -> None:
+        # Called with the lock held. The expiry queue may still name entries which were evicted or stored again
+        # since, which are recognized by their expiry time.
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, key = self._expiry.popleft()
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at == expires_at:
+                del self._entries[key]
+                self._size -= entry.size
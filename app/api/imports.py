@@ -0,0 +1,142 @@
+import csv
+import io
+import json
+import re
+from typing import TypeVar
+
+from pydantic import BaseModel
+from pydantic import ValidationError
+
+from app.api.storage.base import Repository
+
+# A CSV import has the columns "id", "name", "price" and, for drinks, "toppings", which lists topping IDs separated by
+# spaces or semicolons.
+TOPPING_ID_SEPARATOR = re.compile(r"[;\s]+")
+
+RowModel = TypeVar("RowModel", bound=BaseModel)
+
+
+class CatalogImportError(Exception):
+    """
+    Raised when rows of a catalog import cannot be applied, in which case nothing of the import is applied.
+
+    Attributes:
+
+        errors (dict[int, Exception]): Why each rejected row cannot be applied, keyed by its position in the import.
+    """
+
+    def __init__(self, errors: dict[int, Exception]):
+        super().__init__(f"{len(errors)} rows of the import cannot be applied")
+        self.errors = errors
+
+
+def _csv_rows(text: str) -> list[dict]:
+    rows = []
+    for row in csv.DictReader(io.StringIO(text)):
+        # Empty cells are left out, so they take the default of their field, e.g. an empty ID creates a new item.
+        values = {column: value.strip() for column, value in row.items()
+                  if column is not None and value is not None and value.strip()}
+        if "toppings" in values:
+            values["toppings"] = [topping_id for topping_id in TOPPING_ID_SEPARATOR.split(values["toppings"])
+                                  if topping_id]
+        rows.append(values)
+
+    return rows
+
+
+def parse_catalog_rows(body: bytes, content_type: str | None) -> list:
+    """
+    Parse the rows of a catalog import: CSV with a header row if the content type is "text/csv", or else a JSON
+    array of objects.
+
+    Args:
+
+        body (bytes): The request body.
+        content_type (str | None): The Content-Type header of the request, if any.
+
+    Returns:
+
+        list: The rows, each as a dict of its fields, not yet validated.
+
+    Raises:
+
+        ValueError: If the body is not CSV, or not a JSON array.
+    """
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    try:
+        # "utf-8-sig" drops the byte order mark spreadsheets tend to start their CSV files with.
+        text = body.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise ValueError("The import must be encoded as UTF-8")
+    if media_type in ("text/csv", "application/csv"):
+        try:
+            return _csv_rows(text)
+        except csv.Error as error:
+            raise ValueError(f"The import is not valid CSV: {error}")
+
+    try:
+        rows = json.loads(text)
+    except json.JSONDecodeError as error:
+        raise ValueError(f"The import is not valid JSON: {error}")
+    if not isinstance(rows, list):
+        raise ValueError("The import must be a JSON array of objects, or CSV with the content type text/csv")
+
+    return rows
+
+
+def validate_catalog_rows(rows: list, model: type[RowModel]) -> tuple[list[RowModel | None], dict[int, Exception]]:
+    """
+    Validate every row of a catalog import on its own, so one invalid row does not hide the errors of the others.
+
+    Args:
+
+        rows (list): The rows, as returned by "parse_catalog_rows".
+        model (type[RowModel]): The schema of a row.
+
+    Returns:
+
+        tuple[list[RowModel | None], dict[int, Exception]]: The validated rows, with None for invalid rows, and why
+            each invalid row is invalid, keyed by its position.
+    """
+    validated = []
+    errors = {}
+    for index, row in enumerate(rows):
+        try:
+            validated.append(model.model_validate(row))
+        except ValidationError as error:
+            validated.append(None)
+            errors[index] = ValueError("; ".join(
+                f"{'.'.join(str(part) for part in detail['loc']) or 'row'}: {detail['msg']}"
+                for detail in error.errors()))
+
+    return validated, errors
+
+
+def check_replaced_ids(rows: list, repository: Repository, item_type: str) -> dict[int, Exception]:
+    """
+    Check that the rows of an import which have an ID replace items which exist, each at most once. The items are
+    looked up in one call.
+
+    Args:
+
+        rows (list): The validated rows, each with an "id" which is None for new items.
+        repository (Repository): The repository of the items.
+        item_type (str): The name of the kind of item, for the errors, e.g. "Drink".
+
+    Returns:
+
+        dict[int, Exception]: Why each rejected row cannot be applied, keyed by its position.
+    """
+    existing = repository.get_many({row.id for row in rows if row.id is not None})
+    errors = {}
+    seen = set()
+    for index, row in enumerate(rows):
+        if row.id is None:
+            continue
+        if row.id not in existing:
+            errors[index] = LookupError(f"{item_type} with id {row.id} not found")
+        elif row.id in seen:
+            errors[index] = ValueError(f"{item_type} with id {row.id} is replaced by more than one row")
+        seen.add(row.id)
+
+    return errors
@@ -0,0 +1,223 @@
+import threading
+import time
+from abc import ABC
+from abc import abstractmethod
+from bisect import bisect_left
+from contextlib import ContextDecorator
+from typing import Iterator
+
+# Upper bounds, in seconds, of the latency histogram buckets.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metric(ABC):
+    """
+    The base of all metrics. Values are kept in one shard per thread, so recording a value never takes a lock or
+    contends with another thread; the shards are only combined when the metrics are collected.
+    """
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                 registry: list["Metric"] | None = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._local = threading.local()
+        self._shards: list[dict] = []
+        # Only taken once per thread, when the thread records its first value.
+        self._shards_lock = threading.Lock()
+        (REGISTRY if registry is None else registry).append(self)
+
+    def _shard(self) -> dict:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = {}
+            with self._shards_lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+            return shard
+
+    def _shard_items(self) -> Iterator[tuple[tuple[str, ...], object]]:
+        with self._shards_lock:
+            shards = list(self._shards)
+        for shard in shards:
+            # Copying the items is atomic, so a thread adding a label set meanwhile does not break the iteration.
+            yield from list(shard.items())
+
+    @abstractmethod
+    def samples(self) -> Iterator[tuple[str, dict[str, str], float]]:
+        """
+        Get the current samples of the metric, as (name, labels, value).
+        """
+
+
+class Counter(Metric):
+    """
+    A value which only goes up, e.g. the number of requests.
+    """
+    type_name = "counter"
+
+    def inc(self, labels: tuple[str, ...] = (), amount: float = 1) -> None:
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def samples(self) -> Iterator[tuple[str, dict[str, str], float]]:
+        totals: dict[tuple[str, ...], float] = {}
+        for labels, value in self._shard_items():
+            totals[labels] = totals.get(labels, 0) + value
+        for labels, value in totals.items():
+            yield self.name, dict(zip(self.labelnames, labels)), value
+
+
+class Gauge(Counter):
+    """
+    A value which goes up and down, e.g. the number of requests in flight.
+    """
+    type_name = "gauge"
+
+    def dec(self, labels: tuple[str, ...] = (), amount: float = 1) -> None:
+        self.inc(labels, -amount)
+
+
+class Histogram(Metric):
+    """
+    Counts observed values, e.g. latencies, into buckets, and keeps their sum and count.
+    """
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS, registry: list[Metric] | None = None):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = buckets
+
+    def observe(self, value: float, labels: tuple[str, ...] = ()) -> None:
+        shard = self._shard()
+        entry = shard.get(labels)
+        if entry is None:
+            # One count per bucket plus one for values above the last bucket, then the sum.
+            entry = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        entry[bisect_left(self.buckets, value)] += 1
+        entry[-1] += value
+
+    def samples(self) -> Iterator[tuple[str, dict[str, str], float]]:
+        totals: dict[tuple[str, ...], list] = {}
+        for labels, entry in self._shard_items():
+            total = totals.setdefault(labels, [0] * len(entry))
+            for index, value in enumerate(entry):
+                total[index] += value
+        for labels, total in totals.items():
+            label_values = dict(zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), total[:-1]):
+                cumulative += count
+                yield f"{self.name}_bucket", {**label_values, "le": _format_value(bound)}, cumulative
+            yield f"{self.name}_sum", label_values, total[-1]
+            yield f"{self.name}_count", label_values, cumulative
+
+
+# Every metric registers itself here when it is created.
+REGISTRY: list[Metric] = []
+
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests handled.", ("method", "route", "status"))
+HTTP_REQUEST_DURATION = Histogram("http_request_duration_seconds", "Time taken to handle HTTP requests.",
+                                  ("method", "route"))
+HTTP_REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests currently being handled.")
+OPERATION_DURATION = Histogram("operation_duration_seconds", "Time taken by storage and pricing operations.",
+                               ("operation",))
+
+
+class timed(ContextDecorator):
+    """
+    Records how long an operation takes into the operation latency histogram. Used as a decorator or a context
+    manager.
+
+    Example:
+
+        @timed("drinks.get_drink")
+        def get_drink(drink_id): ...
+
+        with timed("pricing.price_order"):
+            price = price_order(order)
+    """
+
+    def __init__(self, operation: str):
+        self._labels = (operation,)
+        self._local = threading.local()
+
+    def __enter__(self):
+        # The same instance is shared by every call of a decorated function, so the start time is kept per thread.
+        starts = self._local.__dict__.setdefault("starts", [])
+        starts.append(time.perf_counter())
+        return self
+
+    def __exit__(self, *exc_info):
+        OPERATION_DURATION.observe(time.perf_counter() - self._local.starts.pop(), self._labels)
+        return False
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording the latency, status and number in flight of every HTTP request, per route.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            # The router puts the matched route into the scope. Its path template keeps the number of label values
+            # bounded, e.g. "/admin/drinks/{drink_id}" instead of one per drink.
+            route = scope.get("route")
+            route_path = getattr(route, "path_format", None) or getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            HTTP_REQUEST_DURATION.observe(elapsed, (method, route_path))
+            HTTP_REQUESTS.inc((method, route_path, str(status_code)))
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if value == int(value):
+        return str(int(value)) if abs(value) < 1e15 else repr(float(value))
+    return repr(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render_prometheus(registry: list[Metric] | None = None) -> str:
+    """
+    Render every registered metric in the Prometheus text exposition format.
+    """
+    lines = []
+    for metric in REGISTRY if registry is None else registry:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type_name}")
+        for name, labels, value in metric.samples():
+            if labels:
+                label_text = ",".join(f'{key}="{_escape(str(label))}"' for key, label in labels.items())
+                lines.append(f"{name}{{{label_text}}} {_format_value(value)}")
+            else:
+                lines.append(f"{name} {_format_value(value)}")
+
+    return "\n".join(lines) + "\n"
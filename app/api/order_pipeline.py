@@ -0,0 +1,354 @@
+import asyncio
+import logging
+import math
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.api.crud_operations.order_operations import create_order
+from app.api.metrics import Counter
+from app.api.metrics import Gauge
+from app.api.metrics import Histogram
+from app.api.pricing.engine import InvalidOrderError
+from app.api.pricing.engine import ItemNotFoundError
+from app.api.pricing.engine import PriceBreakdown
+from app.api.pricing.engine import price_orders
+from app.api.pricing.engine import validate_order
+from app.api.schemas.orders import OrderCreate
+from app.api.storage.journal import JournalError
+from app.config import settings
+from app.models.orders import Order
+
+logger = logging.getLogger(__name__)
+
+# The stages an order goes through, in order. "queued" is the time an order waits before it is priced.
+STAGES = ("queued", "pricing", "persistence", "fanout")
+# How many waiting orders a pricing worker takes at once. Their drinks and toppings are looked up together.
+PRICING_BATCH_SIZE = 64
+# How many finished orders are kept for status polling. The oldest are dropped first.
+STATUS_RETENTION = 10_000
+# How much the latest latency of a stage counts towards its recent latency, which estimates the Retry-After header.
+RECENT_WEIGHT = 0.1
+# The bounds of the Retry-After header, in seconds.
+MIN_RETRY_AFTER = 1
+MAX_RETRY_AFTER = 60
+
+PIPELINE_STAGE_DURATION = Histogram("order_pipeline_stage_duration_seconds",
+                                    "Time an order spends in each stage of the order pipeline.", ("stage",))
+PIPELINE_ORDERS = Counter("order_pipeline_orders_total",
+                          "Orders submitted to the order pipeline, by whether they were placed, rejected, or turned "
+                          "away because the pipeline was full or stopped.", ("outcome",))
+PIPELINE_PENDING = Gauge("order_pipeline_pending", "Orders in the order pipeline which are not finished yet.")
+
+
+class OrderPipelineError(Exception):
+    """
+    Raised when the order pipeline cannot take an order right now.
+
+    Attributes:
+
+        retry_after (int): How many seconds the client should wait before trying again.
+    """
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class OrderPipelineFullError(OrderPipelineError):
+    """
+    Raised when as many orders as the pipeline holds are already waiting or being processed.
+    """
+
+
+class OrderPipelineStoppedError(OrderPipelineError):
+    """
+    Raised when the pipeline is not running, e.g. while the application starts or shuts down.
+    """
+
+
+class OrderTicket:
+    """
+    An order submitted to the pipeline, which the client polls until it is placed or rejected.
+
+    Attributes:
+
+        ticket_id (str): The random ID the client polls the order with.
+        status (str): "queued", "pricing", "persisting", "placed" or "rejected".
+        order (Order | None): The created order, once placed.
+        status_code (int | None): Once finished, 200 if placed, or else the status the order would have had if it
+            was placed directly, e.g. 404 or 422.
+        detail (str | None): Why the order was rejected, if it was.
+    """
+    __slots__ = ("ticket_id", "request", "status", "price", "order", "status_code", "detail", "submitted_at",
+                 "done")
+
+    def __init__(self, ticket_id: str, request: OrderCreate):
+        self.ticket_id = ticket_id
+        self.request = request
+        self.status = "queued"
+        self.price: PriceBreakdown | None = None
+        self.order: Order | None = None
+        self.status_code: int | None = None
+        self.detail: str | None = None
+        self.submitted_at = time.perf_counter()
+        self.done = asyncio.Event()
+
+
+class StageLatency:
+    """
+    The number of orders through a stage, and their total and recent latency. The recent latency is an exponentially
+    weighted moving average, so it follows changes in load.
+    """
+    __slots__ = ("count", "total_seconds", "recent_seconds")
+
+    def __init__(self):
+        self.count = 0
+        self.total_seconds = 0.0
+        self.recent_seconds = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.total_seconds += seconds
+        if self.count == 1:
+            self.recent_seconds = seconds
+        else:
+            self.recent_seconds += RECENT_WEIGHT * (seconds - self.recent_seconds)
+
+    @property
+    def mean_seconds(self) -> float:
+        return self.total_seconds / self.count if self.count else 0.0
+
+
+class OrderPipeline:
+    """
+    Places orders in the background, so the request which submits an order only checks it and queues it.
+
+    An order goes through a pipeline of stages, each run by its own asyncio tasks, with a queue in between:
+
+    - Pricing workers take waiting orders in batches, and price each batch with one lookup of its drinks and toppings.
+    - Persistence workers create the orders. Several run at once, so their orders share the fsyncs of the order
+      journal.
+    - A fan-out worker passes every placed order to the subscribers, e.g. a barista display or receipts. A failing
+      subscriber does not fail the order, which is already placed.
+
+    The blocking work of a stage runs in the threadpool, so the event loop keeps serving requests. The pipeline holds
+    at most "capacity" unfinished orders. Beyond that, orders are turned away with an estimate of when to retry,
+    instead of piling up.
+
+    Orders are tracked by the worker process which took them, so their status can only be polled from it.
+
+    Example:
+        >>> pipeline = OrderPipeline(capacity=100, workers=2)
+        >>> pipeline.start()
+        >>> ticket = pipeline.submit(OrderCreate(drink_ids=[[1]], topping_ids=[[]]))
+        >>> await ticket.done.wait()
+        >>> ticket.status
+        'placed'
+    """
+
+    def __init__(self, capacity: int = 1000, workers: int = 4):
+        self.capacity = capacity
+        self.workers = workers
+        self.latencies = {stage: StageLatency() for stage in STAGES}
+        self._subscribers: list[Callable[[Order], None]] = []
+        self._in_flight: dict[str, OrderTicket] = {}
+        self._finished: OrderedDict[str, OrderTicket] = OrderedDict()
+        self._running = False
+        # The queues and tasks belong to the event loop the pipeline is started on, so they are created by "start".
+        self._pricing_queue: asyncio.Queue[OrderTicket] | None = None
+        self._persistence_queue: asyncio.Queue[OrderTicket] | None = None
+        self._fanout_queue: asyncio.Queue[Order] | None = None
+        self._tasks: list[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    @property
+    def pending(self) -> int:
+        """
+        The number of orders which are waiting or being processed.
+        """
+        return len(self._in_flight)
+
+    def subscribe(self, callback: Callable[[Order], None]) -> None:
+        """
+        Call the given function with every placed order, in the threadpool, e.g. to send a receipt.
+        """
+        self._subscribers.append(callback)
+
+    def start(self) -> None:
+        """
+        Start the stage workers on the running event loop.
+        """
+        self._pricing_queue = asyncio.Queue()
+        self._persistence_queue = asyncio.Queue()
+        self._fanout_queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._price(), name=f"order-pricing-{index}")
+                       for index in range(self.workers)]
+        self._tasks += [asyncio.create_task(self._persist(), name=f"order-persistence-{index}")
+                        for index in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._fan_out(), name="order-fanout"))
+        self._running = True
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """
+        Stop taking orders, let the orders already taken finish for up to "timeout" seconds, then stop the workers.
+        """
+        if not self._running:
+            return
+        self._running = False
+        try:
+            await asyncio.wait_for(self._drain(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Stopping the order pipeline with %s orders unfinished.", self.pending)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _drain(self) -> None:
+        await self._pricing_queue.join()
+        await self._persistence_queue.join()
+        await self._fanout_queue.join()
+
+    def submit(self, request: OrderCreate) -> OrderTicket:
+        """
+        Check an order and queue it for pricing and placing. Only the shape of the order is checked here; whether its
+        drinks and toppings exist is checked when it is priced.
+
+        Args:
+
+            request (OrderCreate): The order to place.
+
+        Returns:
+
+            OrderTicket: The ticket to poll the order with.
+
+        Raises:
+
+            InvalidOrderError: If the order is not well-formed.
+            OrderPipelineFullError: If the pipeline holds as many orders as it can.
+            OrderPipelineStoppedError: If the pipeline is not running.
+        """
+        validate_order(request)
+        if not self._running:
+            PIPELINE_ORDERS.inc(labels=("stopped",))
+            raise OrderPipelineStoppedError("The order pipeline is not running", self.retry_after())
+        if self.pending >= self.capacity:
+            PIPELINE_ORDERS.inc(labels=("full",))
+            raise OrderPipelineFullError("The order pipeline is full", self.retry_after())
+
+        ticket = OrderTicket(uuid.uuid4().hex, request)
+        self._in_flight[ticket.ticket_id] = ticket
+        PIPELINE_PENDING.inc()
+        self._pricing_queue.put_nowait(ticket)
+
+        return ticket
+
+    def get(self, ticket_id: str) -> OrderTicket | None:
+        """
+        Get a ticket by its ID, or None if it does not exist or is no longer kept.
+        """
+        return self._in_flight.get(ticket_id) or self._finished.get(ticket_id)
+
+    def retry_after(self) -> int:
+        """
+        Estimate how many seconds it takes to work through the orders in the pipeline, from the recent latency of
+        pricing and persisting an order.
+        """
+        seconds_per_order = self.latencies["pricing"].recent_seconds + self.latencies["persistence"].recent_seconds
+        estimate = math.ceil(self.pending * seconds_per_order / self.workers)
+
+        return max(MIN_RETRY_AFTER, min(MAX_RETRY_AFTER, estimate))
+
+    def _observe(self, stage: str, seconds: float) -> None:
+        self.latencies[stage].observe(seconds)
+        PIPELINE_STAGE_DURATION.observe(seconds, (stage,))
+
+    def _finish(self, ticket: OrderTicket, status_code: int, detail: str | None = None) -> None:
+        ticket.status = "placed" if status_code == 200 else "rejected"
+        ticket.status_code = status_code
+        ticket.detail = detail
+        del self._in_flight[ticket.ticket_id]
+        self._finished[ticket.ticket_id] = ticket
+        while len(self._finished) > STATUS_RETENTION:
+            self._finished.popitem(last=False)
+        PIPELINE_PENDING.dec()
+        PIPELINE_ORDERS.inc(labels=(ticket.status,))
+        ticket.done.set()
+
+    async def _price(self) -> None:
+        while True:
+            batch = [await self._pricing_queue.get()]
+            while len(batch) < PRICING_BATCH_SIZE and not self._pricing_queue.empty():
+                batch.append(self._pricing_queue.get_nowait())
+            start = time.perf_counter()
+            for ticket in batch:
+                self._observe("queued", start - ticket.submitted_at)
+                ticket.status = "pricing"
+            try:
+                prices = await run_in_threadpool(price_orders, [ticket.request for ticket in batch])
+            except Exception:
+                logger.exception("Pricing a batch of %s orders failed.", len(batch))
+                prices = [None] * len(batch)
+            elapsed = time.perf_counter() - start
+
+            for ticket, price in zip(batch, prices):
+                self._observe("pricing", elapsed)
+                if isinstance(price, InvalidOrderError):
+                    self._finish(ticket, 422, str(price))
+                elif isinstance(price, ItemNotFoundError):
+                    self._finish(ticket, 404, str(price))
+                elif price is None:
+                    self._finish(ticket, 500, "The order could not be priced.")
+                else:
+                    ticket.price = price
+                    ticket.status = "persisting"
+                    self._persistence_queue.put_nowait(ticket)
+                self._pricing_queue.task_done()
+
+    async def _persist(self) -> None:
+        while True:
+            ticket = await self._persistence_queue.get()
+            start = time.perf_counter()
+            try:
+                ticket.order = await run_in_threadpool(
+                    create_order,
+                    drink_ids=ticket.request.drink_ids,
+                    topping_ids=ticket.request.topping_ids,
+                    total_cents=ticket.price.total_cents,
+                    discounted_cents=ticket.price.discounted_cents,
+                )
+            except JournalError as error:
+                self._finish(ticket, 503, str(error))
+            except Exception:
+                logger.exception("Persisting order ticket %s failed.", ticket.ticket_id)
+                self._finish(ticket, 500, "The order could not be placed.")
+            else:
+                self._observe("persistence", time.perf_counter() - start)
+                self._finish(ticket, 200)
+                if self._subscribers:
+                    self._fanout_queue.put_nowait(ticket.order)
+            finally:
+                self._persistence_queue.task_done()
+
+    async def _fan_out(self) -> None:
+        while True:
+            order = await self._fanout_queue.get()
+            start = time.perf_counter()
+            for callback in self._subscribers:
+                try:
+                    await run_in_threadpool(callback, order)
+                except Exception:
+                    logger.exception("Passing order %s to a subscriber failed.", order.id)
+            self._observe("fanout", time.perf_counter() - start)
+            self._fanout_queue.task_done()
+
+
+# The pipeline of the orders placed with "/customer/order-drinks/async". Started and stopped with the application.
+ORDER_PIPELINE = OrderPipeline(capacity=settings.order_pipeline_capacity, workers=settings.order_pipeline_workers)
@@ -0,0 +1,50 @@
+import base64
+import binascii
+from typing import Any
+from typing import Sequence
+
+from fastapi import HTTPException
+from fastapi import status
+
+# The most items the list endpoints return at once, so one request cannot read a whole table. The catalog pages are
+# also rendered on the event loop when they are not cached yet.
+MAX_PAGE_SIZE = 1000
+# The response header holding the cursor of the next page, if there may be one.
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+_CURSOR_PREFIX = "id:"
+
+
+def encode_cursor(last_id: int) -> str:
+    """
+    Encode the ID of the last item of a page into an opaque cursor, which is passed back as "after" for the next page.
+    """
+    return base64.urlsafe_b64encode(f"{_CURSOR_PREFIX}{last_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str | None) -> int | None:
+    """
+    Decode a cursor made by "encode_cursor" back into the ID of the last item of the previous page.
+
+    Raises:
+
+        HTTPException: If the cursor is not one made by "encode_cursor".
+    """
+    if cursor is None:
+        return None
+    try:
+        decoded = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        if not decoded.startswith(_CURSOR_PREFIX):
+            raise ValueError(cursor)
+        return int(decoded.removeprefix(_CURSOR_PREFIX))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Invalid cursor.")
+
+
+def next_cursor_headers(page: Sequence[Any], limit: int) -> dict[str, str]:
+    """
+    Get the headers pointing to the next page. A page shorter than the limit is the last one, so it has none.
+    """
+    if not page or len(page) < limit:
+        return {}
+
+    return {NEXT_CURSOR_HEADER: encode_cursor(page[-1].id)}
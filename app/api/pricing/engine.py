@@ -0,0 +1,271 @@
+import threading
+from datetime import datetime
+from datetime import timezone
+from typing import Iterable
+
+from app.api.crud_operations.drink_operations import get_drinks_by_ids
+from app.api.crud_operations.topping_operations import get_toppings_by_ids
+from app.api.pricing.rules import DiscountEngine
+from app.api.pricing.rules import DiscountPlan
+from app.api.pricing.rules import load_discount_rules
+from app.api.schemas.orders import OrderCreate
+from app.config import settings
+from app.models.money import Cents
+from app.models.money import from_cents
+
+# The discount rules orders are priced with, loaded from the rules file on first use. Percentage discounts are rounded
+# half up to whole cents, so half a cent goes to the customer, e.g. 25% off 1.02 is 0.26 off.
+_discount_engine: DiscountEngine | None = None
+_discount_engine_lock = threading.Lock()
+
+
+def get_discount_engine() -> DiscountEngine:
+    """
+    Get the discount engine of this worker process, loading the discount rules on first use.
+    """
+    global _discount_engine
+    if _discount_engine is None:
+        with _discount_engine_lock:
+            if _discount_engine is None:
+                _discount_engine = DiscountEngine(load_discount_rules(settings.discount_rules_file))
+
+    return _discount_engine
+
+
+class InvalidOrderError(ValueError):
+    """
+    Raised when an order is not well-formed, e.g. it has a line without drinks.
+    """
+
+
+class ItemNotFoundError(LookupError):
+    """
+    Raised when an order references a drink or topping which does not exist.
+    """
+
+    def __init__(self, item_type: str, item_id: int):
+        self.item_type = item_type
+        self.item_id = item_id
+        super().__init__(f"{item_type} with id {item_id} not found")
+
+
+class PriceBreakdown:
+    """
+    The result of pricing an order. All amounts are in cents.
+
+    Attributes:
+
+        line_totals (list[Cents]): The price of each line, i.e. the drinks of a line plus their toppings.
+        total_cents (Cents): The total amount before any discounts are applied.
+        discounts (dict[str, Cents]): The discount offered by every discount rule which applies, keyed by rule name.
+        applied_rules (list[str]): The names of the rules whose discounts were taken.
+        discounted_cents (Cents): The amount to pay, with the discounts of the applied rules taken off.
+    """
+    line_totals: list[Cents]
+    total_cents: Cents
+    discounts: dict[str, Cents]
+    applied_rules: list[str]
+    discounted_cents: Cents
+
+    def __init__(self,
+                 line_totals: list[Cents],
+                 total_cents: Cents,
+                 discounts: dict[str, Cents],
+                 applied_rules: list[str],
+                 discount_cents: Cents):
+        self.line_totals = line_totals
+        self.total_cents = total_cents
+        self.discounts = discounts
+        self.applied_rules = applied_rules
+        self.discounted_cents = Cents(total_cents - discount_cents)
+
+    @property
+    def total_amount(self) -> float:
+        return from_cents(self.total_cents)
+
+    @property
+    def discounted_amount(self) -> float:
+        return from_cents(self.discounted_cents)
+
+
+def validate_order(order: OrderCreate) -> None:
+    """
+    Check that an order has at least one line, and that every line has at least one drink.
+
+    Raises:
+
+        InvalidOrderError: If the order is not well-formed.
+    """
+    if not order.drink_ids or any(not drink_list for drink_list in order.drink_ids):
+        raise InvalidOrderError("Drink IDs cannot be empty.")
+
+
+def lookup_prices(orders: Iterable[OrderCreate]) -> tuple[dict[int, Cents], dict[int, Cents]]:
+    """
+    Look up the price of every drink and topping referenced by the given orders, with one lookup per item type.
+
+    Args:
+
+        orders (Iterable[OrderCreate]): The orders whose drinks and toppings to look up.
+
+    Returns:
+
+        tuple[dict[int, Cents], dict[int, Cents]]: The drink prices and the topping prices in cents, keyed by ID.
+            IDs which do not exist are left out.
+    """
+    orders = list(orders)
+    # A set deduplicates the IDs, so an item referenced by many lines or orders is only looked up once.
+    drink_ids = {drink_id for order in orders for line in order.drink_ids for drink_id in line}
+    topping_ids = {topping_id for order in orders for line in order.topping_ids for topping_id in line}
+
+    return ({drink_id: drink.price_cents for drink_id, drink in get_drinks_by_ids(drink_ids).items()},
+            {topping_id: topping.price_cents for topping_id, topping in get_toppings_by_ids(topping_ids).items()})
+
+
+def check_prices_found(order: OrderCreate, drink_prices: dict[int, Cents], topping_prices: dict[int, Cents]) -> None:
+    """
+    Check that the price of every drink and topping of an order was found.
+
+    Raises:
+
+        ItemNotFoundError: For the first drink, or else topping, of the order which does not exist.
+    """
+    for line in order.drink_ids:
+        for drink_id in line:
+            if drink_id not in drink_prices:
+                raise ItemNotFoundError("Drink", drink_id)
+    for line in order.topping_ids:
+        for topping_id in line:
+            if topping_id not in topping_prices:
+                raise ItemNotFoundError("Topping", topping_id)
+
+
+def calculate_price(drink_ids: list[list[int]],
+                    topping_ids: list[list[int]],
+                    drink_prices: dict[int, Cents],
+                    topping_prices: dict[int, Cents],
+                    plan: DiscountPlan | None = None) -> PriceBreakdown:
+    """
+    Calculate the total and the discounts of an order in a single pass over its lines, in integer cents.
+
+    The toppings in topping_ids[i] belong to the drinks in drink_ids[i]. A line without a topping list has no
+    toppings. Only the item rules of the drinks and toppings in the order are looked at, through the index of the
+    plan, so the number of rules barely matters.
+
+    Args:
+
+        drink_ids (list[list[int]]): The IDs of the drinks, per line.
+        topping_ids (list[list[int]]): The IDs of the toppings, per line.
+        drink_prices (dict[int, Cents]): The price of every referenced drink in cents, keyed by ID.
+        topping_prices (dict[int, Cents]): The price of every referenced topping in cents, keyed by ID.
+        plan (DiscountPlan | None): The discount rules to apply. Default is None, which applies the rules which apply
+            now, to customers without a loyalty tier.
+
+    Returns:
+
+        PriceBreakdown: The price of the order.
+    """
+    if plan is None:
+        plan = get_discount_engine().plan()
+    drink_rules = plan.drink_rules
+    topping_rules = plan.topping_rules
+    item_discounts: dict[str, int] = {}
+    line_totals = []
+    total_cents = 0
+    cheapest_line = None
+    topping_lines = len(topping_ids)
+    drink_price = drink_prices.__getitem__
+    topping_price = topping_prices.__getitem__
+
+    for index, drink_line in enumerate(drink_ids):
+        # Summing mapped integer prices runs in C, without a generator per line.
+        topping_line = topping_ids[index] if index < topping_lines else ()
+        line_total = sum(map(drink_price, drink_line)) + sum(map(topping_price, topping_line))
+        line_totals.append(line_total)
+        total_cents += line_total
+        if cheapest_line is None or line_total < cheapest_line:
+            cheapest_line = line_total
+
+        # Item rules are only looked for when some exist, so the common case stays a plain sum.
+        if drink_rules:
+            for drink_id in drink_line:
+                for rule in drink_rules.get(drink_id, ()):
+                    item_discounts[rule.name] = (item_discounts.get(rule.name, 0)
+                                                 + rule.item_discount(drink_prices[drink_id]))
+        if topping_rules:
+            for topping_id in topping_line:
+                for rule in topping_rules.get(topping_id, ()):
+                    item_discounts[rule.name] = (item_discounts.get(rule.name, 0)
+                                                 + rule.item_discount(topping_prices[topping_id]))
+
+    discounts = plan.order_discounts(total_cents, len(line_totals), cheapest_line, item_discounts)
+    applied_rules, discount_cents = plan.best_discount(discounts, total_cents)
+
+    return PriceBreakdown(
+        line_totals=line_totals,
+        total_cents=total_cents,
+        discounts=discounts,
+        applied_rules=applied_rules,
+        discount_cents=discount_cents,
+    )
+
+
+def price_order(order: OrderCreate, tier: str | None = None) -> PriceBreakdown:
+    """
+    Price an order: resolve every referenced drink and topping, then calculate the total and the discounts.
+
+    Args:
+
+        order (OrderCreate): The order to price.
+        tier (str | None): The loyalty tier of the customer, whose discounts apply. It must be resolved by the server,
+            e.g. from an authenticated account, never taken from the order request. Default is None.
+
+    Returns:
+
+        PriceBreakdown: The price of the order.
+
+    Raises:
+
+        InvalidOrderError: If the order is not well-formed.
+        ItemNotFoundError: If the order references a drink or topping which does not exist.
+    """
+    validate_order(order)
+    drink_prices, topping_prices = lookup_prices([order])
+    check_prices_found(order, drink_prices, topping_prices)
+
+    return calculate_price(order.drink_ids, order.topping_ids, drink_prices, topping_prices,
+                           plan=get_discount_engine().plan(tier=tier))
+
+
+def price_orders(orders: list[OrderCreate],
+                 tier: str | None = None) -> list[PriceBreakdown | InvalidOrderError | ItemNotFoundError]:
+    """
+    Price a batch of orders. The drinks and toppings of all orders are resolved together, in one lookup per item
+    type, and an order which cannot be priced does not stop the others from being priced.
+
+    Args:
+
+        orders (list[OrderCreate]): The orders to price.
+        tier (str | None): The loyalty tier of the customer, resolved by the server, as for "price_order". Default
+            is None.
+
+    Returns:
+
+        list[PriceBreakdown | InvalidOrderError | ItemNotFoundError]: For each order, in the same order, either its
+            price or the error which prevented pricing it.
+    """
+    drink_prices, topping_prices = lookup_prices(orders)
+    # Every order of the batch is priced with the rules which apply when the batch is placed.
+    now = datetime.now(timezone.utc)
+    results = []
+    for order in orders:
+        try:
+            validate_order(order)
+            check_prices_found(order, drink_prices, topping_prices)
+        except (InvalidOrderError, ItemNotFoundError) as error:
+            results.append(error)
+            continue
+        results.append(calculate_price(order.drink_ids, order.topping_ids, drink_prices, topping_prices,
+                                       plan=get_discount_engine().plan(tier=tier, now=now)))
+
+    return results
@@ -0,0 +1,311 @@
+import json
+import threading
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from typing import Iterable
+
+from app.models.money import Cents
+from app.models.money import percentage_of
+
+# The kinds of discount rules. Order rules look at the whole order, item rules at every drink or topping they name.
+ORDER_PERCENTAGE = "order_percentage"
+CHEAPEST_LINE_FREE = "cheapest_line_free"
+ITEM_PERCENTAGE = "item_percentage"
+ITEM_AMOUNT = "item_amount"
+ORDER_RULE_KINDS = (ORDER_PERCENTAGE, CHEAPEST_LINE_FREE)
+ITEM_RULE_KINDS = (ITEM_PERCENTAGE, ITEM_AMOUNT)
+
+# The discounts the store has always given: 25% off orders above 12, or the cheapest line for free in orders with at
+# least 3 lines, whichever is cheaper for the customer.
+DEFAULT_DISCOUNT_RULES = [
+    {"name": "25_percent_above_12", "kind": ORDER_PERCENTAGE, "percent": 25, "above_cents": 1200},
+    {"name": "cheapest_line_free", "kind": CHEAPEST_LINE_FREE, "min_lines": 3},
+]
+
+
+class DiscountRule:
+    """
+    A discount rule, declared as data, e.g.:
+
+        {"name": "latte_happy_hour", "kind": "item_percentage", "percent": 50, "drink_ids": [2], "hours": [15, 17]}
+
+    Attributes:
+
+        name (str): The unique name of the rule.
+        kind (str): What the rule takes off: "order_percentage", a percentage of the order total;
+            "cheapest_line_free", the price of the cheapest line; "item_percentage", a percentage of the price of every
+            drink and topping it names; or "item_amount", an amount of cents off each of them.
+        percent (int): The percentage taken off, for percentage rules.
+        amount_cents (Cents): The cents taken off each item, for "item_amount" rules. Never more than the item price.
+        drink_ids (frozenset[int]): The drinks an item rule applies to.
+        topping_ids (frozenset[int]): The toppings an item rule applies to.
+        above_cents (Cents | None): If set, the rule only applies to orders whose total is above this amount.
+        min_lines (int | None): If set, the rule only applies to orders with at least this many lines.
+        starts_at (datetime | None): If set, the rule only applies from this time on.
+        ends_at (datetime | None): If set, the rule only applies before this time.
+        hours (tuple[int, int] | None): If set, the rule only applies from the first to before the second hour of
+            the day, in UTC, e.g. (15, 17). The window may span midnight, e.g. (22, 2).
+        tiers (frozenset[str] | None): If set, the rule only applies to orders of customers in these loyalty tiers.
+        stackable (bool): Whether the rule adds to the other discounts. Rules which do not stack compete, and the
+            order gets the largest of them.
+    """
+    name: str
+    kind: str
+    percent: int
+    amount_cents: Cents
+    drink_ids: frozenset[int]
+    topping_ids: frozenset[int]
+    above_cents: Cents | None
+    min_lines: int | None
+    starts_at: datetime | None
+    ends_at: datetime | None
+    hours: tuple[int, int] | None
+    tiers: frozenset[str] | None
+    stackable: bool
+
+    def __init__(self,
+                 name: str,
+                 kind: str,
+                 percent: int = 0,
+                 amount_cents: Cents = 0,
+                 drink_ids: Iterable[int] = (),
+                 topping_ids: Iterable[int] = (),
+                 above_cents: Cents | None = None,
+                 min_lines: int | None = None,
+                 starts_at: datetime | None = None,
+                 ends_at: datetime | None = None,
+                 hours: tuple[int, int] | None = None,
+                 tiers: Iterable[str] | None = None,
+                 stackable: bool = False):
+        if kind not in ORDER_RULE_KINDS + ITEM_RULE_KINDS:
+            raise ValueError(f"Discount rule {name!r} has an unknown kind {kind!r}")
+        if not 0 <= percent <= 100:
+            raise ValueError(f"Discount rule {name!r} has a percentage outside 0 to 100")
+        if hours is not None and not all(0 <= hour <= 23 for hour in hours):
+            raise ValueError(f"Discount rule {name!r} has hours outside 0 to 23")
+        if kind in ITEM_RULE_KINDS and not drink_ids and not topping_ids:
+            raise ValueError(f"Discount rule {name!r} applies to items, but names no drinks or toppings")
+        self.name = name
+        self.kind = kind
+        self.percent = percent
+        self.amount_cents = amount_cents
+        self.drink_ids = frozenset(drink_ids)
+        self.topping_ids = frozenset(topping_ids)
+        self.above_cents = above_cents
+        self.min_lines = min_lines
+        self.starts_at = starts_at
+        self.ends_at = ends_at
+        self.hours = tuple(hours) if hours is not None else None
+        self.tiers = frozenset(tiers) if tiers is not None else None
+        self.stackable = stackable
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "DiscountRule":
+        """
+        Create a rule from its declaration, with times given as ISO 8601 strings. Times without a timezone are UTC.
+        """
+        data = dict(data)
+        for key in ("starts_at", "ends_at"):
+            if isinstance(data.get(key), str):
+                moment = datetime.fromisoformat(data[key])
+                data[key] = moment if moment.tzinfo is not None else moment.replace(tzinfo=timezone.utc)
+
+        return cls(**data)
+
+    def is_active(self, now: datetime) -> bool:
+        if self.starts_at is not None and now < self.starts_at:
+            return False
+        if self.ends_at is not None and now >= self.ends_at:
+            return False
+        if self.hours is not None:
+            start, end = self.hours
+            inside = start <= now.hour < end if start <= end else now.hour >= start or now.hour < end
+            if not inside:
+                return False
+        return True
+
+    def next_change(self, now: datetime) -> datetime | None:
+        """
+        Get the next time after now at which the rule may start or stop applying, or None if it never changes.
+        """
+        changes = [moment for moment in (self.starts_at, self.ends_at) if moment is not None and moment > now]
+        if self.hours is not None:
+            today = now.replace(minute=0, second=0, microsecond=0)
+            for hour in self.hours:
+                change = today.replace(hour=hour)
+                changes.append(change if change > now else change + timedelta(days=1))
+        return min(changes, default=None)
+
+    def item_discount(self, price_cents: Cents) -> Cents:
+        """
+        Get the discount of an item rule on one drink or topping.
+        """
+        if self.kind == ITEM_PERCENTAGE:
+            return percentage_of(price_cents, self.percent)
+        return min(self.amount_cents, price_cents)
+
+
+class DiscountPlan:
+    """
+    The rules which apply at a given time to a given loyalty tier, indexed for evaluation.
+
+    Item rules are indexed by the drinks and toppings they name, so pricing an order only looks at the rules of the
+    items it contains, however many rules exist. The plan is valid until valid_until, when a rule may start or stop
+    applying.
+    """
+    order_rules: list[DiscountRule]
+    drink_rules: dict[int, list[DiscountRule]]
+    topping_rules: dict[int, list[DiscountRule]]
+    valid_until: datetime | None
+
+    def __init__(self, rules: Iterable[DiscountRule], valid_until: datetime | None = None):
+        self.order_rules = []
+        self.drink_rules = {}
+        self.topping_rules = {}
+        self.valid_until = valid_until
+        for rule in rules:
+            if rule.kind in ORDER_RULE_KINDS:
+                self.order_rules.append(rule)
+                continue
+            for drink_id in rule.drink_ids:
+                self.drink_rules.setdefault(drink_id, []).append(rule)
+            for topping_id in rule.topping_ids:
+                self.topping_rules.setdefault(topping_id, []).append(rule)
+        self._rules = {rule.name: rule for rule in rules}
+
+    def order_discounts(self,
+                        total_cents: Cents,
+                        line_count: int,
+                        cheapest_line: Cents,
+                        item_discounts: dict[str, Cents]) -> dict[str, Cents]:
+        """
+        Get the discount every applicable rule offers, from what a pass over the lines of an order found.
+
+        Args:
+
+            total_cents (Cents): The total of the order.
+            line_count (int): The number of lines of the order.
+            cheapest_line (Cents): The total of the cheapest line.
+            item_discounts (dict[str, Cents]): The discounts of the item rules, summed over the items, keyed by name.
+
+        Returns:
+
+            dict[str, Cents]: The discount of every rule whose conditions are met, keyed by rule name.
+        """
+        discounts = {}
+        for rule in self.order_rules:
+            if rule.kind == ORDER_PERCENTAGE:
+                discounts[rule.name] = percentage_of(total_cents, rule.percent)
+            else:
+                discounts[rule.name] = cheapest_line
+        discounts.update(item_discounts)
+
+        return {name: discount for name, discount in discounts.items()
+                if discount > 0 and self._conditions_met(self._rules[name], total_cents, line_count)}
+
+    def best_discount(self, discounts: dict[str, Cents], total_cents: Cents) -> tuple[list[str], Cents]:
+        """
+        Combine the discounts offered: every stackable discount, plus the largest of the others. The discount never
+        exceeds the total.
+
+        Returns:
+
+            tuple[list[str], Cents]: The names of the rules applied, and the discount.
+        """
+        applied = [name for name in discounts if self._rules[name].stackable]
+        competing = [name for name in discounts if not self._rules[name].stackable]
+        if competing:
+            # Equal discounts are settled by name, so the same order always gets the same rule.
+            applied.append(max(competing, key=lambda name: (discounts[name], name)))
+
+        return applied, Cents(min(total_cents, sum(discounts[name] for name in applied)))
+
+    @staticmethod
+    def _conditions_met(rule: DiscountRule, total_cents: Cents, line_count: int) -> bool:
+        if rule.above_cents is not None and total_cents <= rule.above_cents:
+            return False
+        if rule.min_lines is not None and line_count < rule.min_lines:
+            return False
+        return True
+
+
+def compile_plan(rules: Iterable[DiscountRule], now: datetime, tier: str | None = None) -> DiscountPlan:
+    """
+    Compile the rules which apply at the given time and to the given loyalty tier into an evaluation plan.
+    """
+    rules = list(rules)
+    applicable = [rule for rule in rules
+                  if rule.is_active(now) and (rule.tiers is None or tier in rule.tiers)]
+    changes = [change for change in (rule.next_change(now) for rule in rules) if change is not None]
+
+    return DiscountPlan(applicable, valid_until=min(changes, default=None))
+
+
+class DiscountEngine:
+    """
+    Keeps the discount rules, and the compiled plan of each loyalty tier until a rule starts or stops applying.
+    """
+
+    def __init__(self, rules: Iterable[DiscountRule]):
+        self._rules = list(rules)
+        self._tiers = _declared_tiers(self._rules)
+        self._plans: dict[str | None, DiscountPlan] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def rules(self) -> list[DiscountRule]:
+        return list(self._rules)
+
+    def set_rules(self, rules: Iterable[DiscountRule]) -> None:
+        """
+        Replace the rules. Plans are compiled again when they are next needed.
+        """
+        rules = list(rules)
+        tiers = _declared_tiers(rules)
+        with self._lock:
+            self._rules = rules
+            self._tiers = tiers
+            self._plans = {}
+
+    def plan(self, tier: str | None = None, now: datetime | None = None) -> DiscountPlan:
+        """
+        Get the plan of the rules which apply now to the given loyalty tier.
+
+        The tier comes from the client, so a tier no rule names gets the plan of orders without a tier, which is the
+        same plan. Plans are only kept for the tiers the rules name, however many different tiers clients send.
+        """
+        now = now or datetime.now(timezone.utc)
+        if tier not in self._tiers:
+            tier = None
+        plan = self._plans.get(tier)
+        if plan is not None and (plan.valid_until is None or now < plan.valid_until):
+            return plan
+
+        with self._lock:
+            plan = compile_plan(self._rules, now, tier)
+            self._plans[tier] = plan
+
+        return plan
+
+
+def _declared_tiers(rules: list[DiscountRule]) -> frozenset[str]:
+    return frozenset(tier for rule in rules if rule.tiers is not None for tier in rule.tiers)
+
+
+def load_discount_rules(path: str | None = None) -> list[DiscountRule]:
+    """
+    Load the discount rules declared in a JSON file, as a list of rules. Without a file, the default rules are used.
+    """
+    if path is None:
+        declarations = DEFAULT_DISCOUNT_RULES
+    else:
+        with open(path) as file:
+            declarations = json.load(file)
+
+    rules = [DiscountRule.from_dict(declaration) for declaration in declarations]
+    names = [rule.name for rule in rules]
+    if len(set(names)) != len(names):
+        raise ValueError("Discount rule names must be unique")
+
+    return rules
@@ -0,0 +1,134 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any
+from typing import Callable
+from typing import Hashable
+
+from fastapi import Request
+from fastapi import Response
+from fastapi import status
+from pydantic import TypeAdapter
+
+from app.api.crud_operations.drink_operations import DRINKS_SNAPSHOT
+from app.api.crud_operations.topping_operations import TOPPINGS_SNAPSHOT
+
+
+class CachedResponse:
+    """
+    A response body which is ready to be sent, with its entity tag.
+    """
+    __slots__ = ("body", "etag")
+
+    def __init__(self, body: bytes):
+        self.body = body
+        # A strong entity tag derived from the body, so every worker process gives the same tag for the same body.
+        self.etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+class ResponseCache:
+    """
+    A bounded cache of serialized JSON response bodies, least recently used entries being dropped first.
+
+    Keys start with the name of the resource, so all entries of a resource can be dropped at once when it changes.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self._max_entries = max_entries
+        self._entries: OrderedDict[tuple, CachedResponse] = OrderedDict()
+        # Entries are dropped from FastAPI's threadpool when the catalog changes, and read on the event loop.
+        self._lock = threading.Lock()
+
+    def get_or_render(self, key: tuple[Hashable, ...], render: Callable[[], bytes]) -> CachedResponse:
+        """
+        Get the cached response for the key, rendering and caching it first if it is not cached yet.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+
+        entry = CachedResponse(render())
+        with self._lock:
+            self._entries[key] = entry
+            if len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+        return entry
+
+    def invalidate(self, resource: str) -> None:
+        """
+        Drop every cached response of the given resource.
+        """
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == resource]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+# The cached responses of the catalog endpoints. A change to the drinks or toppings publishes a new snapshot, which
+# drops the cached responses of that resource.
+CATALOG_RESPONSE_CACHE = ResponseCache()
+DRINKS_SNAPSHOT.subscribe(lambda snapshot: CATALOG_RESPONSE_CACHE.invalidate("drinks"))
+TOPPINGS_SNAPSHOT.subscribe(lambda snapshot: CATALOG_RESPONSE_CACHE.invalidate("toppings"))
+
+
+def render_json(response_type: Any, content: Any) -> bytes:
+    """
+    Validate and serialize content to JSON the same way FastAPI does for a route's "response_model".
+    """
+    adapter = _type_adapter(response_type)
+
+    return adapter.dump_json(adapter.validate_python(content, from_attributes=True))
+
+
+@lru_cache
+def _type_adapter(response_type: Any) -> TypeAdapter:
+    return TypeAdapter(response_type)
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """
+    Check whether an If-None-Match header matches an entity tag, using the weak comparison the header calls for.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def cached_json_response(request: Request,
+                         key: tuple[Hashable, ...],
+                         render: Callable[[], bytes],
+                         headers: dict[str, str] | None = None,
+                         cache: ResponseCache = CATALOG_RESPONSE_CACHE) -> Response:
+    """
+    Send a cached JSON response, or "304 Not Modified" if the client already has it.
+
+    Args:
+
+        request (Request): The request, whose If-None-Match header is checked.
+        key (tuple[Hashable, ...]): The cache key, starting with the resource name and including anything the body
+            depends on.
+        render (Callable[[], bytes]): Renders the body, if it is not cached yet.
+        headers (dict[str, str] | None): Extra headers to send. Default is None.
+        cache (ResponseCache): The cache to use. Default is the catalog response cache.
+
+    Returns:
+
+        Response: The response to send.
+    """
+    entry = cache.get_or_render(key, render)
+    # Clients and caches may keep the response, but have to check it is still current before using it.
+    headers = {**(headers or {}), "ETag": entry.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    return Response(content=entry.body, media_type="application/json", headers=headers)
@@ -1,28 +1,94 @@
 import logging
+from datetime import date
+from datetime import datetime
+from datetime import timezone
+from typing import Literal
+
 from fastapi import APIRouter
 from fastapi import HTTPException
+from fastapi import Query
+from fastapi import Request
+from fastapi import Response
 from fastapi import status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 
+from app.api.crud_operations.drink_operations import ToppingInUseError
+from app.api.crud_operations.drink_operations import UnknownToppingsError
 from app.api.crud_operations.drink_operations import create_drink
 from app.api.crud_operations.drink_operations import delete_drink
-from app.api.crud_operations.drink_operations import get_drinks
+from app.api.crud_operations.drink_operations import delete_topping_from_catalog
+from app.api.crud_operations.drink_operations import get_drinks_snapshot
+from app.api.crud_operations.drink_operations import get_drinks_using_topping
+from app.api.crud_operations.drink_operations import import_drinks
 from app.api.crud_operations.drink_operations import update_drink
-from app.api.crud_operations.order_operations import ORDERS
+from app.api.crud_operations.order_operations import ORDER_ROLLUPS
+from app.api.crud_operations.order_operations import get_most_used_topping_ids
+from app.api.crud_operations.order_operations import get_order_totals
+from app.api.crud_operations.order_operations import iter_orders
+from app.api.crud_operations.order_operations import load_order_rollups
 from app.api.crud_operations.topping_operations import create_topping
-from app.api.crud_operations.topping_operations import delete_topping
-from app.api.crud_operations.topping_operations import get_toppings
+from app.api.crud_operations.topping_operations import get_toppings_snapshot
+from app.api.crud_operations.topping_operations import get_toppings_by_ids
+from app.api.crud_operations.topping_operations import import_toppings
 from app.api.crud_operations.topping_operations import update_topping
 from app.api.crud_operations.topping_operations import TOPPINGS
+from app.api.exports import export_orders_csv
+from app.api.exports import export_orders_ndjson
+from app.api.imports import CatalogImportError
+from app.api.imports import parse_catalog_rows
+from app.api.imports import validate_catalog_rows
+from app.api.order_pipeline import ORDER_PIPELINE
+from app.api.pagination import MAX_PAGE_SIZE
+from app.api.pagination import decode_cursor
+from app.api.pagination import next_cursor_headers
+from app.api.response_cache import cached_json_response
+from app.api.response_cache import render_json
+from app.api.schemas.analytics import AmountTotals
+from app.api.schemas.analytics import DailyRevenue
+from app.api.schemas.analytics import ItemCount
+from app.api.schemas.analytics import Pairing
 from app.api.schemas.drinks import Drink
 from app.api.schemas.drinks import DrinkCreate
+from app.api.schemas.drinks import DrinkImport
 from app.api.schemas.drinks import DrinkUpdate
+from app.api.schemas.imports import CatalogImportResult
+from app.api.schemas.orders import OrderPipelineStats
+from app.api.schemas.orders import OrderTotals
 from app.api.schemas.toppings import Topping
 from app.api.schemas.toppings import ToppingCreate
+from app.api.schemas.toppings import ToppingImport
 from app.api.schemas.toppings import ToppingUpdate
+from app.logging_setup import SAMPLED
+from app.models.money import from_cents
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# The maximum number of rows of one catalog import.
+MAX_IMPORT_ROWS = 10_000
+
+
+def _import_request_body(model: type, csv_example: str) -> dict:
+    """
+    Describe the request body of a catalog import in the OpenAPI schema. The import routes read the body themselves,
+    as it is either JSON or CSV, so FastAPI cannot derive it from their parameters.
+    """
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {
+                    "schema": {"type": "array", "maxItems": MAX_IMPORT_ROWS, "items": model.model_json_schema()},
+                },
+                "text/csv": {
+                    "schema": {"type": "string"},
+                    "example": csv_example,
+                },
+            },
+        },
+    }
+
 
 #####################################################
 #               DRINK ENDPOINTS                     #
@@ -46,31 +112,45 @@ def create_drink_route(drink: DrinkCreate):
 
         The created drink with its details.
     """
-    logger.info(f"Creating drink: {drink.name}")
+    logger.info("Creating drink: %s", drink.name)
     if not drink.name:
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Drink name cannot be empty.")
     if drink.price <= 0:
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Price of drink must be greater than zero.")
-
-    return create_drink(drink)
+    try:
+        return create_drink(drink)
+    except UnknownToppingsError as error:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(error))
 
 
 @router.get("/drinks/", response_model=list[Drink])
-def read_drinks_route(skip: int = 0, limit: int = 10):
+async def read_drinks_route(request: Request, skip: int = Query(0, ge=0),
+                            limit: int = Query(10, gt=0, le=MAX_PAGE_SIZE), after: str | None = None):
     """
     Fetch a list of all drinks, with optional pagination.
 
     Arguments:
 
         skip: int - The number of items to skip.
-        limit: int - The maximum number of items to return.
+        limit: int - The maximum number of items to return, at most 1000.
+        after: str | None - The cursor of the next page, from the X-Next-Cursor header of the previous page. If
+            provided, skip is ignored.
 
     Returns:
 
         A list of drinks.
     """
-    logger.info(f"Fetching drinks: skip={skip}, limit={limit}")
-    return get_drinks(skip=skip, limit=limit)
+    logger.info("Fetching drinks: skip=%s, limit=%s, after=%s", skip, limit, after, extra=SAMPLED)
+    # The response body is serialized once per snapshot and page, and reused until the drinks change.
+    after_id = decode_cursor(after)
+    snapshot = get_drinks_snapshot()
+    drinks = snapshot.select(skip=skip, limit=limit, after_id=after_id)
+    return cached_json_response(
+        request,
+        key=("drinks", snapshot.version, skip, limit, after_id),
+        render=lambda: render_json(list[Drink], drinks),
+        headers=next_cursor_headers(drinks, limit),
+    )
 
 
 @router.put("/drinks/{drink_id}", response_model=Drink)
@@ -87,8 +167,11 @@ def update_drink_route(drink_id: int, drink: DrinkUpdate):
 
         The updated drink with its details.
     """
-    logger.info(f"Updating drink: {drink_id}")
-    updated_drink = update_drink(drink_id, drink)
+    logger.info("Updating drink: %s", drink_id)
+    try:
+        updated_drink = update_drink(drink_id, drink)
+    except UnknownToppingsError as error:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(error))
     if not updated_drink:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Drink not found")
 
@@ -108,7 +191,7 @@ def delete_drink_route(drink_id: int):
 
         The deleted drink with its details.
         """
-    logger.info(f"Deleting drink with id: {drink_id}")
+    logger.info("Deleting drink with id: %s", drink_id)
     deleted_drink = delete_drink(drink_id)
     if not deleted_drink:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Drink not found")
@@ -116,6 +199,78 @@ def delete_drink_route(drink_id: int):
     return deleted_drink
 
 
+@router.post("/drinks/bulk", response_model=list[CatalogImportResult],
+             openapi_extra=_import_request_body(DrinkImport, "id,name,price,toppings\n,Pumpkin Spice Latte,6.25,1;2\n"))
+async def import_drinks_route(request: Request):
+    """
+    Create and replace many drinks with one request, e.g. to load a new seasonal menu.
+
+    The body is either a JSON array of drinks, or CSV with the content type text/csv, a header row and the columns
+    "id", "name", "price" and "toppings", which lists topping IDs separated by spaces or semicolons. Rows with an ID
+    replace that drink, and rows without one create a new drink.
+
+    The import is all or nothing: every row is validated, and the toppings of all rows are checked in one lookup,
+    before any row is applied. The drinks are then written and published together, so the catalog changes at once.
+
+    Example:
+
+        [{"name": "Pumpkin Spice Latte", "price": 6.25, "toppings": [1]}, {"id": 2, "name": "Latte", "price": 5.5}]
+
+    Returns:
+
+        For each row, in the same order, the ID of its drink, or why it was not applied. If any row cannot be applied,
+        nothing is, and the status is 422.
+    """
+    rows, errors = await _read_import(request, DrinkImport)
+    logger.info("Importing %s drinks", len(rows))
+    drinks = None
+    if not errors:
+        try:
+            drinks = await run_in_threadpool(import_drinks, rows)
+        except CatalogImportError as error:
+            errors = error.errors
+
+    return _import_response(rows, drinks, errors)
+
+
+async def _read_import(request: Request, model: type) -> tuple[list, dict[int, Exception]]:
+    """
+    Read and validate the rows of a catalog import, raising an HTTPException if the body cannot be read at all.
+    """
+    try:
+        rows = parse_catalog_rows(await request.body(), request.headers.get("content-type"))
+    except ValueError as error:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(error))
+    if len(rows) > MAX_IMPORT_ROWS:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail=f"At most {MAX_IMPORT_ROWS} rows can be imported at once.")
+
+    return validate_catalog_rows(rows, model)
+
+
+def _import_response(rows: list, items: list | None, errors: dict[int, Exception]) -> Response:
+    """
+    Report the result of every row of a catalog import: the items if the import was applied, or else the errors.
+    """
+    results = []
+    for index, row in enumerate(rows):
+        error = errors.get(index)
+        if items is not None:
+            results.append(CatalogImportResult(index=index, status_code=status.HTTP_200_OK, id=items[index].id,
+                                               created=row.id is None))
+        elif error is None:
+            results.append(CatalogImportResult(index=index, status_code=status.HTTP_424_FAILED_DEPENDENCY,
+                                               detail="Not applied, as other rows of the import cannot be applied."))
+        else:
+            status_code = (status.HTTP_404_NOT_FOUND if isinstance(error, LookupError)
+                           else status.HTTP_422_UNPROCESSABLE_ENTITY)
+            results.append(CatalogImportResult(index=index, status_code=status_code, detail=str(error)))
+    status_code = status.HTTP_200_OK if items is not None else status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    return Response(content=render_json(list[CatalogImportResult], results), status_code=status_code,
+                    media_type="application/json")
+
+
 #####################################################
 #               TOPPING ENDPOINTS                   #
 #####################################################
@@ -137,7 +292,7 @@ def create_topping_route(topping: ToppingCreate):
 
         The created topping with its details.
     """
-    logger.info(f"Creating new topping: {topping.name}")
+    logger.info("Creating new topping: %s", topping.name)
     if not topping.name:
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Topping name cannot be empty.")
     if topping.price <=0:
@@ -146,23 +301,67 @@ def create_topping_route(topping: ToppingCreate):
     return create_topping(name=topping.name, price=topping.price)
 
 
+@router.post("/toppings/bulk", response_model=list[CatalogImportResult],
+             openapi_extra=_import_request_body(ToppingImport, "id,name,price\n,Pumpkin Syrup,1.25\n1,Whole Milk,2\n"))
+async def import_toppings_route(request: Request):
+    """
+    Create and replace many toppings with one request, all or nothing, the same way as "/drinks/bulk".
+
+    The body is either a JSON array of toppings, or CSV with the content type text/csv, a header row and the columns
+    "id", "name" and "price". Rows with an ID replace that topping, and rows without one create a new topping.
+
+    Example:
+
+        id,name,price
+        ,Pumpkin Syrup,1.25
+        1,Whole Milk,2
+
+    Returns:
+
+        For each row, in the same order, the ID of its topping, or why it was not applied. If any row cannot be
+        applied, nothing is, and the status is 422.
+    """
+    rows, errors = await _read_import(request, ToppingImport)
+    logger.info("Importing %s toppings", len(rows))
+    toppings = None
+    if not errors:
+        try:
+            toppings = await run_in_threadpool(import_toppings, rows)
+        except CatalogImportError as error:
+            errors = error.errors
+
+    return _import_response(rows, toppings, errors)
+
+
 @router.get("/toppings/", response_model=list[Topping])
-def read_toppings_route(skip: int = 0, limit: int = 10):
+async def read_toppings_route(request: Request, skip: int = Query(0, ge=0),
+                              limit: int = Query(10, gt=0, le=MAX_PAGE_SIZE), after: str | None = None):
     """
     Fetch a list of all toppings, with optional pagination.
 
     Arguments:
 
         skip: int - The number of items to skip.
-        limit: int - The maximum number of items to return.
+        limit: int - The maximum number of items to return, at most 1000.
+        after: str | None - The cursor of the next page, from the X-Next-Cursor header of the previous page. If
+            provided, skip is ignored.
 
     Returns:
 
         A list of toppings.
     """
-    logger.info(f"Fetching toppings: skip={skip}, limit={limit}")
+    logger.info("Fetching toppings: skip=%s, limit=%s, after=%s", skip, limit, after, extra=SAMPLED)
 
-    return get_toppings(skip=skip, limit=limit)
+    # The response body is serialized once per snapshot and page, and reused until the toppings change.
+    after_id = decode_cursor(after)
+    snapshot = get_toppings_snapshot()
+    toppings = snapshot.select(skip=skip, limit=limit, after_id=after_id)
+    return cached_json_response(
+        request,
+        key=("toppings", snapshot.version, skip, limit, after_id),
+        render=lambda: render_json(list[Topping], toppings),
+        headers=next_cursor_headers(toppings, limit),
+    )
 
 
 @router.put("/toppings/{topping_id}", response_model=Topping)
@@ -179,7 +378,7 @@ def update_topping_route(topping_id: int, topping: ToppingUpdate):
 
         The updated topping with its details.
     """
-    logger.info(f"Updating topping: {topping_id}")
+    logger.info("Updating topping: %s", topping_id)
     updated_topping = update_topping(topping_id, name=topping.name, price=topping.price)
     if not updated_topping:
         raise HTTPException(status_code=404, detail="Topping not found")
@@ -187,48 +386,272 @@ def update_topping_route(topping_id: int, topping: ToppingUpdate):
     return updated_topping
 
 
+@router.get("/toppings/{topping_id}/drinks", response_model=list[Drink])
+def read_drinks_using_topping_route(topping_id: int):
+    """
+    Fetch the drinks which list a topping.
+
+    Arguments:
+
+        topping_id: int - The ID of the topping.
+
+    Returns:
+
+        The drinks listing the topping, in ID order.
+    """
+    logger.info("Fetching drinks using topping: %s", topping_id)
+    if topping_id not in TOPPINGS:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Topping not found")
+
+    return get_drinks_using_topping(topping_id)
+
+
 @router.delete("/toppings/{topping_id}", response_model=Topping)
-def delete_topping_route(topping_id: int):
+def delete_topping_route(topping_id: int, cascade: bool = False):
     """
-    Delete an existing topping by its ID.
+    Delete an existing topping by its ID. A topping which drinks still list is only deleted with cascade, which
+    removes it from those drinks.
 
     Arguments:
 
         topping_id: int - The ID of the topping to delete.
+        cascade: bool - Whether to remove the topping from the drinks listing it. If false, a topping listed by
+            drinks is not deleted, and 409 Conflict is returned.
 
     Returns:
 
         The deleted topping with its details.
     """
-    logger.info(f"Deleting topping with id: {topping_id}")
-    deleted_topping = delete_topping(topping_id=topping_id)
+    logger.info("Deleting topping with id: %s", topping_id)
+    try:
+        deleted_topping = delete_topping_from_catalog(topping_id, cascade=cascade)
+    except ToppingInUseError as error:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail=f"{error}. Delete it with cascade=true to remove it from them.")
     if deleted_topping is None:
-        logger.error(f"Topping with id {topping_id} not found")
+        logger.error("Topping with id %s not found", topping_id)
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Topping not found")
     return deleted_topping
 
 
 @router.get("/most-used-toppings/", response_model=list[Topping])
-def calculate_most_used_toppings_route():
+def calculate_most_used_toppings_route(k: int | None = Query(None, gt=0)):
     """
-    Calculate and fetch a list of the most used toppings based on orders.
+    Fetch a list of the most used toppings based on orders, most used first.
+
+    Arguments:
+
+        k: int | None - The maximum number of toppings to return. If not provided, all used toppings are returned.
 
     Returns:
 
         A list of the most used toppings.
     """
-    logger.info("Fetching most used toppings")
-    topping_usage = {}
+    logger.info("Fetching most used toppings", extra=SAMPLED)
+    # Usage is counted as orders come in, so this only ranks the counters. Deleted toppings are left out.
+    most_used_topping_ids = get_most_used_topping_ids(k=k, only=TOPPINGS)
+    toppings = get_toppings_by_ids(most_used_topping_ids)
+
+    return [toppings[topping_id] for topping_id in most_used_topping_ids if topping_id in toppings]
+
+
+#####################################################
+#               ORDER ENDPOINTS                     #
+#####################################################
+@router.get("/orders/export", response_class=StreamingResponse)
+def export_orders_route(
+        format: Literal["ndjson", "csv"] = "ndjson",
+        min_id: int | None = None,
+        max_id: int | None = None,
+        since: datetime | None = None,
+        until: datetime | None = None):
+    """
+    Export the order history, streamed as newline-delimited JSON or CSV, in ID order.
+
+    Orders are read and sent in batches, so exporting the whole history takes the same memory as a few orders.
+
+    Arguments:
+
+        format: str - Either "ndjson", one JSON order per line, or "csv".
+        min_id: int | None - If provided, only orders with at least this ID are exported.
+        max_id: int | None - If provided, only orders with at most this ID are exported.
+        since: datetime | None - If provided, only orders placed at or after this time are exported. UTC if no
+            timezone is given.
+        until: datetime | None - If provided, only orders placed before this time are exported. UTC if no
+            timezone is given.
+
+    Returns:
+
+        The orders, streamed.
+    """
+    logger.info("Exporting orders: format=%s, min_id=%s, max_id=%s, since=%s, until=%s", format, min_id, max_id,
+                since, until)
+    # Order times are kept in UTC, and can only be compared with times which have a timezone.
+    if since is not None and since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    if until is not None and until.tzinfo is None:
+        until = until.replace(tzinfo=timezone.utc)
+
+    orders = iter_orders(min_id=min_id, max_id=max_id, since=since, until=until)
+    if format == "csv":
+        return StreamingResponse(export_orders_csv(orders), media_type="text/csv",
+                                 headers={"Content-Disposition": 'attachment; filename="orders.csv"'})
+
+    return StreamingResponse(export_orders_ndjson(orders), media_type="application/x-ndjson")
+
+
+@router.get("/orders/totals", response_model=OrderTotals)
+def calculate_order_totals_route():
+    """
+    Calculate the number of orders, and the sum of their amounts before and after discounts.
+
+    Amounts are added up in whole cents, so the sums are exact.
+
+    Returns:
+
+        The number of orders and the sums of their amounts.
+    """
+    logger.info("Calculating order totals")
+    order_count, total_cents, discounted_cents = get_order_totals()
+
+    return OrderTotals(order_count=order_count, total_amount=from_cents(total_cents),
+                       discounted_amount=from_cents(discounted_cents))
+
+
+@router.get("/orders/pipeline", response_model=OrderPipelineStats)
+def read_order_pipeline_route():
+    """
+    Fetch how full the order pipeline is, and the latency of each of its stages, e.g. to tune its capacity and
+    number of workers. The latencies are also exported per stage as the "order_pipeline_stage_duration_seconds"
+    histogram on "/metrics".
+
+    Returns:
+
+        The state of the order pipeline of this worker.
+    """
+    logger.info("Fetching the order pipeline stats", extra=SAMPLED)
+    return OrderPipelineStats(
+        running=ORDER_PIPELINE.running,
+        capacity=ORDER_PIPELINE.capacity,
+        pending=ORDER_PIPELINE.pending,
+        workers=ORDER_PIPELINE.workers,
+        stages=[{"stage": stage, "count": latency.count, "mean_seconds": latency.mean_seconds,
+                 "recent_seconds": latency.recent_seconds}
+                for stage, latency in ORDER_PIPELINE.latencies.items()],
+    )
+
+
+#####################################################
+#               ANALYTICS ENDPOINTS                 #
+#####################################################
+def _amount_totals(order_count: int, total_cents: int, discounted_cents: int) -> dict:
+    discount_cents = total_cents - discounted_cents
+    return {
+        "order_count": order_count,
+        "total_amount": from_cents(total_cents),
+        "discounted_amount": from_cents(discounted_cents),
+        "discount_amount": from_cents(discount_cents),
+        "average_discount": round(from_cents(discount_cents) / order_count, 2) if order_count else 0,
+    }
+
+
+@router.get("/analytics/summary", response_model=AmountTotals)
+def read_analytics_summary_route():
+    """
+    Fetch the number of orders, the revenue before and after discounts, and the average discount per order.
+
+    Returns:
+
+        The totals of all orders.
+    """
+    logger.info("Fetching the analytics summary", extra=SAMPLED)
+    return AmountTotals(**_amount_totals(*ORDER_ROLLUPS.summary()))
+
+
+@router.get("/analytics/daily", response_model=list[DailyRevenue])
+def read_daily_revenue_route(since: date | None = None, until: date | None = None):
+    """
+    Fetch the number of orders, the revenue and the discounts of every day with orders, oldest first.
+
+    Arguments:
+
+        since: date | None - If provided, only days from this day on are returned.
+        until: date | None - If provided, only days before this day are returned.
+
+    Returns:
+
+        The totals of every day, in UTC.
+    """
+    logger.info("Fetching daily revenue: since=%s, until=%s", since, until, extra=SAMPLED)
+    return [DailyRevenue(day=rollup.day, **_amount_totals(rollup.order_count, rollup.total_cents,
+                                                          rollup.discounted_cents))
+            for rollup in ORDER_ROLLUPS.daily(since=since, until=until)]
 
-    for order in ORDERS:
-        for topping_ids in order.topping_ids:
-            for topping_id in topping_ids:
-                if topping_id in topping_usage:
-                    topping_usage[topping_id] += 1
-                else:
-                    topping_usage[topping_id] = 1
 
-    most_used_topping_ids = sorted(topping_usage, key=topping_usage.get, reverse=True)
-    most_used_toppings = [t for t in TOPPINGS if t.id in most_used_topping_ids]
+@router.get("/analytics/top-drinks", response_model=list[ItemCount])
+def read_top_drinks_route(k: int | None = Query(10, gt=0)):
+    """
+    Fetch the most ordered drinks, most ordered first.
+
+    Arguments:
+
+        k: int | None - The maximum number of drinks to return. Default is 10.
+
+    Returns:
+
+        The IDs of the drinks, and how many times each was ordered.
+    """
+    logger.info("Fetching top drinks", extra=SAMPLED)
+    return [ItemCount(id=drink_id, count=count) for drink_id, count in ORDER_ROLLUPS.top_drinks(k=k)]
+
+
+@router.get("/analytics/top-toppings", response_model=list[ItemCount])
+def read_top_toppings_route(k: int | None = Query(10, gt=0)):
+    """
+    Fetch the most ordered toppings, most ordered first. Unlike "/most-used-toppings/", deleted toppings are counted.
+
+    Arguments:
+
+        k: int | None - The maximum number of toppings to return. Default is 10.
+
+    Returns:
+
+        The IDs of the toppings, and how many times each was ordered.
+    """
+    logger.info("Fetching top toppings", extra=SAMPLED)
+    return [ItemCount(id=topping_id, count=count) for topping_id, count in ORDER_ROLLUPS.top_toppings(k=k)]
+
+
+@router.get("/analytics/pairings", response_model=list[Pairing])
+def read_pairings_route(drink_id: int | None = None, k: int | None = Query(10, gt=0)):
+    """
+    Fetch the toppings most often ordered on the same line as a drink, most often first.
+
+    Arguments:
+
+        drink_id: int | None - If provided, only the pairings of this drink are returned.
+        k: int | None - The maximum number of pairings to return. Default is 10.
+
+    Returns:
+
+        The drink and topping of every pairing, and how many times they were ordered together.
+    """
+    logger.info("Fetching pairings: drink_id=%s", drink_id, extra=SAMPLED)
+    return [Pairing(drink_id=paired_drink_id, topping_id=topping_id, count=count)
+            for paired_drink_id, topping_id, count in ORDER_ROLLUPS.pairings(drink_id=drink_id, k=k)]
+
+
+@router.post("/analytics/rebuild", response_model=AmountTotals)
+def rebuild_analytics_route():
+    """
+    Rebuild the analytics from the order history, e.g. to backfill them. The order columns are aggregated with NumPy
+    if it is installed.
+
+    Returns:
+
+        The totals of all orders, after the rebuild.
+    """
+    logger.info("Rebuilding the analytics rollups")
+    load_order_rollups()
 
-    return most_used_toppings
+    return AmountTotals(**_amount_totals(*ORDER_ROLLUPS.summary()))
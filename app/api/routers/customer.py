@@ -1,70 +1,167 @@
+import asyncio
+import json
 import logging
+from typing import Literal
 
 from fastapi import APIRouter
+from fastapi import Header
 from fastapi import HTTPException
+from fastapi import Query
+from fastapi import Request
+from fastapi import Response
 from fastapi import status
 
-from app.api.crud_operations.drink_operations import get_drinks
+from app.api.crud_operations.drink_operations import get_drinks_snapshot
+from app.api.crud_operations.drink_operations import search_drinks
 from app.api.crud_operations.order_operations import create_order
 from app.api.crud_operations.order_operations import get_orders
-from app.api.crud_operations.drink_operations import get_drink
-from app.api.crud_operations.topping_operations import get_topping
-from app.api.crud_operations.topping_operations import get_toppings
+from app.api.crud_operations.topping_operations import get_toppings_snapshot
+from app.api.crud_operations.topping_operations import search_toppings
+from app.api.idempotency import IdempotencyCache
+from app.api.idempotency import IdempotencyKeyReusedError
+from app.api.idempotency import fingerprint
+from app.api.metrics import timed
+from app.api.order_pipeline import ORDER_PIPELINE
+from app.api.order_pipeline import OrderPipelineFullError
+from app.api.order_pipeline import OrderPipelineStoppedError
+from app.api.order_pipeline import OrderTicket
+from app.api.pricing.engine import InvalidOrderError
+from app.api.pricing.engine import ItemNotFoundError
+from app.api.pricing.engine import price_order
+from app.api.pricing.engine import price_orders
+from app.api.pagination import MAX_PAGE_SIZE
+from app.api.pagination import decode_cursor
+from app.api.pagination import next_cursor_headers
+from app.api.response_cache import cached_json_response
+from app.api.response_cache import render_json
 from app.api.schemas.drinks import Drink
+from app.api.schemas.orders import BulkOrderResult
 from app.api.schemas.orders import Order
 from app.api.schemas.orders import OrderCreate
+from app.api.schemas.orders import OrderStatus
+from app.api.schemas.search import CatalogSearchResults
 from app.api.schemas.toppings import Topping
+from app.api.storage.journal import JournalError
+from app.config import settings
+from app.logging_setup import SAMPLED
+from app.models.money import to_cents
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# The maximum number of orders which can be placed with one bulk request.
+MAX_BULK_ORDERS = 1000
+# The responses to orders placed with an Idempotency-Key, so a retried order is not placed twice.
+ORDER_IDEMPOTENCY = IdempotencyCache(max_bytes=settings.idempotency_cache_bytes, ttl=settings.idempotency_ttl)
+
 
 @router.get("/drinks/", response_model=list[Drink])
-def fetch_all_drinks(skip: int = 0, limit: int = 10):
+async def fetch_all_drinks(request: Request, skip: int = Query(0, ge=0),
+                           limit: int = Query(10, gt=0, le=MAX_PAGE_SIZE), after: str | None = None):
     """
     Fetch a list of all drinks, with optional pagination.
 
     Arguments:
 
         skip: int - The number of items to skip.
-        limit: int - The maximum number of items to return.
+        limit: int - The maximum number of items to return, at most 1000.
+        after: str | None - The cursor of the next page, from the X-Next-Cursor header of the previous page. If
+            provided, skip is ignored.
 
     Returns:
 
         A list of drinks.
     """
-    logger.info(f"Fetching drinks: skip={skip}, limit={limit}")
-
-    return get_drinks(skip=skip, limit=limit)
+    logger.info("Fetching drinks: skip=%s, limit=%s, after=%s", skip, limit, after, extra=SAMPLED)
+
+    # The response body is serialized once per snapshot and page, and reused until the drinks change.
+    after_id = decode_cursor(after)
+    snapshot = get_drinks_snapshot()
+    drinks = snapshot.select(skip=skip, limit=limit, after_id=after_id)
+    return cached_json_response(
+        request,
+        key=("drinks", snapshot.version, skip, limit, after_id),
+        render=lambda: render_json(list[Drink], drinks),
+        headers=next_cursor_headers(drinks, limit),
+    )
 
 
 @router.get("/toppings/", response_model=list[Topping])
-def fetch_all_toppings(skip: int = 0, limit: int = 10):
+async def fetch_all_toppings(request: Request, skip: int = Query(0, ge=0),
+                             limit: int = Query(10, gt=0, le=MAX_PAGE_SIZE), after: str | None = None):
     """
     Fetch a list of all toppings, with optional pagination.
 
     Arguments:
 
         skip: int - The number of items to skip.
-        limit: int - The maximum number of items to return.
+        limit: int - The maximum number of items to return, at most 1000.
+        after: str | None - The cursor of the next page, from the X-Next-Cursor header of the previous page. If
+            provided, skip is ignored.
 
     Returns:
 
         A list of toppings.
     """
-    logger.info(f"Fetching toppings: skip={skip}, limit={limit}")
+    logger.info("Fetching toppings: skip=%s, limit=%s, after=%s", skip, limit, after, extra=SAMPLED)
+
+    # The response body is serialized once per snapshot and page, and reused until the toppings change.
+    after_id = decode_cursor(after)
+    snapshot = get_toppings_snapshot()
+    toppings = snapshot.select(skip=skip, limit=limit, after_id=after_id)
+    return cached_json_response(
+        request,
+        key=("toppings", snapshot.version, skip, limit, after_id),
+        render=lambda: render_json(list[Topping], toppings),
+        headers=next_cursor_headers(toppings, limit),
+    )
+
+
+@router.get("/search/", response_model=CatalogSearchResults)
+def search_catalog(q: str = "",
+                   kind: Literal["all", "drinks", "toppings"] = "all",
+                   min_price: float | None = Query(None, ge=0),
+                   max_price: float | None = Query(None, ge=0),
+                   limit: int = Query(10, gt=0, le=100)):
+    """
+    Search the drinks and toppings by name and price.
+
+    Arguments:
+
+        q: str - The words to search for. Every word must be in the name, the last only has to start a word, so
+            "vanilla lat" finds "Vanilla Latte". If empty, every item in the price range matches, cheapest first.
+        kind: str - Whether to search "drinks", "toppings" or "all" of them.
+        min_price: float | None - The lowest price.
+        max_price: float | None - The highest price.
+        limit: int - The maximum number of drinks, and of toppings, to return.
+
+    Returns:
+
+        The matching drinks and toppings.
+    """
+    logger.info("Searching the catalog: q=%s, kind=%s", q, kind, extra=SAMPLED)
+    min_price_cents = None if min_price is None else to_cents(min_price)
+    max_price_cents = None if max_price is None else to_cents(max_price)
+    drinks = toppings = []
+    if kind in ("all", "drinks"):
+        drinks = search_drinks(q, min_price_cents=min_price_cents, max_price_cents=max_price_cents, limit=limit)
+    if kind in ("all", "toppings"):
+        toppings = search_toppings(q, min_price_cents=min_price_cents, max_price_cents=max_price_cents, limit=limit)
 
-    return get_toppings(skip=skip, limit=limit)
+    return {"drinks": drinks, "toppings": toppings}
 
 
 @router.post("/order-drinks/", response_model=Order)
-def place_order(order: OrderCreate):
+def place_order(order: OrderCreate, idempotency_key: str | None = Header(None, max_length=255)):
     """
     Place a new order with the provided drinks and toppings.
 
     Argument:
 
         order: OrderCreate - An object containing the details of the order.
+        idempotency_key: str | None - The Idempotency-Key header, a unique key chosen by the client for the order,
+            e.g. a UUID. Retrying with the same key returns the response of the first attempt, with an
+            Idempotent-Replayed header, instead of placing the order again.
 
     Example:
 
@@ -75,77 +172,192 @@ def place_order(order: OrderCreate):
 
           A successfully created order with id of drinks and toppings.
     """
-    logger.info("Creating new order")
-
-    # First, we validate whehter drink IDs have been entered in list of drink_ids.
-    if not order.drink_ids or any(not drink_list for drink_list in order.drink_ids):
-        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Drink IDs cannot be empty.")
-
-    drinks = []
-    toppings = []
-
-    # Find drinks ordered by the customer.
-    for drink_list in order.drink_ids:
-        drink_sublist = []
-        for drink_id in drink_list:
-            drink = get_drink(drink_id)
-            if not drink:
-                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Drink with id {drink_id} not found")
-            drink_sublist.append(drink)
-        drinks.append(drink_sublist)
-
-    # Find toppings ordered by the customer.
-    for topping_list in order.topping_ids:
-        topping_sublist = []
-        for topping_id in topping_list:
-            topping = get_topping(topping_id)
-            if not topping:
-                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
-                                    detail=f"Topping with id {topping_id} not found")
-            topping_sublist.append(topping)
-        toppings.append(topping_sublist)
-
-    # Calculating toatal sum of customers order, with drinks and toppings.
-    total_amount = sum(
-        sum(drink.price for drink in drink_list) +
-        sum(topping.price for topping in topping_list)
-        for drink_list, topping_list in zip(drinks, toppings))
-
-    # Calculating which kind of discount the customer is eligible for. Lowest discount will be applied.
-    discount_1 = total_amount * 0.75 if total_amount > 12 else total_amount
-    discount_2 = total_amount - min(
-        drink.price + sum(topping.price for topping in topping_list)
-        for drink, topping_list in zip(drinks, toppings)
-    ) if len(drinks) >= 3 else total_amount
-
-    discounted_amount = min(discount_1, discount_2)
+    logger.info("Creating new order", extra=SAMPLED)
+    if idempotency_key is None:
+        return _place_order(order)
+
+    def process() -> tuple[int, bytes]:
+        # The response is kept as it is sent, so a retry gets the same status and body.
+        try:
+            return status.HTTP_200_OK, render_json(Order, _place_order(order))
+        except HTTPException as error:
+            return error.status_code, json.dumps({"detail": error.detail}).encode()
+
+    try:
+        status_code, body, replayed = ORDER_IDEMPOTENCY.run(idempotency_key,
+                                                             fingerprint(order.model_dump_json().encode()), process)
+    except IdempotencyKeyReusedError as error:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(error))
+    headers = {"Idempotent-Replayed": "true"} if replayed else None
+
+    return Response(content=body, status_code=status_code, media_type="application/json", headers=headers)
+
+
+def _place_order(order: OrderCreate):
+    """
+    Price and create an order, raising an HTTPException if it cannot be placed.
+    """
+    # Validate the order, resolve every drink and topping of it in one lookup, and calculate the total and discounts.
+    try:
+        with timed("pricing.price_order"):
+            price = price_order(order)
+    except InvalidOrderError as error:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(error))
+    except ItemNotFoundError as error:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(error))
 
     # Create an order which will display what drinks, topping, discount amount and total amount
-    # the order has come to.
-    new_order = create_order(
-        drink_ids=order.drink_ids,
-        topping_ids=order.topping_ids,
-        total_amount=total_amount,
-        discounted_amount=discounted_amount
-    )
+    # the order has come to. If the order cannot be made durable, it is not placed.
+    try:
+        new_order = create_order(
+            drink_ids=order.drink_ids,
+            topping_ids=order.topping_ids,
+            total_cents=price.total_cents,
+            discounted_cents=price.discounted_cents
+        )
+    except JournalError as error:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(error))
 
     return new_order
 
 
+@router.post("/order-drinks/bulk", response_model=list[BulkOrderResult])
+def place_orders_in_bulk(orders: list[OrderCreate]):
+    """
+    Place many orders with one request, e.g. for catering and office delivery partners.
+
+    The drinks and toppings of all orders are resolved together, and all orders are priced in one pass. Each order is
+    placed or rejected on its own, so one invalid order does not fail the others.
+
+    Argument:
+
+        orders: list[OrderCreate] - The orders to place, at most 1000.
+
+    Returns:
+
+        For each order, in the same order, either the created order or why it was not placed.
+    """
+    logger.info("Creating %s orders in bulk", len(orders))
+    if len(orders) > MAX_BULK_ORDERS:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail=f"At most {MAX_BULK_ORDERS} orders can be placed at once.")
+
+    with timed("pricing.price_orders"):
+        prices = price_orders(orders)
+    results = []
+    for index, (order, price) in enumerate(zip(orders, prices)):
+        if isinstance(price, InvalidOrderError):
+            results.append(BulkOrderResult(index=index, status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                                           detail=str(price)))
+        elif isinstance(price, ItemNotFoundError):
+            results.append(BulkOrderResult(index=index, status_code=status.HTTP_404_NOT_FOUND, detail=str(price)))
+        else:
+            try:
+                new_order = create_order(
+                    drink_ids=order.drink_ids,
+                    topping_ids=order.topping_ids,
+                    total_cents=price.total_cents,
+                    discounted_cents=price.discounted_cents
+                )
+            except JournalError as error:
+                results.append(BulkOrderResult(index=index, status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                               detail=str(error)))
+                continue
+            results.append(BulkOrderResult(index=index, status_code=status.HTTP_200_OK,
+                                           order=Order.model_validate(new_order, from_attributes=True)))
+
+    return results
+
+
+@router.post("/order-drinks/async", response_model=OrderStatus, status_code=status.HTTP_202_ACCEPTED)
+async def submit_order(order: OrderCreate, request: Request, response: Response):
+    """
+    Submit an order to be placed in the background, by the order pipeline. The request only checks the order and
+    queues it, so it returns without waiting for pricing or storage.
+
+    Argument:
+
+        order: OrderCreate - An object containing the details of the order.
+
+    Returns:
+
+        The status of the order, "queued", with the URL to poll it at in the Location header. If the pipeline is full,
+        429 Too Many Requests is returned instead, or 503 Service Unavailable if it is not running, both with a
+        Retry-After header.
+    """
+    logger.info("Submitting new order", extra=SAMPLED)
+    try:
+        ticket = ORDER_PIPELINE.submit(order)
+    except InvalidOrderError as error:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(error))
+    except OrderPipelineFullError as error:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(error),
+                            headers={"Retry-After": str(error.retry_after)})
+    except OrderPipelineStoppedError as error:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(error),
+                            headers={"Retry-After": str(error.retry_after)})
+    response.headers["Location"] = str(request.url_for("fetch_order_status", ticket_id=ticket.ticket_id))
+
+    return _order_status(ticket)
+
+
+@router.get("/order-drinks/async/{ticket_id}", response_model=OrderStatus)
+async def fetch_order_status(ticket_id: str, wait: float = Query(0, ge=0, le=30)):
+    """
+    Fetch the status of an order submitted to the order pipeline.
+
+    Arguments:
+
+        ticket_id: str - The ticket ID returned when the order was submitted.
+        wait: float - How many seconds to wait for the order to be placed or rejected before returning, at most 30.
+            Default is 0, which returns right away.
+
+    Returns:
+
+        The status of the order, with the created order once it is placed.
+    """
+    ticket = ORDER_PIPELINE.get(ticket_id)
+    if ticket is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Order ticket not found")
+    if wait and not ticket.done.is_set():
+        try:
+            await asyncio.wait_for(ticket.done.wait(), wait)
+        except asyncio.TimeoutError:
+            pass
+
+    return _order_status(ticket)
+
+
+def _order_status(ticket: OrderTicket) -> dict:
+    return {
+        "ticket_id": ticket.ticket_id,
+        "status": ticket.status,
+        "status_code": ticket.status_code,
+        "order": None if ticket.order is None else Order.model_validate(ticket.order, from_attributes=True),
+        "detail": ticket.detail,
+    }
+
+
 @router.get("/orders/", response_model=list[Order])
-def fetch_all_orders(skip: int = 0, limit: int = 10):
+def fetch_all_orders(response: Response, skip: int = Query(0, ge=0),
+                     limit: int = Query(10, gt=0, le=MAX_PAGE_SIZE), after: str | None = None):
     """
     Fetch a list of all orders, with optional pagination.
 
     Arguments:
 
         skip: int - The number of items to skip.
-        limit: int - The maximum number of items to return.
+        limit: int - The maximum number of items to return, at most 1000.
+        after: str | None - The cursor of the next page, from the X-Next-Cursor header of the previous page. If
+            provided, skip is ignored.
 
     Returns:
 
         A list of orders.
     """
-    logger.info(f"Fetching orders: skip={skip}, limit={limit}")
+    logger.info("Fetching orders: skip=%s, limit=%s, after=%s", skip, limit, after, extra=SAMPLED)
+
+    orders = get_orders(skip=skip, limit=limit, after_id=decode_cursor(after))
+    response.headers.update(next_cursor_headers(orders, limit))
 
-    return get_orders(skip=skip, limit=limit)
+    return orders
@@ -0,0 +1,60 @@
+from datetime import date
+
+from pydantic import BaseModel
+from pydantic import Field
+
+
+class AmountTotals(BaseModel):
+    order_count: int = Field(
+        ...,
+        description="The number of orders."
+    )
+    total_amount: float = Field(
+        ...,
+        description="The sum of the total amounts of the orders, before discounts."
+    )
+    discounted_amount: float = Field(
+        ...,
+        description="The sum of the amounts paid for the orders, after discounts."
+    )
+    discount_amount: float = Field(
+        ...,
+        description="The sum of the discounts given on the orders."
+    )
+    average_discount: float = Field(
+        ...,
+        description="The average discount given per order, or 0 without orders."
+    )
+
+
+class DailyRevenue(AmountTotals):
+    day: date = Field(
+        ...,
+        description="The day the orders were placed, in UTC."
+    )
+
+
+class ItemCount(BaseModel):
+    id: int = Field(
+        ...,
+        description="The ID of the drink or topping."
+    )
+    count: int = Field(
+        ...,
+        description="How many times it was ordered."
+    )
+
+
+class Pairing(BaseModel):
+    drink_id: int = Field(
+        ...,
+        description="The ID of the drink."
+    )
+    topping_id: int = Field(
+        ...,
+        description="The ID of the topping."
+    )
+    count: int = Field(
+        ...,
+        description="How many times the topping was ordered on the same line as the drink."
+    )
@@ -22,4 +22,8 @@ class DrinkCreate(DrinkBase):
 class DrinkUpdate(DrinkBase):
     name: str = Field(None, min_length=1, description="The updated name of the drink.")
     price: float = Field(None, gt=0, description="The updated price of the drink.")
-    toppings: list[int] = Field([], description="List of updated topping IDs associated with the drink.")
\ No newline at end of file
+    toppings: list[int] = Field([], description="List of updated topping IDs associated with the drink.")
+
+
+class DrinkImport(DrinkBase):
+    id: int | None = Field(None, description="The ID of the drink to replace. If not provided, a new drink is created.")
@@ -0,0 +1,26 @@
+from pydantic import BaseModel
+from pydantic import Field
+
+
+class CatalogImportResult(BaseModel):
+    index: int = Field(
+        ...,
+        description="The position of the row in the import, counting from 0 and without the header row of CSV."
+    )
+    status_code: int = Field(
+        ...,
+        description="200 if the row was applied, or else why it was not, e.g. 404 or 422. Rows which are valid, but "
+                    "were not applied because other rows are not, have 424."
+    )
+    id: int | None = Field(
+        None,
+        description="The ID of the created or replaced item, if the row was applied."
+    )
+    created: bool = Field(
+        False,
+        description="Whether the row created a new item, rather than replacing one."
+    )
+    detail: str | None = Field(
+        None,
+        description="Why the row was not applied, if it was not."
+    )
@@ -1,15 +1,31 @@
+from datetime import datetime
+from typing import Annotated
+from typing import Literal
+
 from pydantic import BaseModel
 from pydantic import Field
 
 
+# The most lines an order may have, and the most IDs a line may have. Orders are stored and journaled in compact
+# binary columns, with 32-bit item IDs and 16-bit line counts, which these limits keep well within.
+MAX_ORDER_LINES = 1000
+MAX_LINE_ITEMS = 100
+MAX_ITEM_ID = 2 ** 31 - 1
+
+ItemId = Annotated[int, Field(ge=1, le=MAX_ITEM_ID)]
+Line = Annotated[list[ItemId], Field(max_length=MAX_LINE_ITEMS)]
+
+
 class OrderBase(BaseModel):
-    drink_ids: list[list[int]] = Field(
+    drink_ids: list[Line] = Field(
         ...,
+        max_length=MAX_ORDER_LINES,
         description="A list of lists containing the IDs of the drinks in the order. Each inner list represents a set of"
                     "drinks to be included together."
     )
-    topping_ids: list[list[int]] = Field(
+    topping_ids: list[Line] = Field(
         ...,
+        max_length=MAX_ORDER_LINES,
         description="A list of lists containing the IDs of the toppings in the order. Each inner list corresponds to "
                     "the toppings for the drinks in the corresponding inner list of drink_ids."
     )
@@ -28,6 +44,10 @@ class Order(OrderBase):
         ...,
         description="The final amount for the order after applying any discounts."
     )
+    created_at: datetime = Field(
+        ...,
+        description="When the order was placed, in UTC."
+    )
 
     class ConfigDict:
         from_attributes = True
@@ -35,3 +55,103 @@ class Order(OrderBase):
 
 class OrderCreate(OrderBase):
     pass
+
+
+class OrderTotals(BaseModel):
+    order_count: int = Field(
+        ...,
+        description="The number of orders placed."
+    )
+    total_amount: float = Field(
+        ...,
+        description="The sum of the total amounts of all orders, before discounts."
+    )
+    discounted_amount: float = Field(
+        ...,
+        description="The sum of the amounts paid for all orders, after discounts."
+    )
+
+
+class BulkOrderResult(BaseModel):
+    index: int = Field(
+        ...,
+        description="The position of the order in the submitted list."
+    )
+    status_code: int = Field(
+        ...,
+        description="The status the order would have had if it was placed on its own, e.g. 200 or 404."
+    )
+    order: Order | None = Field(
+        None,
+        description="The created order, if it was placed."
+    )
+    detail: str | None = Field(
+        None,
+        description="Why the order was not placed, if it was not."
+    )
+
+
+class OrderStatus(BaseModel):
+    ticket_id: str = Field(
+        ...,
+        description="The ID to poll the order with."
+    )
+    status: Literal["queued", "pricing", "persisting", "placed", "rejected"] = Field(
+        ...,
+        description="Where the order is in the order pipeline, or whether it was placed or rejected."
+    )
+    status_code: int | None = Field(
+        None,
+        description="Once the order is placed or rejected, the status it would have had if it was placed directly, "
+                    "e.g. 200 or 404."
+    )
+    order: Order | None = Field(
+        None,
+        description="The created order, once it is placed."
+    )
+    detail: str | None = Field(
+        None,
+        description="Why the order was rejected, if it was."
+    )
+
+
+class StageLatency(BaseModel):
+    stage: str = Field(
+        ...,
+        description="The stage of the order pipeline: \"queued\", \"pricing\", \"persistence\" or \"fanout\"."
+    )
+    count: int = Field(
+        ...,
+        description="The number of orders through the stage."
+    )
+    mean_seconds: float = Field(
+        ...,
+        description="The mean time an order spent in the stage, in seconds."
+    )
+    recent_seconds: float = Field(
+        ...,
+        description="The time recent orders spent in the stage, in seconds, weighted towards the latest orders."
+    )
+
+
+class OrderPipelineStats(BaseModel):
+    running: bool = Field(
+        ...,
+        description="Whether the order pipeline takes orders."
+    )
+    capacity: int = Field(
+        ...,
+        description="How many orders the pipeline can hold before it turns orders away."
+    )
+    pending: int = Field(
+        ...,
+        description="How many orders are waiting or being processed."
+    )
+    workers: int = Field(
+        ...,
+        description="How many pricing and how many persistence tasks the pipeline runs."
+    )
+    stages: list[StageLatency] = Field(
+        ...,
+        description="The latency of every stage, in the order orders go through them."
+    )
@@ -0,0 +1,16 @@
+from pydantic import BaseModel
+from pydantic import Field
+
+from app.api.schemas.drinks import Drink
+from app.api.schemas.toppings import Topping
+
+
+class CatalogSearchResults(BaseModel):
+    drinks: list[Drink] = Field(
+        [],
+        description="The matching drinks."
+    )
+    toppings: list[Topping] = Field(
+        [],
+        description="The matching toppings."
+    )
@@ -38,4 +38,11 @@ class ToppingUpdate(BaseModel):
         None,
         gt=0,
         description="The new price of the topping. If not provided, the current price will remain unchanged."
-    )
\ No newline at end of file
+    )
+
+
+class ToppingImport(ToppingBase):
+    id: int | None = Field(
+        None,
+        description="The ID of the topping to replace. If not provided, a new topping is created."
+    )
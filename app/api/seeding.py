@@ -0,0 +1,162 @@
+import argparse
+import json
+import logging
+import sys
+from typing import Iterable
+
+from app.api.crud_operations.drink_operations import DRINKS
+from app.api.crud_operations.drink_operations import DRINKS_SNAPSHOT
+from app.api.crud_operations.drink_operations import initialize_default_drinks_on_startup
+from app.api.crud_operations.order_operations import close_order_journal
+from app.api.crud_operations.order_operations import get_order_columns
+from app.api.crud_operations.order_operations import load_order_columns
+from app.api.crud_operations.order_operations import open_order_journal
+from app.api.crud_operations.topping_operations import TOPPINGS
+from app.api.crud_operations.topping_operations import TOPPINGS_SNAPSHOT
+from app.api.crud_operations.topping_operations import initialize_default_toppings_on_startup
+from app.api.storage.base import Repository
+from app.api.storage.base import T
+from app.api.storage.binary_snapshot import SnapshotFile
+from app.api.storage.binary_snapshot import write_snapshot
+from app.api.storage.snapshots import SnapshotPublisher
+from app.config import settings
+from app.models.drinks import Drink
+from app.models.toppings import Topping
+
+logger = logging.getLogger(__name__)
+
+
+def load_seed_file(path: str) -> tuple[list[Drink], list[Topping]]:
+    """
+    Read the drinks and toppings of a catalog snapshot file.
+
+    The file is JSON, e.g.:
+
+        {"drinks": [{"id": 1, "name": "Black Coffee", "price": 4, "toppings": []}],
+         "toppings": [{"id": 1, "name": "Milk", "price": 2}]}
+
+    Args:
+
+        path (str): The path of the snapshot file.
+
+    Returns:
+
+        tuple[list[Drink], list[Topping]]: The drinks and the toppings.
+    """
+    with open(path) as file:
+        catalog = json.load(file)
+
+    drinks = [Drink(id=drink["id"], name=drink["name"], price=drink["price"], toppings=drink.get("toppings"))
+              for drink in catalog.get("drinks", [])]
+    toppings = [Topping(id=topping["id"], name=topping["name"], price=topping["price"])
+                for topping in catalog.get("toppings", [])]
+
+    return drinks, toppings
+
+
+def seed_items(repository: Repository[T], publisher: SnapshotPublisher[T], items: Iterable[T]) -> int:
+    """
+    Add the items which do not exist yet, and publish a new snapshot. Items which already exist are left untouched,
+    so seeding again changes nothing.
+
+    Returns:
+
+        int: How many items were added.
+    """
+    added = 0
+    for item in items:
+        if item.id not in repository:
+            repository.add(item)
+            added += 1
+    publisher.publish()
+
+    return added
+
+
+def seed_catalog(seed_file: str | None = None) -> None:
+    """
+    Seed the drinks and toppings on startup, from a snapshot file if given, or else with the default catalog.
+
+    Args:
+
+        seed_file (str | None): The path of a catalog snapshot file. Default is None, which seeds the default catalog.
+    """
+    if not seed_file:
+        logger.info("Seeding the default catalog.")
+        initialize_default_drinks_on_startup()
+        initialize_default_toppings_on_startup()
+        return
+
+    drinks, toppings = load_seed_file(seed_file)
+    added_drinks = seed_items(DRINKS, DRINKS_SNAPSHOT, drinks)
+    added_toppings = seed_items(TOPPINGS, TOPPINGS_SNAPSHOT, toppings)
+    logger.info("Seeded %s drinks and %s toppings from %s.", added_drinks, added_toppings, seed_file)
+
+
+def load_snapshot_file(path: str) -> None:
+    """
+    Seed the drinks and toppings, and load the orders, of a binary snapshot file written by "write_snapshot_file".
+
+    The file is memory-mapped. The catalog is small, so its items are created as usual, but in-memory orders are used
+    in place: startup reads next to nothing from disk, and the pages of the order history are shared by every worker
+    process which maps the same file.
+
+    Args:
+
+        path (str): The path of the snapshot file.
+    """
+    snapshot = SnapshotFile(path)
+    added_drinks = seed_items(DRINKS, DRINKS_SNAPSHOT, snapshot.drinks())
+    added_toppings = seed_items(TOPPINGS, TOPPINGS_SNAPSHOT, snapshot.toppings())
+    order_columns = snapshot.order_columns()
+    loaded_orders = 0 if order_columns is None else load_order_columns(order_columns)
+    logger.info("Seeded %s drinks and %s toppings, and loaded %s orders from %s.", added_drinks, added_toppings,
+                loaded_orders, path)
+
+
+def write_snapshot_file(path: str) -> None:
+    """
+    Write the stored drinks, toppings and orders to a binary snapshot file, to be loaded on startup.
+
+    Args:
+
+        path (str): The path of the snapshot file.
+    """
+    drinks = sorted(DRINKS, key=lambda drink: drink.id)
+    toppings = sorted(TOPPINGS, key=lambda topping: topping.id)
+    orders = get_order_columns()
+    write_snapshot(path, drinks, toppings, orders)
+    logger.info("Wrote %s drinks, %s toppings and %s orders to %s.", len(drinks), len(toppings), len(orders.ids),
+                path)
+
+
+def main(argv: list[str] | None = None) -> int:
+    """
+    Write a binary snapshot file of the configured storage, e.g.:
+
+        python -m app.api.seeding --output catalog.snapshot --journal-dir journal/
+
+    The data is loaded as on startup first, from COFFEE_STORE_SNAPSHOT_FILE, or else by seeding the catalog, and
+    in-memory orders are read from an order journal, if given.
+    """
+    parser = argparse.ArgumentParser(description="Write a binary snapshot file of the coffee store data.")
+    parser.add_argument("--output", required=True, help="The path of the snapshot file to write.")
+    parser.add_argument("--journal-dir", default=settings.journal_dir,
+                        help="An order journal to read in-memory orders from. Default is COFFEE_STORE_JOURNAL_DIR.")
+    args = parser.parse_args(argv)
+
+    if settings.snapshot_file:
+        load_snapshot_file(settings.snapshot_file)
+    else:
+        seed_catalog(settings.seed_file)
+    if args.journal_dir and settings.storage_backend == "memory":
+        open_order_journal(args.journal_dir)
+        close_order_journal()
+    write_snapshot_file(args.output)
+
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
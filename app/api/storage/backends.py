@@ -0,0 +1,52 @@
+from typing import Callable
+
+from app.api.storage.base import Repository
+from app.api.storage.base import T
+from app.api.storage.memory import InMemoryRepository
+from app.api.storage.sqlite import SQLiteConnectionPool
+from app.api.storage.sqlite import SQLiteRepository
+from app.api.storage.sqlite import Table
+from app.config import settings
+
+STORAGE_BACKENDS = ("memory", "sqlite")
+
+# The SQLite connection pool is shared by every repository of the worker process. Its connections are only opened,
+# and its tables only created, when it is first used, e.g. by the seeding on startup.
+_sqlite_pool: SQLiteConnectionPool | None = None
+
+
+def get_sqlite_pool() -> SQLiteConnectionPool:
+    """
+    Get the SQLite connection pool of this worker process, creating it on first use.
+    """
+    global _sqlite_pool
+    if _sqlite_pool is None:
+        _sqlite_pool = SQLiteConnectionPool(settings.sqlite_path, size=settings.sqlite_pool_size)
+
+    return _sqlite_pool
+
+
+def create_repository(table: Table[T],
+                      backend: str | None = None,
+                      memory_factory: Callable[[], Repository[T]] = InMemoryRepository) -> Repository[T]:
+    """
+    Create a repository for one kind of item, using the configured storage backend.
+
+    Args:
+
+        table (Table[T]): How the items are stored in SQLite. Unused by the in-memory backend.
+        backend (str | None): The storage backend to use. Default is None, which uses the configured backend.
+        memory_factory (Callable[[], Repository[T]]): Creates the repository of the in-memory backend. Default is
+            InMemoryRepository.
+
+    Returns:
+
+        Repository[T]: The repository.
+    """
+    backend = backend or settings.storage_backend
+    if backend == "memory":
+        return memory_factory()
+    if backend == "sqlite":
+        return SQLiteRepository(get_sqlite_pool(), table, id_block_size=settings.id_block_size)
+
+    raise ValueError(f"Unknown storage backend {backend!r}, expected one of {', '.join(STORAGE_BACKENDS)}")
@@ -0,0 +1,99 @@
+from abc import ABC
+from abc import abstractmethod
+from typing import Callable
+from typing import Generic
+from typing import Iterable
+from typing import Iterator
+from typing import TypeVar
+
+# Any model stored in a repository must expose an integer "id" attribute.
+T = TypeVar("T")
+
+
+class Repository(ABC, Generic[T]):
+    """
+    The interface every storage backend implements, for one kind of item (drinks, toppings or orders).
+
+    Items are kept in ID order, which is also the order they were created in.
+    """
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+    @abstractmethod
+    def __iter__(self) -> Iterator[T]:
+        ...
+
+    @abstractmethod
+    def __contains__(self, item_id: int) -> bool:
+        ...
+
+    @abstractmethod
+    def version(self) -> int:
+        """
+        Get a number which changes whenever an item is added, replaced or deleted.
+        """
+
+    @abstractmethod
+    def allocate_id(self) -> int:
+        """
+        Allocate a new ID for an item which is about to be added. IDs are never reused, even after a delete.
+        """
+
+    @abstractmethod
+    def get(self, item_id: int) -> T | None:
+        """
+        Get an item by its ID, or None if it does not exist.
+        """
+
+    @abstractmethod
+    def get_many(self, item_ids: Iterable[int]) -> dict[int, T]:
+        """
+        Get several items in one call. IDs that do not exist are left out of the result.
+        """
+
+    @abstractmethod
+    def add(self, item: T) -> T:
+        """
+        Add an item, or replace the item already stored under the same ID.
+        """
+
+    def add_new(self, factory: Callable[[int], T]) -> T:
+        """
+        Allocate an ID and add the item the factory creates with it. Backends which keep items in ID order do both in
+        one step, so items created at the same time are still added in ID order.
+        """
+        return self.add(factory(self.allocate_id()))
+
+    def add_many(self, items: Iterable[T]) -> list[T]:
+        """
+        Add or replace several items in one write. Backends which can do so write them atomically, so the items are
+        either all stored or none are; this default adds them one at a time.
+        """
+        return [self.add(item) for item in items]
+
+    @abstractmethod
+    def delete(self, item_id: int) -> T | None:
+        """
+        Delete an item by its ID, returning it, or None if it does not exist.
+        """
+
+    @abstractmethod
+    def page(self, skip: int = 0, limit: int = 10) -> list[T]:
+        """
+        Get a page of items in ID order.
+        """
+
+    @abstractmethod
+    def page_after(self, after_id: int = 0, limit: int = 10) -> list[T]:
+        """
+        Get a page of items in ID order, starting right after the given ID. Unlike "page", this does not have to
+        go through the skipped items, and is not shifted by items deleted from earlier pages.
+        """
+
+    @abstractmethod
+    def clear(self) -> None:
+        """
+        Remove every item. The ID counter is kept, so IDs are still never reused.
+        """
@@ -0,0 +1,178 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import Iterable
+
+from app.api.storage.columnar import COLUMN_TYPECODES
+from app.api.storage.columnar import OrderColumns
+from app.models.drinks import Drink
+from app.models.money import from_cents
+from app.models.toppings import Topping
+
+# A snapshot file starts with a header: the magic bytes, the format version and the number of sections. A table of
+# sections follows, each with its name, type code, offset in the file and number of items. Every section is a
+# fixed-width little-endian column, starting at a multiple of 8 bytes, so it can be used in place once mapped.
+SNAPSHOT_MAGIC = b"COFFSNAP"
+SNAPSHOT_VERSION = 1
+HEADER = struct.Struct("<8sII")
+SECTION = struct.Struct("<32sc7xQQ")
+ALIGNMENT = 8
+
+
+def _string_table(strings: Iterable[str]) -> tuple[array, bytes]:
+    """
+    Encode strings as one UTF-8 blob, and the offsets of where each starts, with the end of the last one at the end.
+    """
+    offsets = array("q", [0])
+    encoded = bytearray()
+    for string in strings:
+        encoded += string.encode()
+        offsets.append(len(encoded))
+    return offsets, bytes(encoded)
+
+
+def write_snapshot(path: str,
+                   drinks: Iterable[Drink],
+                   toppings: Iterable[Topping],
+                   orders: OrderColumns | None = None) -> None:
+    """
+    Write the drinks, toppings and orders to a snapshot file. The file is written under a temporary name and renamed
+    once complete, so readers never see half a snapshot.
+
+    Args:
+
+        path (str): The path of the snapshot file.
+        drinks (Iterable[Drink]): The drinks.
+        toppings (Iterable[Topping]): The toppings.
+        orders (OrderColumns | None): The orders, without deleted rows. Default is None, which writes no orders.
+    """
+    drinks = list(drinks)
+    toppings = list(toppings)
+    drink_name_offsets, drink_names = _string_table(drink.name for drink in drinks)
+    topping_name_offsets, topping_names = _string_table(topping.name for topping in toppings)
+    drink_topping_offsets = array("q", [0])
+    drink_toppings = array("i")
+    for drink in drinks:
+        drink_toppings.extend(drink.toppings)
+        drink_topping_offsets.append(len(drink_toppings))
+
+    # The type code and the items of every section, keyed by name.
+    sections = {
+        "drinks.ids": ("q", array("q", (drink.id for drink in drinks))),
+        "drinks.price_cents": ("q", array("q", (drink.price_cents for drink in drinks))),
+        "drinks.name_offsets": ("q", drink_name_offsets),
+        "drinks.names": ("B", drink_names),
+        "drinks.topping_offsets": ("q", drink_topping_offsets),
+        "drinks.toppings": ("i", drink_toppings),
+        "toppings.ids": ("q", array("q", (topping.id for topping in toppings))),
+        "toppings.price_cents": ("q", array("q", (topping.price_cents for topping in toppings))),
+        "toppings.name_offsets": ("q", topping_name_offsets),
+        "toppings.names": ("B", topping_names),
+    }
+    if orders is not None:
+        for name, typecode in COLUMN_TYPECODES.items():
+            sections[f"orders.{name}"] = (typecode, getattr(orders, name))
+
+    offset = HEADER.size + SECTION.size * len(sections)
+    table = []
+    for name, (typecode, column) in sections.items():
+        offset += -offset % ALIGNMENT
+        table.append(SECTION.pack(name.encode(), typecode.encode(), offset, len(column)))
+        offset += len(column) * struct.calcsize(typecode)
+
+    with open(path + ".tmp", "wb") as file:
+        file.write(HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(sections)))
+        file.write(b"".join(table))
+        for _, column in sections.values():
+            file.write(b"\0" * (-file.tell() % ALIGNMENT))
+            if isinstance(column, array) and sys.byteorder != "little":
+                column = column[:]
+                column.byteswap()
+            file.write(column)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(path + ".tmp", path)
+
+
+class SnapshotFile:
+    """
+    A snapshot file opened with mmap. Its columns are read-only memoryviews into the mapping, so opening it reads
+    nothing but the header, and the pages of the file are loaded on first use and shared by every process which maps
+    the same file, e.g. forked uvicorn workers.
+
+    Raises:
+
+        ValueError: If the file is not a snapshot, or of another version.
+    """
+
+    def __init__(self, path: str):
+        # The columns are used in place, which only works where they are in the byte order of the file.
+        if sys.byteorder != "little":
+            raise ValueError("Snapshot files can only be mapped on little-endian machines")
+        self.path = path
+        with open(path, "rb") as file:
+            # The mapping stays valid after the file is closed.
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < HEADER.size:
+            raise ValueError(f"{path} is not a snapshot file")
+        magic, version, section_count = HEADER.unpack_from(self._map)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} is not a snapshot file")
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f"{path} is a snapshot of version {version}, expected version {SNAPSHOT_VERSION}")
+
+        self._sections = {}
+        for index in range(section_count):
+            name, typecode, offset, count = SECTION.unpack_from(self._map, HEADER.size + index * SECTION.size)
+            self._sections[name.rstrip(b"\0").decode()] = (typecode.decode(), offset, count)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._sections
+
+    def column(self, name: str) -> memoryview:
+        """
+        Get a column by its section name, as a read-only memoryview of its type.
+        """
+        typecode, offset, count = self._sections[name]
+        view = memoryview(self._map)[offset:offset + count * struct.calcsize(typecode)]
+        return view if typecode == "B" else view.cast(typecode)
+
+    def _strings(self, prefix: str) -> list[str]:
+        offsets = self.column(f"{prefix}.name_offsets")
+        names = self.column(f"{prefix}.names")
+        return [str(names[offsets[index]:offsets[index + 1]], "utf-8") for index in range(len(offsets) - 1)]
+
+    def drinks(self) -> list[Drink]:
+        """
+        Create the drinks of the snapshot.
+        """
+        names = self._strings("drinks")
+        topping_offsets = self.column("drinks.topping_offsets")
+        toppings = self.column("drinks.toppings")
+        return [Drink(id=drink_id, name=name, price=from_cents(price_cents),
+                      toppings=toppings[topping_offsets[index]:topping_offsets[index + 1]].tolist())
+                for index, (drink_id, name, price_cents) in enumerate(zip(self.column("drinks.ids"), names,
+                                                                          self.column("drinks.price_cents")))]
+
+    def toppings(self) -> list[Topping]:
+        """
+        Create the toppings of the snapshot.
+        """
+        return [Topping(id=topping_id, name=name, price=from_cents(price_cents))
+                for topping_id, name, price_cents in zip(self.column("toppings.ids"), self._strings("toppings"),
+                                                         self.column("toppings.price_cents"))]
+
+    def order_columns(self) -> OrderColumns | None:
+        """
+        Get the orders of the snapshot as columns viewing the mapping, without copying them, or None if the snapshot
+        has no orders.
+        """
+        if "orders.ids" not in self._sections:
+            return None
+
+        columns = OrderColumns()
+        for name in COLUMN_TYPECODES:
+            setattr(columns, name, self.column(f"orders.{name}"))
+        return columns
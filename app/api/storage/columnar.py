@@ -0,0 +1,420 @@
+import threading
+from array import array
+from bisect import bisect_left
+from bisect import bisect_right
+from datetime import datetime
+from datetime import timezone
+from typing import Callable
+from typing import Iterable
+from typing import Iterator
+
+from app.api.storage.base import Repository
+from app.api.storage.ids import CounterIdAllocator
+from app.models.money import Cents
+from app.models.money import cents_array
+from app.models.orders import Order
+
+# How many orders are materialized at a time while iterating over all of them.
+ITERATION_BATCH_SIZE = 1000
+# The type code of every column. A column is either an array, or a read-only memoryview of the same type, e.g. of a
+# memory-mapped snapshot file.
+COLUMN_TYPECODES = {
+    "ids": "q",
+    "total_cents": "q",
+    "discounted_cents": "q",
+    "created_at": "d",
+    "deleted": "B",
+    "drink_line_offsets": "q",
+    "topping_line_offsets": "q",
+    "drink_offsets": "q",
+    "topping_offsets": "q",
+    "drink_ids": "i",
+    "topping_ids": "i",
+}
+
+
+def _copy_column(column, typecode: str) -> array | bytearray:
+    if typecode == "B":
+        return bytearray(column)
+    copy = array(typecode)
+    # A memoryview is copied as raw bytes, which is a memory copy rather than a loop over its items.
+    copy.frombytes(column.cast("B") if isinstance(column, memoryview) else column.tobytes())
+    return copy
+
+
+def _shifted(offsets, shift: int) -> array:
+    if shift == 0:
+        return array("q", offsets)
+    return array("q", [offset + shift for offset in offsets])
+
+
+class OrderColumns:
+    """
+    Orders stored column by column in typed arrays. Each order is a row, and rows are kept in ID order.
+
+    The nested ID lists of all orders are flattened into one array of drink IDs and one of topping IDs. Offset arrays
+    mark where the lines of each order start, and where the IDs of each line start. The drink and topping lines are
+    counted separately, as an order can have fewer topping lines than drink lines.
+    """
+
+    def __init__(self):
+        # One item per order.
+        self.ids = array("q")
+        self.total_cents = cents_array()
+        self.discounted_cents = cents_array()
+        self.created_at = array("d")
+        self.deleted = bytearray()
+        # One more item than there are orders, and lines.
+        self.drink_line_offsets = array("q", [0])
+        self.topping_line_offsets = array("q", [0])
+        self.drink_offsets = array("q", [0])
+        self.topping_offsets = array("q", [0])
+        # The IDs of every line of every order, one after another.
+        self.drink_ids = array("i")
+        self.topping_ids = array("i")
+
+    def append(self, order: Order) -> None:
+        """
+        Append an order, which must have a higher ID than every order stored so far.
+        """
+        for lines, line_offsets, offsets, values in (
+            (order.drink_ids, self.drink_line_offsets, self.drink_offsets, self.drink_ids),
+            (order.topping_ids, self.topping_line_offsets, self.topping_offsets, self.topping_ids),
+        ):
+            for line in lines:
+                values.extend(line)
+                offsets.append(len(values))
+            line_offsets.append(len(offsets) - 1)
+        self.total_cents.append(order.total_cents)
+        self.discounted_cents.append(order.discounted_cents)
+        self.created_at.append(order.created_at.timestamp())
+        self.deleted.append(0)
+        # The ID is appended last, so a row can only be found once all of its columns are written.
+        self.ids.append(order.id)
+
+    def extend_rows(self, source: "OrderColumns", start: int, end: int) -> None:
+        """
+        Append the rows from "start" up to "end" of other columns, without materializing them. Every column is
+        copied as one slice, and only the offsets of the copied lines are shifted one by one.
+        """
+        if start >= end:
+            return
+        for name in ("drink", "topping"):
+            line_offsets = getattr(self, f"{name}_line_offsets")
+            offsets = getattr(self, f"{name}_offsets")
+            values = getattr(self, f"{name}_ids")
+            source_line_offsets = getattr(source, f"{name}_line_offsets")
+            source_offsets = getattr(source, f"{name}_offsets")
+            first_line = source_line_offsets[start]
+            end_line = source_line_offsets[end]
+            first_value = source_offsets[first_line]
+            # The copied lines and IDs start where those of these columns end.
+            line_shift = len(offsets) - 1 - first_line
+            value_shift = len(values) - first_value
+            values.extend(getattr(source, f"{name}_ids")[first_value:source_offsets[end_line]])
+            offsets.extend(_shifted(source_offsets[first_line + 1:end_line + 1], value_shift))
+            line_offsets.extend(_shifted(source_line_offsets[start + 1:end + 1], line_shift))
+        self.total_cents.extend(source.total_cents[start:end])
+        self.discounted_cents.extend(source.discounted_cents[start:end])
+        self.created_at.extend(source.created_at[start:end])
+        self.deleted.extend(bytes(end - start))
+        self.ids.extend(source.ids[start:end])
+
+    def copy(self) -> "OrderColumns":
+        """
+        Copy the columns into new arrays, e.g. to read them while orders are still being appended to the original, or
+        to change columns which are read-only views of a snapshot file.
+        """
+        columns = OrderColumns()
+        for name in COLUMN_TYPECODES:
+            setattr(columns, name, _copy_column(getattr(self, name), COLUMN_TYPECODES[name]))
+        return columns
+
+    @classmethod
+    def joined(cls, first: "OrderColumns", second: "OrderColumns") -> "OrderColumns":
+        """
+        Join two sets of columns into new arrays, the rows of the second after the rows of the first. The offsets of
+        the second are shifted past the lines and IDs of the first, which only loops over the second.
+        """
+        columns = first.copy()
+        for name in ("ids", "total_cents", "discounted_cents", "created_at", "deleted", "drink_ids", "topping_ids"):
+            getattr(columns, name).extend(getattr(second, name))
+        for name in ("drink_line_offsets", "topping_line_offsets", "drink_offsets", "topping_offsets"):
+            offsets = getattr(columns, name)
+            shift = offsets[-1]
+            offsets.extend(offset + shift for offset in getattr(second, name)[1:])
+        return columns
+
+    def find(self, order_id: int) -> int | None:
+        """
+        Find the row of an order by its ID, or None if it does not exist.
+        """
+        row = bisect_left(self.ids, order_id)
+        if row < len(self.ids) and self.ids[row] == order_id and not self.deleted[row]:
+            return row
+        return None
+
+    def materialize(self, row: int) -> Order:
+        """
+        Create the Order object of a row.
+        """
+        return Order(
+            id=self.ids[row],
+            drink_ids=self._lines(row, self.drink_line_offsets, self.drink_offsets, self.drink_ids),
+            topping_ids=self._lines(row, self.topping_line_offsets, self.topping_offsets, self.topping_ids),
+            total_cents=self.total_cents[row],
+            discounted_cents=self.discounted_cents[row],
+            created_at=datetime.fromtimestamp(self.created_at[row], timezone.utc),
+        )
+
+    @staticmethod
+    def _lines(row: int, line_offsets: array, offsets: array, values: array) -> list[list[int]]:
+        return [values[offsets[line]:offsets[line + 1]].tolist()
+                for line in range(line_offsets[row], line_offsets[row + 1])]
+
+
+class ColumnarOrderRepository(Repository[Order]):
+    """
+    An in-memory order repository storing orders in typed arrays, column by column, instead of as objects.
+
+    An Order object with its nested lists costs several hundred bytes. Here, an order with one drink and one topping
+    costs under a hundred, and Order objects are only created when orders are read.
+
+    New orders have the highest ID so far, so adding one is an append, and an order is found by bisecting the ID
+    column. "add_new" allocates the ID and appends under one lock, so concurrent orders stay in ID order. Replacing
+    an order, or adding one with a lower ID than the last, copies the columns around it, a slice per column; orders
+    are never changed once placed, so this only happens when restoring orders. Deleted orders are marked, and removed
+    from the columns the next time orders are added or paged.
+
+    The order history can be loaded as read-only base columns, e.g. memory-mapped from a snapshot file, so loading it
+    copies nothing, and its pages are shared by every worker process mapping the same file. New orders go to columns
+    after the base. The base is only copied into arrays when an order in it is replaced or deleted.
+
+    Changes are made under a lock, as FastAPI calls the repository from several threads. Reads take the same lock, as
+    an order spans several columns.
+    """
+
+    def __init__(self):
+        self._base: OrderColumns | None = None
+        self._columns = OrderColumns()
+        self._deleted_count = 0
+        self._id_allocator = CounterIdAllocator()
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return sum(len(columns.ids) for columns in self._parts()) - self._deleted_count
+
+    def __iter__(self) -> Iterator[Order]:
+        # Orders are materialized one batch at a time, so iterating over all orders does not hold them all in memory.
+        after_id = 0
+        while True:
+            batch = self.page_after(after_id=after_id, limit=ITERATION_BATCH_SIZE)
+            yield from batch
+            if len(batch) < ITERATION_BATCH_SIZE:
+                return
+            after_id = batch[-1].id
+
+    def __contains__(self, item_id: int) -> bool:
+        return self._locate(item_id) is not None
+
+    def version(self) -> int:
+        return self._version
+
+    def allocate_id(self) -> int:
+        return self._id_allocator.allocate()
+
+    def get(self, item_id: int) -> Order | None:
+        """
+        Get an order by its ID, or None if it does not exist.
+        """
+        with self._lock:
+            location = self._locate(item_id)
+            return None if location is None else location[0].materialize(location[1])
+
+    def get_many(self, item_ids: Iterable[int]) -> dict[int, Order]:
+        """
+        Get several orders in one call. IDs that do not exist are left out of the result.
+        """
+        found = {}
+        with self._lock:
+            for item_id in item_ids:
+                location = self._locate(item_id)
+                if location is not None:
+                    found[item_id] = location[0].materialize(location[1])
+
+        return found
+
+    def add(self, item: Order) -> Order:
+        """
+        Add an order, or replace the order already stored under the same ID.
+        """
+        with self._lock:
+            self._add(item)
+        self._id_allocator.observe(item.id)
+
+        return item
+
+    def add_new(self, factory: Callable[[int], Order]) -> Order:
+        """
+        Allocate an ID and add the order created with it in one step, under the lock, so orders created by
+        concurrent requests are always appended in ID order.
+        """
+        with self._lock:
+            item = factory(self._id_allocator.allocate())
+            self._add(item)
+
+        return item
+
+    def _add(self, item: Order) -> None:
+        # Called with the lock held.
+        if self._deleted_count:
+            self._compact()
+        # Orders after the base have higher IDs than every order in it.
+        if self._base is not None and len(self._base.ids) and item.id <= self._base.ids[-1]:
+            self._merge_base()
+        ids = self._columns.ids
+        if not ids or item.id > ids[-1]:
+            self._columns.append(item)
+        else:
+            # Keep the rows in ID order by copying the rows around the new order into new columns, a slice per
+            # column.
+            position = bisect_left(ids, item.id)
+            following = position + 1 if ids[position] == item.id else position
+            columns = OrderColumns()
+            columns.extend_rows(self._columns, 0, position)
+            columns.append(item)
+            columns.extend_rows(self._columns, following, len(ids))
+            self._columns = columns
+        self._version += 1
+
+    def delete(self, item_id: int) -> Order | None:
+        """
+        Delete an order by its ID, returning it, or None if it does not exist.
+        """
+        with self._lock:
+            if self._base is not None and self._base.find(item_id) is not None:
+                self._merge_base()
+            row = self._columns.find(item_id)
+            if row is None:
+                return None
+            order = self._columns.materialize(row)
+            self._columns.deleted[row] = 1
+            self._deleted_count += 1
+            self._version += 1
+
+        return order
+
+    def page(self, skip: int = 0, limit: int = 10) -> list[Order]:
+        """
+        Get a page of orders in ID order.
+        """
+        orders = []
+        with self._lock:
+            if self._deleted_count:
+                self._compact()
+            for columns in self._parts():
+                count = len(columns.ids)
+                if skip >= count:
+                    skip -= count
+                    continue
+                end = min(count, skip + limit - len(orders))
+                orders.extend(columns.materialize(row) for row in range(skip, end))
+                skip = 0
+                if len(orders) >= limit:
+                    break
+
+        return orders
+
+    def page_after(self, after_id: int = 0, limit: int = 10) -> list[Order]:
+        orders = []
+        with self._lock:
+            if self._deleted_count:
+                self._compact()
+            for columns in self._parts():
+                # The ID column is sorted, so the start of the page is found by bisection.
+                start = bisect_right(columns.ids, after_id)
+                end = min(start + limit - len(orders), len(columns.ids))
+                orders.extend(columns.materialize(row) for row in range(start, end))
+                if len(orders) >= limit:
+                    break
+
+        return orders
+
+    def amount_totals(self) -> tuple[Cents, Cents]:
+        """
+        Add up the total and the discounted amounts of all orders, in cents. The amount columns are arrays of machine
+        integers, so this is one sum over each column rather than a loop over orders.
+        """
+        with self._lock:
+            if self._deleted_count:
+                self._compact()
+            return (Cents(sum(sum(columns.total_cents) for columns in self._parts())),
+                    Cents(sum(sum(columns.discounted_cents) for columns in self._parts())))
+
+    def copy_columns(self) -> OrderColumns:
+        """
+        Copy the columns of every stored order, leaving out deleted ones, e.g. to aggregate them in bulk. The copy
+        is a few memory copies, and is not changed by orders added later.
+        """
+        with self._lock:
+            if self._deleted_count:
+                self._compact()
+            if self._base is not None:
+                return OrderColumns.joined(self._base, self._columns)
+            return self._columns.copy()
+
+    def load_base(self, columns: OrderColumns) -> None:
+        """
+        Replace every order with the orders of the given columns, without copying them, e.g. memory-mapped from a
+        snapshot file. The columns must not have deleted rows, and are never changed.
+        """
+        with self._lock:
+            self._base = columns
+            self._columns = OrderColumns()
+            self._deleted_count = 0
+            self._version += 1
+        if len(columns.ids):
+            self._id_allocator.observe(columns.ids[-1])
+
+    def clear(self) -> None:
+        """
+        Remove every order. The ID counter is kept, so IDs are still never reused.
+        """
+        with self._lock:
+            self._base = None
+            self._columns = OrderColumns()
+            self._deleted_count = 0
+            self._version += 1
+
+    def _parts(self) -> tuple[OrderColumns, ...]:
+        return (self._columns,) if self._base is None else (self._base, self._columns)
+
+    def _locate(self, item_id: int) -> tuple[OrderColumns, int] | None:
+        for columns in self._parts():
+            row = columns.find(item_id)
+            if row is not None:
+                return columns, row
+        return None
+
+    def _merge_base(self) -> None:
+        # Copy the base into arrays, so its orders can be changed.
+        self._columns = OrderColumns.joined(self._base, self._columns)
+        self._base = None
+
+    def _compact(self) -> None:
+        # Copy the runs of rows between deleted rows, a slice per column and run.
+        old = self._columns
+        columns = OrderColumns()
+        start = 0
+        while start < len(old.ids):
+            deleted_row = old.deleted.find(1, start)
+            end = len(old.ids) if deleted_row == -1 else deleted_row
+            columns.extend_rows(old, start, end)
+            if deleted_row == -1:
+                break
+            start = old.deleted.find(0, deleted_row)
+            if start == -1:
+                break
+        self._columns = columns
+        self._deleted_count = 0
@@ -0,0 +1,83 @@
+import threading
+from abc import ABC
+from abc import abstractmethod
+from typing import Callable
+
+
+class IdAllocator(ABC):
+    """
+    Hands out unique, increasing IDs for one kind of item. Safe to use from several threads at once.
+    """
+
+    @abstractmethod
+    def allocate(self) -> int:
+        """
+        Get a new ID, which has never been handed out before.
+        """
+
+    @abstractmethod
+    def observe(self, item_id: int) -> None:
+        """
+        Make sure an ID which was stored without being allocated, e.g. a default drink, is never handed out.
+        """
+
+
+class CounterIdAllocator(IdAllocator):
+    """
+    Allocates IDs from an in-process counter. Used when the items are only stored by this process.
+    """
+
+    def __init__(self, last_id: int = 0):
+        self._last_id = last_id
+        self._lock = threading.Lock()
+
+    def allocate(self) -> int:
+        with self._lock:
+            self._last_id += 1
+            return self._last_id
+
+    def observe(self, item_id: int) -> None:
+        with self._lock:
+            if item_id > self._last_id:
+                self._last_id = item_id
+
+
+class LeasedIdAllocator(IdAllocator):
+    """
+    Allocates IDs from blocks leased from storage shared by several worker processes.
+
+    Each worker leases a whole block of IDs at once, and hands them out locally without going back to the storage,
+    until the block is used up. IDs of a block which are not used before the worker stops are skipped, so IDs are
+    unique and increasing per worker, but not gapless, and not ordered by creation time across workers.
+    """
+
+    def __init__(self, lease: Callable[[int], range], block_size: int = 100):
+        """
+        Args:
+
+            lease (Callable[[int], range]): Atomically reserves the given number of IDs in the shared storage, and
+                returns them.
+            block_size (int): How many IDs are leased at once. Default is 100.
+        """
+        self._lease = lease
+        self._block_size = block_size
+        self._next_id = 1
+        self._block_end = 0
+        self._lock = threading.Lock()
+
+    def allocate(self) -> int:
+        with self._lock:
+            if self._next_id > self._block_end:
+                block = self._lease(self._block_size)
+                self._next_id, self._block_end = block.start, block.stop - 1
+            item_id = self._next_id
+            self._next_id += 1
+
+            return item_id
+
+    def observe(self, item_id: int) -> None:
+        # The shared storage keeps track of the highest stored ID, so new blocks never contain it. Only the rest of
+        # the current block has to be skipped past it.
+        with self._lock:
+            if self._next_id <= item_id <= self._block_end:
+                self._next_id = item_id + 1
@@ -0,0 +1,287 @@
+import re
+import sys
+import threading
+from bisect import bisect_left
+from bisect import bisect_right
+from bisect import insort
+from typing import Iterable
+
+# A word of a name or query: a run of letters and digits.
+TOKEN_PATTERN = re.compile(r"[^\W_]+")
+
+
+class ReferenceIndex:
+    """
+    A reverse index of references between items, e.g. from a topping ID to the IDs of the drinks which list it.
+
+    Each referring item is kept with the IDs it refers to, so replacing or removing it only touches its own entries.
+    Finding the items which refer to an ID is then one lookup, instead of a scan of every referring item.
+
+    Example:
+        >>> index = ReferenceIndex()
+        >>> index.set(1, [2, 3])
+        >>> index.referrers(3)
+        [1]
+    """
+
+    def __init__(self):
+        # The referring item IDs of every referenced ID, and the referenced IDs of every referring item.
+        self._referrers: dict[int, set[int]] = {}
+        self._references: dict[int, frozenset[int]] = {}
+        self._lock = threading.Lock()
+
+    def set(self, item_id: int, referenced_ids: Iterable[int]) -> None:
+        """
+        Set the IDs an item refers to, replacing those it referred to before.
+
+        Args:
+
+            item_id (int): The ID of the referring item.
+            referenced_ids (Iterable[int]): The IDs it refers to.
+        """
+        references = frozenset(referenced_ids)
+        with self._lock:
+            previous = self._references.get(item_id, frozenset())
+            for referenced_id in previous - references:
+                self._unlink(referenced_id, item_id)
+            for referenced_id in references - previous:
+                self._referrers.setdefault(referenced_id, set()).add(item_id)
+            if references:
+                self._references[item_id] = references
+            else:
+                self._references.pop(item_id, None)
+
+    def remove(self, item_id: int) -> None:
+        """
+        Remove an item, and every reference it made.
+        """
+        with self._lock:
+            for referenced_id in self._references.pop(item_id, frozenset()):
+                self._unlink(referenced_id, item_id)
+
+    def referrers(self, referenced_id: int) -> list[int]:
+        """
+        Get the IDs of the items which refer to an ID, in ID order.
+        """
+        with self._lock:
+            return sorted(self._referrers.get(referenced_id, ()))
+
+    def rebuild(self, references: Iterable[tuple[int, Iterable[int]]]) -> None:
+        """
+        Replace the whole index, e.g. on startup, or after other worker processes changed the referring items.
+
+        Args:
+
+            references (Iterable[tuple[int, Iterable[int]]]): The ID of every referring item, with the IDs it refers to.
+        """
+        index = ReferenceIndex()
+        for item_id, referenced_ids in references:
+            index.set(item_id, referenced_ids)
+        with self._lock:
+            self._referrers = index._referrers
+            self._references = index._references
+
+    def _unlink(self, referenced_id: int, item_id: int) -> None:
+        referrers = self._referrers[referenced_id]
+        referrers.discard(item_id)
+        if not referrers:
+            del self._referrers[referenced_id]
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Split a name or a search query into lowercase words, e.g. "Café Mocha-Latte" into ["café", "mocha", "latte"].
+    """
+    return TOKEN_PATTERN.findall(text.casefold())
+
+
+class SearchIndex:
+    """
+    Indexes of the names and prices of catalog items, to search them by name and price without going through every
+    item.
+
+    - A sorted array of (word, ID) pairs, in which the words starting with a prefix are found by bisection.
+    - An inverted index from every word to the IDs of the items whose name contains it.
+    - A sorted array of (price, ID) pairs, in which a price range is found by bisection.
+
+    Adding, replacing and removing an item inserts into and deletes from the sorted arrays, which moves memory, but
+    never sorts them again.
+
+    Example:
+        >>> index = SearchIndex()
+        >>> index.add(1, "Vanilla Latte", 550)
+        >>> index.search("lat")
+        [1]
+    """
+
+    def __init__(self):
+        self._words: list[tuple[str, int]] = []
+        self._postings: dict[str, set[int]] = {}
+        self._prices: list[tuple[int, int]] = []
+        # The words and the price of every item, to find its entries when it is replaced or removed.
+        self._items: dict[int, tuple[frozenset[str], int]] = {}
+        # Searches take the lock too, as the sorted arrays are changed in place.
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def add(self, item_id: int, name: str, price_cents: int) -> None:
+        """
+        Add an item, or replace the item already indexed under the same ID.
+
+        Args:
+
+            item_id (int): The ID of the item.
+            name (str): The name of the item.
+            price_cents (int): The price of the item, in cents.
+        """
+        words = frozenset(tokenize(name))
+        with self._lock:
+            self._remove(item_id)
+            for word in words:
+                insort(self._words, (word, item_id))
+                self._postings.setdefault(word, set()).add(item_id)
+            insort(self._prices, (price_cents, item_id))
+            self._items[item_id] = (words, price_cents)
+
+    def add_many(self, items: Iterable[tuple[int, str, int]]) -> None:
+        """
+        Add or replace several items, e.g. of a bulk import. The entries of the items are appended, and each sorted
+        array is sorted once, which for a sorted array with a tail of new entries takes little more than merging them,
+        instead of moving memory for every entry.
+
+        Args:
+
+            items (Iterable[tuple[int, str, int]]): The ID, name and price in cents of every item.
+        """
+        entries = {item_id: (frozenset(tokenize(name)), price_cents) for item_id, name, price_cents in items}
+        with self._lock:
+            replaced = entries.keys() & self._items.keys()
+            if replaced:
+                # Filtering the arrays once is cheaper than deleting the entries of the replaced items one by one.
+                self._words = [entry for entry in self._words if entry[1] not in replaced]
+                self._prices = [entry for entry in self._prices if entry[1] not in replaced]
+                for item_id in replaced:
+                    for word in self._items.pop(item_id)[0]:
+                        postings = self._postings[word]
+                        postings.discard(item_id)
+                        if not postings:
+                            del self._postings[word]
+            for item_id, (words, price_cents) in entries.items():
+                for word in words:
+                    self._words.append((word, item_id))
+                    self._postings.setdefault(word, set()).add(item_id)
+                self._prices.append((price_cents, item_id))
+                self._items[item_id] = (words, price_cents)
+            self._words.sort()
+            self._prices.sort()
+
+    def remove(self, item_id: int) -> None:
+        """
+        Remove an item, if it is indexed.
+        """
+        with self._lock:
+            self._remove(item_id)
+
+    def rebuild(self, items: Iterable[tuple[int, str, int]]) -> None:
+        """
+        Replace the whole index, sorting each array once, e.g. on startup.
+
+        Args:
+
+            items (Iterable[tuple[int, str, int]]): The ID, name and price in cents of every item.
+        """
+        words = []
+        postings = {}
+        prices = []
+        indexed = {}
+        for item_id, name, price_cents in items:
+            item_words = frozenset(tokenize(name))
+            for word in item_words:
+                words.append((word, item_id))
+                postings.setdefault(word, set()).add(item_id)
+            prices.append((price_cents, item_id))
+            indexed[item_id] = (item_words, price_cents)
+        words.sort()
+        prices.sort()
+        with self._lock:
+            self._words, self._postings, self._prices, self._items = words, postings, prices, indexed
+
+    def search(self,
+               query: str = "",
+               min_price_cents: int | None = None,
+               max_price_cents: int | None = None,
+               limit: int = 10) -> list[int]:
+        """
+        Find the items whose name has every word of the query, the last word only having to start the word of the
+        name, e.g. "vanilla lat" finds "Vanilla Latte". Items are returned in the order of the word matching the last
+        word of the query, or in price order without a query.
+
+        Candidates are taken in order from the word array, or from the price array without a query, and checked
+        against the other words and the price range until enough are found. Unless the filters reject most
+        candidates, a search looks at little more than the items it returns.
+
+        Args:
+
+            query (str): The words to search for. Default is "", which matches every item.
+            min_price_cents (int | None): The lowest price, in cents, if any. Default is None.
+            max_price_cents (int | None): The highest price, in cents, if any. Default is None.
+            limit (int): The maximum number of IDs to return. Default is 10.
+
+        Returns:
+
+            list[int]: The IDs of the matching items.
+        """
+        words = tokenize(query)
+        low = -sys.maxsize if min_price_cents is None else min_price_cents
+        high = sys.maxsize if max_price_cents is None else max_price_cents
+        found = []
+        with self._lock:
+            if not words:
+                start = bisect_left(self._prices, (low, -sys.maxsize))
+                end = bisect_right(self._prices, (high, sys.maxsize))
+                return [item_id for _, item_id in self._prices[start:min(end, start + limit)]]
+
+            # The whole words are checked against the smallest of their sets first, which rejects most candidates.
+            required = sorted((self._postings.get(word, set()) for word in words[:-1]), key=len)
+            if any(not item_ids for item_ids in required):
+                return []
+            smallest = required[0] if required else None
+            others = required[1:]
+            prefix = words[-1]
+            word_array = self._words
+            items = self._items
+            seen = set()
+            # The words starting with the prefix are one run of the word array.
+            start = bisect_left(word_array, (prefix, -sys.maxsize))
+            end = bisect_left(word_array, (prefix + "\U0010ffff", -sys.maxsize), start)
+            for position in range(start, end):
+                item_id = word_array[position][1]
+                if item_id in seen:
+                    continue
+                seen.add(item_id)
+                if smallest is not None and item_id not in smallest:
+                    continue
+                if others and not all(item_id in item_ids for item_ids in others):
+                    continue
+                if low <= items[item_id][1] <= high:
+                    found.append(item_id)
+                    if len(found) >= limit:
+                        break
+
+        return found
+
+    def _remove(self, item_id: int) -> None:
+        # Called with the lock held.
+        entry = self._items.pop(item_id, None)
+        if entry is None:
+            return
+        words, price_cents = entry
+        for word in words:
+            del self._words[bisect_left(self._words, (word, item_id))]
+            postings = self._postings[word]
+            postings.discard(item_id)
+            if not postings:
+                del self._postings[word]
+        del self._prices[bisect_left(self._prices, (price_cents, item_id))]
@@ -0,0 +1,400 @@
+import logging
+import os
+import struct
+import sys
+import threading
+import zlib
+from array import array
+from datetime import datetime
+from datetime import timezone
+from typing import Callable
+
+from app.api.metrics import Counter
+from app.api.metrics import timed
+from app.api.storage.columnar import ColumnarOrderRepository
+from app.api.storage.binary_snapshot import SnapshotFile
+from app.api.storage.binary_snapshot import write_snapshot
+from app.models.orders import Order
+
+logger = logging.getLogger(__name__)
+
+# Every record is its payload length and CRC-32, then the payload, little-endian.
+RECORD_HEADER = struct.Struct("<II")
+# The payload starts with the ID, the total and discounted amounts in cents, the creation time as a POSIX timestamp,
+# and the number of drink and topping lines. Then come the number of IDs of every line, and finally the IDs.
+ORDER_HEADER = struct.Struct("<qqqdHH")
+
+SEGMENT_SUFFIX = ".journal"
+SNAPSHOT_SUFFIX = ".snapshot"
+
+JOURNAL_COMMITS = Counter("order_journal_commits_total", "Group commits of the order journal, one fsync each.")
+JOURNAL_RECORDS = Counter("order_journal_records_total", "Orders written to the order journal.")
+
+
+class JournalError(Exception):
+    """
+    Raised when an order could not be written to the journal, and is therefore not durable.
+    """
+
+
+def _little_endian(values: array) -> bytes:
+    if sys.byteorder != "little":
+        values = values[:]
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_little_endian(typecode: str, data: memoryview) -> array:
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+
+def encode_order(order: Order) -> bytes:
+    """
+    Encode an order as a journal record: a length and checksum, then the order as packed binary numbers. An order
+    with one drink and two toppings takes 60 bytes.
+
+    Args:
+
+        order (Order): The order to encode.
+
+    Returns:
+
+        bytes: The record.
+    """
+    lines = order.drink_ids + order.topping_ids
+    payload = b"".join((
+        ORDER_HEADER.pack(order.id, order.total_cents, order.discounted_cents, order.created_at.timestamp(),
+                          len(order.drink_ids), len(order.topping_ids)),
+        _little_endian(array("H", map(len, lines))),
+        _little_endian(array("i", [item_id for line in lines for item_id in line])),
+    ))
+
+    return RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def decode_orders(data: bytes) -> tuple[list[Order], int]:
+    """
+    Decode the records of a journal segment. Decoding stops at the first incomplete or corrupt record, which is what
+    a crash in the middle of a write leaves behind.
+
+    Args:
+
+        data (bytes): The content of the segment.
+
+    Returns:
+
+        tuple[list[Order], int]: The orders, and how many bytes of the segment hold complete records.
+    """
+    orders = []
+    view = memoryview(data)
+    position = 0
+    while position + RECORD_HEADER.size <= len(view):
+        length, checksum = RECORD_HEADER.unpack_from(view, position)
+        start = position + RECORD_HEADER.size
+        payload = view[start:start + length]
+        if len(payload) < length or zlib.crc32(payload) != checksum:
+            break
+
+        order_id, total_cents, discounted_cents, timestamp, drink_lines, topping_lines = ORDER_HEADER.unpack_from(
+            payload)
+        line_count = drink_lines + topping_lines
+        lengths_end = ORDER_HEADER.size + 2 * line_count
+        lengths = _from_little_endian("H", payload[ORDER_HEADER.size:lengths_end])
+        item_ids = _from_little_endian("i", payload[lengths_end:]).tolist()
+        lines = []
+        offset = 0
+        for line_length in lengths:
+            lines.append(item_ids[offset:offset + line_length])
+            offset += line_length
+        orders.append(Order(id=order_id, drink_ids=lines[:drink_lines], topping_ids=lines[drink_lines:],
+                            total_cents=total_cents, discounted_cents=discounted_cents,
+                            created_at=datetime.fromtimestamp(timestamp, timezone.utc)))
+        position = start + length
+
+    return orders, position
+
+
+class OrderJournal:
+    """
+    An append-only journal of the orders of an in-memory order repository, so orders survive a crash or restart.
+
+    The journal is a directory of numbered segment files and snapshots. New orders are appended to the newest
+    segment. Every so many orders, the segment is closed, and a snapshot file of the order columns is written in the
+    background; a snapshot covers every segment with a lower number, which are then deleted. On startup, the newest
+    snapshot is loaded, and only the segments after it are replayed, so replay time stays bounded.
+
+    Orders are only added to the repository once they are durable, so readers never see an order which is not kept.
+    Appending uses group commit: the orders which arrive while an fsync is running are written together, and made
+    durable with the next fsync. When orders arrive together, the first of a commit also waits for the commit window,
+    so more orders can join it. Many orders per fsync keep the order rate well above the rate a disk can fsync at.
+    """
+
+    def __init__(self,
+                 directory: str,
+                 repository: ColumnarOrderRepository,
+                 commit_window: float = 0.002,
+                 snapshot_every: int = 100_000):
+        self.directory = directory
+        self.commit_window = commit_window
+        self.snapshot_every = snapshot_every
+        self._repository = repository
+        self._condition = threading.Condition()
+        # The records waiting for the next commit, with their orders, which are added to the repository once durable.
+        self._pending: list[tuple[bytes, Order]] = []
+        self._appended = 0
+        self._committed = 0
+        self._committing = False
+        self._last_batch_size = 0
+        self._error: OSError | None = None
+        self._since_snapshot = 0
+        self._snapshotting = False
+        self._segment = 0
+        self._file = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, number: int, suffix: str) -> str:
+        return os.path.join(self.directory, f"orders-{number:08d}{suffix}")
+
+    def _numbers(self, suffix: str) -> list[int]:
+        return sorted(int(name[len("orders-"):-len(suffix)]) for name in os.listdir(self.directory)
+                      if name.startswith("orders-") and name.endswith(suffix))
+
+    @timed("journal.replay")
+    def replay(self) -> int:
+        """
+        Load the newest snapshot and replay the segments after it into the repository, then start a new segment for
+        the orders to come. Must be called once, before orders are appended.
+
+        Returns:
+
+            int: The number of orders in the repository afterwards.
+        """
+        snapshots = self._numbers(SNAPSHOT_SUFFIX)
+        covered = snapshots[-1] if snapshots else 0
+        if snapshots:
+            # The snapshot is memory-mapped, so loading it copies nothing.
+            columns = SnapshotFile(self._path(covered, SNAPSHOT_SUFFIX)).order_columns()
+            if columns is not None:
+                self._repository.load_base(columns)
+
+        orders = []
+        segments = self._numbers(SEGMENT_SUFFIX)
+        for number in segments:
+            if number < covered:
+                continue
+            path = self._path(number, SEGMENT_SUFFIX)
+            with open(path, "rb") as file:
+                segment_orders, valid_length = decode_orders(file.read())
+            if valid_length < os.path.getsize(path):
+                logger.warning("Dropping an incomplete record at the end of %s.", path)
+                os.truncate(path, valid_length)
+            orders.extend(segment_orders)
+        # Orders are journaled in the order they are placed, which is not quite ID order. Adding them in ID order keeps
+        # the columns appending. The snapshot may already hold some of them.
+        for order in sorted(orders, key=lambda order: order.id):
+            if order.id not in self._repository:
+                self._repository.add(order)
+
+        self._segment = max(segments + snapshots, default=0) + 1
+        self._file = open(self._path(self._segment, SEGMENT_SUFFIX), "ab")
+        self._remove_covered(covered)
+        logger.info("Replayed %s orders from the order journal in %s.", len(self._repository), self.directory)
+
+        return len(self._repository)
+
+    def append(self, order: Order) -> None:
+        """
+        Write an order to the journal, and add it to the repository once it is durable. Returns once it is both.
+
+        Raises:
+
+            JournalError: If the journal could not be written. The order is not added, and the journal stops accepting
+                orders, as its segment may be damaged.
+        """
+        self._append(lambda: order)
+
+    def append_new(self, factory: Callable[[int], Order]) -> Order:
+        """
+        Allocate an ID and write the order the factory creates with it to the journal, then add the order to the
+        repository once it is durable. IDs are allocated in the order the orders are written, so orders placed at the
+        same time are still added in ID order.
+
+        Args:
+
+            factory (Callable[[int], Order]): Creates the order with the given ID.
+
+        Returns:
+
+            Order: The order, once it is durable and in the repository.
+
+        Raises:
+
+            JournalError: If the journal could not be written. The order is not added, and the journal stops accepting
+                orders, as its segment may be damaged.
+        """
+        return self._append(lambda: factory(self._repository.allocate_id()))
+
+    def _append(self, create: Callable[[], Order]) -> Order:
+        with self._condition:
+            if self._file is None:
+                raise JournalError("The order journal is not open")
+            if self._error is not None:
+                raise JournalError("The order journal cannot be written") from self._error
+            # The order is created and encoded while the condition is held, so records are queued in ID order.
+            order = create()
+            self._pending.append((encode_order(order), order))
+            self._appended += 1
+            sequence = self._appended
+            while self._committed < sequence:
+                if self._error is not None:
+                    raise JournalError("The order journal cannot be written") from self._error
+                if self._committing:
+                    self._condition.wait()
+                    continue
+                self._commit()
+            start_snapshot = (self._since_snapshot >= self.snapshot_every and not self._snapshotting)
+            if start_snapshot:
+                self._snapshotting = True
+
+        if start_snapshot:
+            threading.Thread(target=self._snapshot, name="order-journal-snapshot", daemon=True).start()
+
+        return order
+
+    def _commit(self) -> None:
+        # Called with the condition held, by the order which leads the next commit.
+        self._committing = True
+        # Waiting only pays off when orders arrive together, so a lone order is not held back. Orders which arrive
+        # during an fsync join the next commit either way.
+        if self.commit_window > 0 and self._last_batch_size > 1:
+            # Nobody else commits while this one waits, so only the timeout wakes it up.
+            self._condition.wait(self.commit_window)
+        batch, self._pending = self._pending, []
+        self._last_batch_size = len(batch)
+        committed = self._appended
+        file = self._file
+        error = None
+        # The disk is written without holding the condition, so new orders can queue up for the next commit.
+        self._condition.release()
+        try:
+            with timed("journal.commit"):
+                file.write(b"".join(record for record, _ in batch))
+                file.flush()
+                os.fsync(file.fileno())
+        except OSError as exception:
+            error = exception
+        finally:
+            self._condition.acquire()
+
+        self._committing = False
+        if error is None:
+            self._add_to_repository(batch)
+            self._committed = committed
+            self._since_snapshot += len(batch)
+            JOURNAL_COMMITS.inc()
+            JOURNAL_RECORDS.inc(amount=len(batch))
+        else:
+            logger.error("Writing the order journal failed: %s", error)
+            self._error = error
+            # The orders which queued up meanwhile fail too, as their appends raise once they see the error.
+            self._pending = []
+        self._condition.notify_all()
+
+    def _rotate(self) -> int:
+        """
+        Make every pending order durable, then start a new segment. Returns the number of the new segment.
+        """
+        with self._condition:
+            while self._committing:
+                self._condition.wait()
+            if self._file is None:
+                raise JournalError("The order journal is closed")
+            if self._error is not None:
+                raise JournalError("The order journal cannot be written") from self._error
+            # The orders waiting for the next commit are committed here, while the condition is held.
+            try:
+                self._file.write(b"".join(record for record, _ in self._pending))
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            except OSError as error:
+                self._error = error
+                self._pending = []
+                self._condition.notify_all()
+                raise JournalError("The order journal cannot be written") from error
+            self._add_to_repository(self._pending)
+            self._pending = []
+            self._committed = self._appended
+            self._condition.notify_all()
+            self._file.close()
+            self._segment += 1
+            self._file = open(self._path(self._segment, SEGMENT_SUFFIX), "ab")
+            self._since_snapshot = 0
+
+            return self._segment
+
+    def _add_to_repository(self, batch: list[tuple[bytes, Order]]) -> None:
+        # Called with the condition held, once the batch is durable.
+        for _, order in batch:
+            self._repository.add(order)
+
+    @timed("journal.snapshot")
+    def snapshot(self) -> None:
+        """
+        Write a snapshot of the repository, and remove the segments and snapshots it makes unnecessary.
+
+        Orders are added to the repository as soon as they are durable, while the condition is held, so once the
+        segment is rotated, the repository holds every order of the previous segments.
+        """
+        segment = self._rotate()
+        columns = self._repository.copy_columns()
+        path = self._path(segment, SNAPSHOT_SUFFIX)
+        # The snapshot is written under a temporary name, so a crash never leaves half a snapshot behind.
+        write_snapshot(path, drinks=[], toppings=[], orders=columns)
+        self._fsync_directory()
+        self._remove_covered(segment)
+        logger.info("Wrote an order journal snapshot of %s orders to %s.", len(columns.ids), path)
+
+    def _snapshot(self) -> None:
+        try:
+            self.snapshot()
+        except (OSError, JournalError):
+            logger.exception("Writing an order journal snapshot failed.")
+        finally:
+            with self._condition:
+                self._snapshotting = False
+
+    def _remove_covered(self, covered: int) -> None:
+        for number in self._numbers(SEGMENT_SUFFIX):
+            if number < covered:
+                os.remove(self._path(number, SEGMENT_SUFFIX))
+        for number in self._numbers(SNAPSHOT_SUFFIX):
+            if number < covered:
+                os.remove(self._path(number, SNAPSHOT_SUFFIX))
+
+    def _fsync_directory(self) -> None:
+        # Renames are only durable once the directory itself is synced. Not every platform can open a directory.
+        try:
+            directory = os.open(self.directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+    def close(self) -> None:
+        """
+        Make every pending order durable and close the current segment.
+        """
+        with self._condition:
+            # The order leading the next commit may still be waking up, so this checks again now and then. Once the
+            # journal cannot be written, nothing pending will be committed any more.
+            while (self._committing or self._pending) and self._error is None:
+                self._condition.wait(0.01)
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,155 @@
+import threading
+from bisect import bisect_right
+from bisect import insort
+from typing import Iterable
+from typing import Iterator
+
+from app.api.storage.base import Repository
+from app.api.storage.base import T
+from app.api.storage.ids import CounterIdAllocator
+
+
+class InMemoryRepository(Repository[T]):
+    """
+    An in-memory repository keeping items in a dict keyed by their ID, plus an ID-ordered ID sequence.
+
+    Lookups, updates and deletes are O(1). The ID sequence is used for stable paging; deleted IDs are removed
+    from it lazily, the next time a page is read, so a burst of deletes costs a single compaction. New IDs are
+    always the highest so far, so keeping the sequence in order is an append.
+
+    Reads of a single item are lock-free. Changes to the ID sequence are made under a lock, as FastAPI calls the
+    repository from several threads.
+    """
+
+    def __init__(self):
+        self._items: dict[int, T] = {}
+        self._ids: list[int] = []
+        # IDs that were deleted but still sit in the ID sequence.
+        self._removed: set[int] = set()
+        self._id_allocator = CounterIdAllocator()
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self) -> Iterator[T]:
+        with self._lock:
+            if self._removed:
+                self._compact()
+            ids = list(self._ids)
+        items = self._items
+
+        return iter([items[item_id] for item_id in ids if item_id in items])
+
+    def __contains__(self, item_id: int) -> bool:
+        return item_id in self._items
+
+    def version(self) -> int:
+        return self._version
+
+    def allocate_id(self) -> int:
+        return self._id_allocator.allocate()
+
+    def get(self, item_id: int) -> T | None:
+        """
+        Get an item by its ID, or None if it does not exist.
+        """
+        return self._items.get(item_id)
+
+    def get_many(self, item_ids: Iterable[int]) -> dict[int, T]:
+        """
+        Get several items in one call. IDs that do not exist are left out of the result.
+        """
+        items = self._items
+        found = {item_id: items.get(item_id) for item_id in item_ids}
+
+        return {item_id: item for item_id, item in found.items() if item is not None}
+
+    def add(self, item: T) -> T:
+        """
+        Add an item, or replace the item already stored under the same ID.
+        """
+        item_id = item.id
+        with self._lock:
+            self._put(item)
+            self._version += 1
+        self._id_allocator.observe(item_id)
+
+        return item
+
+    def add_many(self, items: Iterable[T]) -> list[T]:
+        """
+        Add or replace several items under one lock, as a single change of the version.
+        """
+        items = list(items)
+        with self._lock:
+            for item in items:
+                self._put(item)
+            self._version += 1
+        if items:
+            self._id_allocator.observe(max(item.id for item in items))
+
+        return items
+
+    def _put(self, item: T) -> None:
+        # Called with the lock held.
+        item_id = item.id
+        if item_id not in self._items:
+            if item_id in self._removed:
+                # The ID is still in the sequence from before it was deleted, so it keeps its old position.
+                self._removed.discard(item_id)
+            elif not self._ids or item_id > self._ids[-1]:
+                self._ids.append(item_id)
+            else:
+                insort(self._ids, item_id)
+        self._items[item_id] = item
+
+    def delete(self, item_id: int) -> T | None:
+        """
+        Delete an item by its ID, returning it, or None if it does not exist.
+        """
+        with self._lock:
+            item = self._items.pop(item_id, None)
+            if item is not None:
+                self._removed.add(item_id)
+                self._version += 1
+
+        return item
+
+    def page(self, skip: int = 0, limit: int = 10) -> list[T]:
+        """
+        Get a page of items in ID order.
+        """
+        with self._lock:
+            if self._removed:
+                self._compact()
+            ids = self._ids[skip:skip + limit]
+        items = self._items
+
+        return [items[item_id] for item_id in ids if item_id in items]
+
+    def page_after(self, after_id: int = 0, limit: int = 10) -> list[T]:
+        with self._lock:
+            if self._removed:
+                self._compact()
+            # The ID sequence is sorted, so the start of the page is found by bisection.
+            start = bisect_right(self._ids, after_id)
+            ids = self._ids[start:start + limit]
+        items = self._items
+
+        return [items[item_id] for item_id in ids if item_id in items]
+
+    def clear(self) -> None:
+        """
+        Remove every item. The ID counter is kept, so IDs are still never reused.
+        """
+        with self._lock:
+            self._items.clear()
+            self._ids.clear()
+            self._removed.clear()
+            self._version += 1
+
+    def _compact(self) -> None:
+        self._ids = [item_id for item_id in self._ids if item_id in self._items]
+        self._removed.clear()
@@ -0,0 +1,151 @@
+import logging
+import threading
+from bisect import bisect_right
+from typing import Callable
+from typing import Generic
+from typing import Iterable
+
+from app.api.storage.base import Repository
+from app.api.storage.base import T
+
+logger = logging.getLogger(__name__)
+
+
+class Snapshot(Generic[T]):
+    """
+    An immutable view of every item of a repository at one point in time, in ID order.
+
+    Items in a snapshot are never changed: updates replace an item with a new object instead. Readers can therefore
+    use a snapshot without any locking, while writers publish the next one.
+    """
+    __slots__ = ("version", "items", "ids")
+
+    def __init__(self, version: int, items: Iterable[T]):
+        self.version = version
+        self.items: tuple[T, ...] = tuple(items)
+        # The IDs of the items, in the same order, to find where a cursor-based page starts by bisection.
+        self.ids: tuple[int, ...] = tuple(item.id for item in self.items)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def page(self, skip: int = 0, limit: int = 10) -> list[T]:
+        """
+        Get a page of items in ID order.
+        """
+        return list(self.items[skip:skip + limit])
+
+    def page_after(self, after_id: int = 0, limit: int = 10) -> list[T]:
+        """
+        Get a page of items in ID order, starting right after the given ID.
+        """
+        start = bisect_right(self.ids, after_id)
+
+        return list(self.items[start:start + limit])
+
+    def select(self, skip: int = 0, limit: int = 10, after_id: int | None = None) -> list[T]:
+        """
+        Get a page of items either after the given ID, if provided, or else by skipping items.
+        """
+        if after_id is not None:
+            return self.page_after(after_id=after_id, limit=limit)
+
+        return self.page(skip=skip, limit=limit)
+
+
+class SnapshotPublisher(Generic[T]):
+    """
+    Keeps the latest snapshot of a repository, copy-on-write.
+
+    Writers call "publish" after changing the repository, which builds a new snapshot and swaps it in with a single
+    reference assignment. Readers take "current" and are never blocked by a writer. The first snapshot is only built
+    when it is first needed, so creating a publisher, e.g. on import, does not read the repository.
+    """
+
+    def __init__(self, repository: Repository[T]):
+        self._repository = repository
+        self._lock = threading.Lock()
+        self._subscribers: list[Callable[[Snapshot[T]], None]] = []
+        self._refresh_subscribers: list[Callable[[Snapshot[T]], None]] = []
+        self._current: Snapshot[T] | None = None
+
+    @property
+    def current(self) -> Snapshot[T]:
+        """
+        The latest snapshot, built from the repository on first use.
+        """
+        snapshot = self._current
+        if snapshot is None:
+            return self.publish()
+
+        return snapshot
+
+    def subscribe(self, callback: Callable[[Snapshot[T]], None], refreshes_only: bool = False) -> None:
+        """
+        Call the given function with every new snapshot, right after it is published, e.g. to drop cached responses.
+
+        With "refreshes_only", the function is only called with snapshots published by "refresh", which hold changes
+        made elsewhere, e.g. by another worker process. Changes made by this process are left to the writer itself.
+        """
+        if refreshes_only:
+            self._refresh_subscribers.append(callback)
+        else:
+            self._subscribers.append(callback)
+
+    def publish(self) -> Snapshot[T]:
+        """
+        Build a new snapshot from the repository, and make it the current one.
+        """
+        return self._publish(refreshed=False)
+
+    def refresh(self) -> Snapshot[T]:
+        """
+        Publish a new snapshot only if the repository changed since the current one, e.g. by another worker process.
+        """
+        if self._repository.version() != self.current.version:
+            return self._publish(refreshed=True)
+
+        return self.current
+
+    def _publish(self, refreshed: bool) -> Snapshot[T]:
+        with self._lock:
+            # The version is read before the items, so a write made in between makes the next refresh publish again.
+            version = self._repository.version()
+            snapshot = Snapshot(version, self._repository)
+            self._current = snapshot
+            for callback in self._subscribers:
+                callback(snapshot)
+            if refreshed:
+                for callback in self._refresh_subscribers:
+                    callback(snapshot)
+
+            return snapshot
+
+
+class SnapshotRefresher:
+    """
+    Refreshes snapshots in a background thread, so changes made by other worker processes to shared storage are
+    picked up without readers having to check the storage.
+    """
+
+    def __init__(self, publishers: Iterable[SnapshotPublisher], interval: float = 1.0):
+        self._publishers = list(publishers)
+        self._interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="snapshot-refresher", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self._interval):
+            for publisher in self._publishers:
+                try:
+                    publisher.refresh()
+                except Exception:
+                    # Keep serving the current snapshot, and try again on the next interval.
+                    logger.exception("Failed to refresh snapshot")
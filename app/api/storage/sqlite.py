@@ -0,0 +1,284 @@
+import json
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Callable
+from typing import Generic
+from typing import Iterable
+from typing import Iterator
+
+from app.api.storage.base import Repository
+from app.api.storage.base import T
+from app.api.storage.ids import LeasedIdAllocator
+
+# How many rows are read per query when iterating over a whole table.
+ITERATION_BATCH_SIZE = 500
+
+
+class Table(Generic[T]):
+    """
+    Describes how one kind of item is stored in an SQLite table.
+
+    Attributes:
+
+        name (str): The name of the table.
+        columns (tuple[str, ...]): The column definitions, apart from the "id" column which every table has.
+        to_row (Callable[[T], tuple]): Turns an item into a row of values, starting with its ID.
+        from_row (Callable[[tuple], T]): Turns a row of values, starting with the ID, back into an item.
+    """
+    name: str
+    columns: tuple[str, ...]
+    to_row: Callable[[T], tuple]
+    from_row: Callable[[tuple], T]
+
+    def __init__(self,
+                 name: str,
+                 columns: tuple[str, ...],
+                 to_row: Callable[[T], tuple],
+                 from_row: Callable[[tuple], T]):
+        self.name = name
+        self.columns = columns
+        self.to_row = to_row
+        self.from_row = from_row
+
+    @property
+    def column_names(self) -> list[str]:
+        return ["id"] + [column.split()[0] for column in self.columns]
+
+
+class SQLiteConnectionPool:
+    """
+    A small pool of SQLite connections to one database file, in WAL mode.
+
+    WAL lets readers carry on while another connection, possibly in another worker process, is writing. The
+    connections are only opened when the pool is first used, so creating a pool, e.g. on import, touches no file.
+    """
+
+    def __init__(self, path: str, size: int = 4):
+        self.path = path
+        self.size = size
+        self._connections: queue.Queue[sqlite3.Connection] = queue.Queue()
+        # The statements creating the tables of the repositories using the pool, run when the pool is opened.
+        self._schema: list[str] = []
+        self._opened = False
+        self._open_lock = threading.Lock()
+
+    def add_schema(self, statements: Iterable[str]) -> None:
+        """
+        Run the given statements, e.g. creating a table, in a write transaction once the pool is opened, or right
+        away if it is open already. The statements must be safe to run again, e.g. "CREATE TABLE IF NOT EXISTS".
+        """
+        statements = list(statements)
+        with self._open_lock:
+            self._schema.extend(statements)
+            opened = self._opened
+        if opened:
+            with self.transaction() as connection:
+                for statement in statements:
+                    connection.execute(statement)
+
+    def _open(self) -> None:
+        with self._open_lock:
+            if self._opened:
+                return
+            connections = [self._connect() for _ in range(self.size)]
+            with self._write_transaction(connections[0]):
+                for statement in self._schema:
+                    connections[0].execute(statement)
+            for connection in connections:
+                self._connections.put(connection)
+            self._opened = True
+
+    def _connect(self) -> sqlite3.Connection:
+        # The connections are shared between the threads of FastAPI's threadpool, one thread at a time. Autocommit
+        # mode is used, and writes which must be atomic open their own transaction.
+        connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None,
+                                     cached_statements=256)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA busy_timeout=5000")
+
+        return connection
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """
+        Borrow a connection from the pool, waiting for one to be returned if they are all in use.
+        """
+        if not self._opened:
+            self._open()
+        connection = self._connections.get()
+        try:
+            yield connection
+        finally:
+            self._connections.put(connection)
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Borrow a connection and run the statements made with it in a single write transaction.
+        """
+        with self.connection() as connection:
+            with self._write_transaction(connection):
+                yield connection
+
+    @staticmethod
+    @contextmanager
+    def _write_transaction(connection: sqlite3.Connection) -> Iterator[None]:
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def close(self) -> None:
+        while not self._connections.empty():
+            self._connections.get_nowait().close()
+
+
+class SQLiteRepository(Repository[T]):
+    """
+    A repository storing items in an SQLite table, with the ID as the integer primary key.
+
+    The ID column is SQLite's rowid, so the table itself is the index on ID. Every statement is built once, and
+    sqlite3 keeps it prepared per connection, so a query is only parsed the first time a connection runs it.
+
+    New IDs are leased in blocks from the "id_sequences" table, which is shared by every worker process using the
+    same database file.
+    """
+
+    def __init__(self, pool: SQLiteConnectionPool, table: Table[T], id_block_size: int = 100):
+        self._pool = pool
+        self._table = table
+        self._id_allocator = LeasedIdAllocator(self._lease_ids, block_size=id_block_size)
+
+        name = table.name
+        columns = ", ".join(table.column_names)
+        placeholders = ", ".join("?" for _ in table.column_names)
+        self._select_one = f"SELECT {columns} FROM {name} WHERE id = ?"
+        # The IDs are passed as one JSON array, so the statement is the same whatever the number of IDs.
+        self._select_many = f"SELECT {columns} FROM {name} WHERE id IN (SELECT value FROM json_each(?))"
+        self._select_page = f"SELECT {columns} FROM {name} ORDER BY id LIMIT ? OFFSET ?"
+        self._select_after = f"SELECT {columns} FROM {name} WHERE id > ? ORDER BY id LIMIT ?"
+        self._select_exists = f"SELECT 1 FROM {name} WHERE id = ?"
+        self._select_count = f"SELECT COUNT(*) FROM {name}"
+        # The highest ID ever stored is kept in a separate table, so a deleted ID is never handed out again.
+        self._insert_sequence = "INSERT OR IGNORE INTO id_sequences (name, last_id) VALUES (?, 0)"
+        self._lease_sequence = "UPDATE id_sequences SET last_id = last_id + ? WHERE name = ? RETURNING last_id"
+        self._update_last_id = ("INSERT INTO id_sequences (name, last_id) VALUES (?, ?) "
+                                "ON CONFLICT (name) DO UPDATE SET last_id = MAX(last_id, excluded.last_id)")
+        # Every write bumps the version of its table, so other worker processes can tell their view is outdated.
+        self._select_version = "SELECT version FROM table_versions WHERE name = ?"
+        self._update_version = ("INSERT INTO table_versions (name, version) VALUES (?, 1) "
+                                "ON CONFLICT (name) DO UPDATE SET version = version + 1")
+        self._insert = f"INSERT OR REPLACE INTO {name} ({columns}) VALUES ({placeholders})"
+        self._delete = f"DELETE FROM {name} WHERE id = ?"
+        self._delete_all = f"DELETE FROM {name}"
+
+        # The tables are created when the pool is first used, rather than when the repository is created.
+        pool.add_schema((
+            f"CREATE TABLE IF NOT EXISTS {name} (id INTEGER PRIMARY KEY, {', '.join(table.columns)})",
+            "CREATE TABLE IF NOT EXISTS id_sequences (name TEXT PRIMARY KEY, last_id INTEGER NOT NULL)",
+            "CREATE TABLE IF NOT EXISTS table_versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL)",
+        ))
+
+    def __len__(self) -> int:
+        with self._pool.connection() as connection:
+            return connection.execute(self._select_count).fetchone()[0]
+
+    def __iter__(self) -> Iterator[T]:
+        # Read the table in batches, so iterating over a large table does not load it all at once.
+        last_id = 0
+        while True:
+            with self._pool.connection() as connection:
+                rows = connection.execute(self._select_after, (last_id, ITERATION_BATCH_SIZE)).fetchall()
+            for row in rows:
+                yield self._table.from_row(row)
+            if len(rows) < ITERATION_BATCH_SIZE:
+                return
+            last_id = rows[-1][0]
+
+    def __contains__(self, item_id: int) -> bool:
+        with self._pool.connection() as connection:
+            return connection.execute(self._select_exists, (item_id,)).fetchone() is not None
+
+    def version(self) -> int:
+        with self._pool.connection() as connection:
+            row = connection.execute(self._select_version, (self._table.name,)).fetchone()
+
+        return 0 if row is None else row[0]
+
+    def allocate_id(self) -> int:
+        return self._id_allocator.allocate()
+
+    def _lease_ids(self, count: int) -> range:
+        # The write transaction makes the read and the update of the sequence atomic across worker processes.
+        with self._pool.transaction() as connection:
+            connection.execute(self._insert_sequence, (self._table.name,))
+            last_id = connection.execute(self._lease_sequence, (count, self._table.name)).fetchall()[0][0]
+
+        return range(last_id - count + 1, last_id + 1)
+
+    def get(self, item_id: int) -> T | None:
+        with self._pool.connection() as connection:
+            row = connection.execute(self._select_one, (item_id,)).fetchone()
+
+        return None if row is None else self._table.from_row(row)
+
+    def get_many(self, item_ids: Iterable[int]) -> dict[int, T]:
+        with self._pool.connection() as connection:
+            rows = connection.execute(self._select_many, (json.dumps(list(item_ids)),)).fetchall()
+
+        return {row[0]: self._table.from_row(row) for row in rows}
+
+    def add(self, item: T) -> T:
+        with self._pool.transaction() as connection:
+            connection.execute(self._insert, self._table.to_row(item))
+            connection.execute(self._update_last_id, (self._table.name, item.id))
+            connection.execute(self._update_version, (self._table.name,))
+        self._id_allocator.observe(item.id)
+
+        return item
+
+    def add_many(self, items: Iterable[T]) -> list[T]:
+        # One transaction for every item, so other worker processes see either all of them or none.
+        items = list(items)
+        if not items:
+            return items
+        with self._pool.transaction() as connection:
+            connection.executemany(self._insert, [self._table.to_row(item) for item in items])
+            connection.execute(self._update_last_id, (self._table.name, max(item.id for item in items)))
+            connection.execute(self._update_version, (self._table.name,))
+        self._id_allocator.observe(max(item.id for item in items))
+
+        return items
+
+    def delete(self, item_id: int) -> T | None:
+        with self._pool.transaction() as connection:
+            row = connection.execute(self._select_one, (item_id,)).fetchone()
+            if row is not None:
+                connection.execute(self._delete, (item_id,))
+                connection.execute(self._update_version, (self._table.name,))
+
+        return None if row is None else self._table.from_row(row)
+
+    def page(self, skip: int = 0, limit: int = 10) -> list[T]:
+        with self._pool.connection() as connection:
+            rows = connection.execute(self._select_page, (limit, skip)).fetchall()
+
+        return [self._table.from_row(row) for row in rows]
+
+    def page_after(self, after_id: int = 0, limit: int = 10) -> list[T]:
+        # The primary key index takes the query straight to the first row of the page.
+        with self._pool.connection() as connection:
+            rows = connection.execute(self._select_after, (after_id, limit)).fetchall()
+
+        return [self._table.from_row(row) for row in rows]
+
+    def clear(self) -> None:
+        with self._pool.transaction() as connection:
+            connection.execute(self._delete_all)
+            connection.execute(self._update_version, (self._table.name,))
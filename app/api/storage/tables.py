@@ -0,0 +1,36 @@
+import json
+from datetime import datetime
+from datetime import timezone
+
+from app.api.storage.sqlite import Table
+from app.models.drinks import Drink
+from app.models.money import from_cents
+from app.models.orders import Order
+from app.models.toppings import Topping
+
+# How drinks, toppings and orders are stored by the SQLite backend. Lists of IDs are stored as JSON text, timestamps
+# as seconds since the epoch, and amounts as integer cents, the same as the models keep them.
+DRINK_TABLE: Table[Drink] = Table(
+    name="drinks",
+    columns=("name TEXT NOT NULL", "price_cents INTEGER NOT NULL", "toppings TEXT NOT NULL"),
+    to_row=lambda drink: (drink.id, drink.name, drink.price_cents, json.dumps(drink.toppings)),
+    from_row=lambda row: Drink(id=row[0], name=row[1], price=from_cents(row[2]), toppings=json.loads(row[3])),
+)
+
+TOPPING_TABLE: Table[Topping] = Table(
+    name="toppings",
+    columns=("name TEXT NOT NULL", "price_cents INTEGER NOT NULL"),
+    to_row=lambda topping: (topping.id, topping.name, topping.price_cents),
+    from_row=lambda row: Topping(id=row[0], name=row[1], price=from_cents(row[2])),
+)
+
+ORDER_TABLE: Table[Order] = Table(
+    name="orders",
+    columns=("drink_ids TEXT NOT NULL", "topping_ids TEXT NOT NULL", "total_cents INTEGER NOT NULL",
+             "discounted_cents INTEGER NOT NULL", "created_at REAL NOT NULL"),
+    to_row=lambda order: (order.id, json.dumps(order.drink_ids), json.dumps(order.topping_ids),
+                          order.total_cents, order.discounted_cents, order.created_at.timestamp()),
+    from_row=lambda row: Order(id=row[0], drink_ids=json.loads(row[1]), topping_ids=json.loads(row[2]),
+                               total_cents=row[3], discounted_cents=row[4],
+                               created_at=datetime.fromtimestamp(row[5], timezone.utc)),
+)
@@ -0,0 +1,81 @@
+import os
+
+
+class Settings:
+    """
+    Application settings, read from environment variables prefixed with "COFFEE_STORE_".
+
+    Attributes:
+
+        storage_backend (str): Where drinks, toppings and orders are stored, either "memory" or "sqlite".
+        sqlite_path (str): The path of the SQLite database file, used by the "sqlite" backend.
+        sqlite_pool_size (int): How many SQLite connections are kept open per worker process.
+        id_block_size (int): How many IDs a worker process leases at once from storage shared with other workers.
+        snapshot_refresh_interval (float): How often, in seconds, a worker checks shared storage for catalog changes
+            made by other workers.
+        journal_dir (str | None): A directory to journal orders to, so the orders of the "memory" backend survive a
+            restart. If not set, orders are not journaled.
+        journal_commit_window (float): How long, in seconds, an order waits for other orders to share its fsync.
+        journal_snapshot_every (int): After how many journaled orders a snapshot of all orders is written, which
+            bounds how many orders are replayed on startup.
+        discount_rules_file (str | None): A JSON file declaring the discount rules. If not set, the default discounts
+            apply: 25% off orders above 12, or the cheapest line for free in orders with at least 3 lines.
+        seed_file (str | None): A catalog snapshot file to seed the drinks and toppings from on startup. If not set,
+            the default catalog is seeded.
+        snapshot_file (str | None): A binary snapshot file, written by "python -m app.api.seeding", to load the
+            drinks, toppings and orders from on startup, instead of seeding the catalog. It is memory-mapped, so
+            in-memory orders are not read until used, and are shared by every worker.
+        idempotency_cache_bytes (int): How many bytes the responses kept for requests with an Idempotency-Key may take
+            per worker process. The least recently used are dropped first.
+        idempotency_ttl (float): How long, in seconds, the response to a request with an Idempotency-Key is kept.
+        order_pipeline_capacity (int): How many orders placed through the order pipeline can wait or be processed at
+            once per worker process. Orders beyond that get 429 Too Many Requests.
+        order_pipeline_workers (int): How many pricing and how many persistence tasks the order pipeline runs.
+        log_level (str): The level of the application logs, e.g. "INFO" or "WARNING".
+        log_format (str): How log records are written to stdout, either "json" or "text".
+        log_sample_rate (float): The share, between 0 and 1, of the log records of high-volume routes which is kept.
+        log_queue_size (int): How many log records can wait to be written. Records logged while it is full are dropped.
+    """
+    storage_backend: str
+    sqlite_path: str
+    sqlite_pool_size: int
+    id_block_size: int
+    snapshot_refresh_interval: float
+    journal_dir: str | None
+    journal_commit_window: float
+    journal_snapshot_every: int
+    discount_rules_file: str | None
+    seed_file: str | None
+    snapshot_file: str | None
+    idempotency_cache_bytes: int
+    idempotency_ttl: float
+    order_pipeline_capacity: int
+    order_pipeline_workers: int
+    log_level: str
+    log_format: str
+    log_sample_rate: float
+    log_queue_size: int
+
+    def __init__(self):
+        self.storage_backend = os.environ.get("COFFEE_STORE_STORAGE_BACKEND", "memory").lower()
+        self.sqlite_path = os.environ.get("COFFEE_STORE_SQLITE_PATH", "coffee_store.db")
+        self.sqlite_pool_size = int(os.environ.get("COFFEE_STORE_SQLITE_POOL_SIZE", "4"))
+        self.id_block_size = int(os.environ.get("COFFEE_STORE_ID_BLOCK_SIZE", "100"))
+        self.snapshot_refresh_interval = float(os.environ.get("COFFEE_STORE_SNAPSHOT_REFRESH_INTERVAL", "1.0"))
+        self.journal_dir = os.environ.get("COFFEE_STORE_JOURNAL_DIR") or None
+        self.journal_commit_window = float(os.environ.get("COFFEE_STORE_JOURNAL_COMMIT_WINDOW", "0.002"))
+        self.journal_snapshot_every = int(os.environ.get("COFFEE_STORE_JOURNAL_SNAPSHOT_EVERY", "100000"))
+        self.discount_rules_file = os.environ.get("COFFEE_STORE_DISCOUNT_RULES_FILE") or None
+        self.seed_file = os.environ.get("COFFEE_STORE_SEED_FILE") or None
+        self.snapshot_file = os.environ.get("COFFEE_STORE_SNAPSHOT_FILE") or None
+        self.idempotency_cache_bytes = int(os.environ.get("COFFEE_STORE_IDEMPOTENCY_CACHE_BYTES", "16777216"))
+        self.idempotency_ttl = float(os.environ.get("COFFEE_STORE_IDEMPOTENCY_TTL", "86400"))
+        self.order_pipeline_capacity = int(os.environ.get("COFFEE_STORE_ORDER_PIPELINE_CAPACITY", "1000"))
+        self.order_pipeline_workers = int(os.environ.get("COFFEE_STORE_ORDER_PIPELINE_WORKERS", "4"))
+        self.log_level = os.environ.get("COFFEE_STORE_LOG_LEVEL", "INFO").upper()
+        self.log_format = os.environ.get("COFFEE_STORE_LOG_FORMAT", "json").lower()
+        self.log_sample_rate = float(os.environ.get("COFFEE_STORE_LOG_SAMPLE_RATE", "1.0"))
+        self.log_queue_size = int(os.environ.get("COFFEE_STORE_LOG_QUEUE_SIZE", "10000"))
+
+
+settings = Settings()
@@ -0,0 +1,110 @@
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+from datetime import datetime
+from datetime import timezone
+from logging.handlers import QueueHandler
+from logging.handlers import QueueListener
+
+from app.api.metrics import Counter
+from app.config import settings
+
+# Pass as `extra` to the log calls of high-volume routes, so only a share of their records is kept.
+SAMPLED = {"sampled": True}
+
+LOG_RECORDS_DROPPED = Counter("log_records_dropped_total", "Log records dropped because the log queue was full.")
+
+TEXT_FORMAT = (
+    "%(asctime)s [%(processName)s: %(process)d] [%(threadName)s: %(thread)d] [%(levelname)s] %(name)s: %(message)s"
+)
+
+_listener: QueueListener | None = None
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats a log record as one line of JSON, so log collectors can parse it without a custom pattern.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "process": record.process,
+            "thread": record.threadName,
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps only a share of the records marked as sampled, e.g. the ones logged by every catalog read. Warnings and
+    errors are always kept.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate >= 1 or record.levelno >= logging.WARNING or not getattr(record, "sampled", False):
+            return True
+        return random.random() < self.rate
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Hands log records over to a queue without waiting. If the queue is full, the record is dropped and counted,
+    instead of slowing down the request which logged it.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The record is formatted by the listener thread, so the request thread does no formatting at all.
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+def setup_logging() -> QueueListener:
+    """
+    Send the records of every "app" logger through a bounded queue to a background thread, which writes them to
+    stdout. Calling it again returns the listener which is already running.
+
+    Returns:
+
+        QueueListener: The listener writing the queued records.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter() if settings.log_format == "json" else logging.Formatter(TEXT_FORMAT))
+
+    log_queue = queue.Queue(maxsize=settings.log_queue_size)
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(settings.log_sample_rate))
+
+    app_logger = logging.getLogger("app")
+    app_logger.setLevel(settings.log_level)
+    app_logger.addHandler(queue_handler)
+    app_logger.propagate = False
+
+    _listener = QueueListener(log_queue, stream_handler)
+    _listener.start()
+    # Write the records still in the queue before the process exits.
+    atexit.register(_listener.stop)
+
+    return _listener
@@ -1,32 +1,87 @@
 import logging
-import sys
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.responses import RedirectResponse
 
-from app.api.crud_operations.drink_operations import initialize_default_drinks_on_startup
-from app.api.crud_operations.topping_operations import initialize_default_toppings_on_startup
+from app.api.crud_operations.drink_operations import DRINKS_SNAPSHOT
+from app.api.crud_operations.drink_operations import rebuild_drink_indexes
+from app.api.crud_operations.order_operations import close_order_journal
+from app.api.crud_operations.order_operations import load_order_rollups
+from app.api.crud_operations.order_operations import load_topping_usage
+from app.api.crud_operations.order_operations import open_order_journal
+from app.api.crud_operations.topping_operations import TOPPINGS_SNAPSHOT
+from app.api.crud_operations.topping_operations import rebuild_topping_indexes
+from app.api.metrics import MetricsMiddleware
+from app.api.metrics import render_prometheus
+from app.api.order_pipeline import ORDER_PIPELINE
+from app.api.pricing.engine import get_discount_engine
 from app.api.routers import admin
 from app.api.routers import customer
+from app.api.seeding import load_snapshot_file
+from app.api.seeding import seed_catalog
+from app.api.storage.snapshots import SnapshotRefresher
+from app.config import settings
+from app.logging_setup import setup_logging
 
-
-# Setup logging.
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
-stream_handler = logging.StreamHandler(sys.stdout)
-log_formatter = logging.Formatter(
-    "%(asctime)s [%(processName)s: %(process)d] [%(threadName)s: %(thread)d] [%(levelname)s] %(name)s: %(message)s"
-)
-stream_handler.setFormatter(log_formatter)
-logger.addHandler(stream_handler)
 
-# Start FastAPI App
-app = FastAPI(title="coffee_store")
 
-# Initializing default beverages and toppings.
-logger.info("Loading in default data on application startup.")
-initialize_default_drinks_on_startup()
-initialize_default_toppings_on_startup()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Prepare the data on startup, and run background work for as long as the application is running. This runs once
+    per worker when it starts serving, instead of on import, so importing the application stays cheap.
+    """
+    # Setup logging. Records are written to stdout by a background thread, so requests never wait on stdout.
+    setup_logging()
+    # Seeding only adds what is missing, so it is safe to run on every startup, and by every worker.
+    logger.info("Loading in default data on application startup.")
+    if settings.snapshot_file:
+        load_snapshot_file(settings.snapshot_file)
+    else:
+        seed_catalog(settings.seed_file)
+    # Load the discount rules now, so a broken rules file stops the worker from starting instead of failing orders.
+    get_discount_engine()
+    # The catalog is indexed once all drinks and toppings are in place.
+    rebuild_drink_indexes()
+    rebuild_topping_indexes()
+    # In-memory orders are restored from the order journal, if enabled. Its orders come after those of the snapshot
+    # file, or replace them if the journal has a snapshot of its own.
+    if settings.journal_dir and settings.storage_backend == "memory":
+        open_order_journal(settings.journal_dir, commit_window=settings.journal_commit_window,
+                           snapshot_every=settings.journal_snapshot_every)
+    elif settings.journal_dir:
+        logger.warning("Orders are only journaled with the memory backend, as the %s backend is durable by itself.",
+                       settings.storage_backend)
+    # Orders kept in persistent storage count towards the topping usage and the analytics.
+    load_topping_usage()
+    load_order_rollups()
+
+    # Orders submitted to the order pipeline are placed by tasks on this event loop. On shutdown, the orders already
+    # taken are finished before the order journal is closed.
+    ORDER_PIPELINE.start()
+
+    # With in-memory storage, this worker makes every change itself. Shared storage can also be changed by other
+    # workers, so the catalog snapshots are refreshed in the background.
+    if settings.storage_backend == "memory":
+        yield
+        await ORDER_PIPELINE.stop()
+        close_order_journal()
+        return
+
+    refresher = SnapshotRefresher([DRINKS_SNAPSHOT, TOPPINGS_SNAPSHOT], interval=settings.snapshot_refresh_interval)
+    refresher.start()
+    yield
+    await ORDER_PIPELINE.stop()
+    refresher.stop()
+
+
+# Start FastAPI App
+app = FastAPI(title="coffee_store", lifespan=lifespan)
+# Record the latency, status and number in flight of every request, served by the "/metrics" endpoint.
+app.add_middleware(MetricsMiddleware)
 
 
 # Ensure first page user will see, is the "/docs" endpoint for help.
@@ -35,5 +90,11 @@ def root():
     return RedirectResponse(url="/docs")
 
 
+# Metrics of this worker in the Prometheus text format, to be scraped by Prometheus.
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
 app.include_router(customer.router, prefix="/customer", tags=["customer"])
 app.include_router(admin.router, prefix="/admin", tags=["admin"])
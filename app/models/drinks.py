@@ -1,7 +1,12 @@
+from app.models.money import Cents
+from app.models.money import from_cents
+from app.models.money import to_cents
+
+
 class Drink:
     id: int
     name: str
-    price: float
+    price_cents: Cents
     toppings: list[int] = []
 
     def __init__(self,
@@ -11,6 +16,11 @@ class Drink:
                  toppings: list[int] = None):
         self.id = id
         self.name = name
-        self.price = price
+        # The price is kept in cents, so adding prices up is exact.
+        self.price_cents = to_cents(price)
         if toppings:
             self.toppings = toppings
+
+    @property
+    def price(self) -> float:
+        return from_cents(self.price_cents)
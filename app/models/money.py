@@ -0,0 +1,48 @@
+from array import array
+from decimal import ROUND_HALF_UP
+from decimal import Decimal
+from typing import Iterable
+from typing import NewType
+
+# An amount of money in cents, the minor unit of the currency. Prices and order amounts are kept in cents, so adding
+# them up is exact; they are only turned into currency units, e.g. 4.5, when shown by the API.
+Cents = NewType("Cents", int)
+
+CENTS_PER_UNIT = 100
+
+
+def to_cents(amount: float | int) -> Cents:
+    """
+    Convert an amount in currency units, e.g. 4.55, to cents. Fractions of a cent are rounded half up.
+    """
+    if isinstance(amount, int):
+        return Cents(amount * CENTS_PER_UNIT)
+    # Going through the shortest decimal representation of the float, i.e. "4.55" rather than 4.54999..., rounds the
+    # amount as it was written.
+    return Cents(int((Decimal(repr(amount)) * CENTS_PER_UNIT).quantize(Decimal(1), rounding=ROUND_HALF_UP)))
+
+
+def from_cents(cents: int) -> float:
+    """
+    Convert an amount in cents to currency units, e.g. 455 to 4.55.
+    """
+    return cents / CENTS_PER_UNIT
+
+
+def percentage_of(cents: int, percent: int) -> Cents:
+    """
+    Calculate a percentage of an amount, rounded half up to whole cents, in integer arithmetic only.
+
+    Example:
+
+        percentage_of(102, 25) == 26, as 25% of 1.02 is 0.255.
+    """
+    return Cents((cents * percent * 2 + 100) // 200)
+
+
+def cents_array(amounts: Iterable[int] = ()) -> array:
+    """
+    Create a compact array of amounts in cents. Summing it with sum() runs over machine integers, which is much
+    faster than summing a list of floats, and exact.
+    """
+    return array("q", amounts)
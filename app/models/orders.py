@@ -1,18 +1,39 @@
+from datetime import datetime
+from datetime import timezone
+
+from app.models.money import Cents
+from app.models.money import from_cents
+
+
 class Order:
+    # Without a per-instance __dict__, every materialized order is smaller.
+    __slots__ = ("id", "drink_ids", "topping_ids", "total_cents", "discounted_cents", "created_at")
+
     id: int
     drink_ids: list[list[int]]
     topping_ids: list[list[int]]
-    total_amount: float
-    discounted_amount: float
+    total_cents: Cents
+    discounted_cents: Cents
+    created_at: datetime
 
     def __init__(self,
                  id: int,
                  drink_ids: list[list[int]],
                  topping_ids: list[list[int]],
-                 total_amount: float,
-                 discounted_amount: float):
+                 total_cents: Cents,
+                 discounted_cents: Cents,
+                 created_at: datetime = None):
         self.id = id
         self.drink_ids = drink_ids
         self.topping_ids = topping_ids
-        self.total_amount = total_amount
-        self.discounted_amount = discounted_amount
+        self.total_cents = total_cents
+        self.discounted_cents = discounted_cents
+        self.created_at = created_at or datetime.now(timezone.utc)
+
+    @property
+    def total_amount(self) -> float:
+        return from_cents(self.total_cents)
+
+    @property
+    def discounted_amount(self) -> float:
+        return from_cents(self.discounted_cents)
@@ -1,7 +1,12 @@
+from app.models.money import Cents
+from app.models.money import from_cents
+from app.models.money import to_cents
+
+
 class Topping:
     id: int
     name: str
-    price: float
+    price_cents: Cents
 
     def __init__(self,
                  id: int,
@@ -9,5 +14,9 @@ class Topping:
                  price: float):
         self.id = id
         self.name = name
-        self.price = price
+        # The price is kept in cents, so adding prices up is exact.
+        self.price_cents = to_cents(price)
 
+    @property
+    def price(self) -> float:
+        return from_cents(self.price_cents)
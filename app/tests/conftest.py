@@ -5,6 +5,7 @@ from app.main import app
 from app.api.crud_operations.order_operations import create_order
 from app.api.crud_operations.drink_operations import initialize_default_drinks_on_startup
 from app.api.crud_operations.topping_operations import initialize_default_toppings_on_startup
+from app.api.seeding import seed_catalog
 
 
 @pytest.fixture(scope="module")
@@ -19,10 +20,10 @@ def setup_fastapi_test_app():
 @pytest.fixture(scope="module", autouse=True)
 def setup_default_drinks_and_toppings_data():
     """
-    Fixture to initialize default drinks and toppings before running tests.
+    Fixture to initialize default drinks and toppings before running tests. The application only seeds them on
+    startup, which tests not using the test client never run.
     """
-    initialize_default_drinks_on_startup()
-    initialize_default_toppings_on_startup()
+    seed_catalog()
 
 
 @pytest.fixture
@@ -38,7 +39,7 @@ def setup_orders() -> None:
     """
     Fixture to create a drink for running tests on order operations.
     """
-    create_order(drink_ids=[[1]], topping_ids=[[1]], total_amount=5.0, discounted_amount=5.0)
+    create_order(drink_ids=[[1]], topping_ids=[[1]], total_cents=500, discounted_cents=500)
 
 
 @pytest.fixture
@@ -0,0 +1,43 @@
+import asyncio
+
+from app.main import app
+from benchmarks.load import ASGIClient
+from benchmarks.load import load_endpoint
+from benchmarks.report import compare
+from benchmarks.startup import parse_import_times
+
+
+def test_load_endpoint() -> None:
+    """
+    Test that the in-process load generator sends requests to the application, and reports their latencies.
+    """
+    result = asyncio.run(load_endpoint(ASGIClient(app), "GET /customer/drinks/?limit=2", requests=20, concurrency=4))
+    assert result["status_codes"] == {"200": 20}
+    assert result["p50_ms"] <= result["p95_ms"] <= result["p99_ms"]
+
+
+def test_compare_finds_regressions() -> None:
+    """
+    Test that comparing two reports finds the results which got slower than the threshold allows.
+
+    Example:
+        >>> old = {"results": [{"name": "get_drink", "params": {}, "per_call_us": 1.0}]}
+        >>> new = {"results": [{"name": "get_drink", "params": {}, "per_call_us": 2.0}]}
+        >>> assert compare(old, new, "per_call_us", threshold=0.1)[0]["change"] == 1.0
+    """
+    old = {"results": [{"name": "get_drink", "params": {"catalog_size": 10}, "per_call_us": 1.0},
+                       {"name": "get_topping", "params": {"catalog_size": 10}, "per_call_us": 1.0}]}
+    new = {"results": [{"name": "get_drink", "params": {"catalog_size": 10}, "per_call_us": 2.0},
+                       {"name": "get_topping", "params": {"catalog_size": 10}, "per_call_us": 1.05}]}
+    regressions = compare(old, new, "per_call_us", threshold=0.1)
+    assert [regression["name"] for regression in regressions] == ["get_drink"]
+
+
+def test_parse_import_times() -> None:
+    """
+    Test that the output of `python -X importtime` is parsed into the self and cumulative time of each module.
+    """
+    output = ("import time: self [us] | cumulative | imported package\n"
+              "import time:       500 |        500 |   app.config\n"
+              "import time:      1500 |       2000 | app.main\n")
+    assert parse_import_times(output) == {"app.config": (0.5, 0.5), "app.main": (1.5, 2.0)}
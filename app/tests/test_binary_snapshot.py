@@ -0,0 +1,75 @@
+import pytest
+
+from app.api.storage.binary_snapshot import SnapshotFile
+from app.api.storage.binary_snapshot import write_snapshot
+from app.api.storage.columnar import ColumnarOrderRepository
+from app.models.drinks import Drink
+from app.models.orders import Order
+from app.models.toppings import Topping
+
+
+def make_order(order_id: int) -> Order:
+    return Order(id=order_id, drink_ids=[[1, 2], [3]], topping_ids=[[order_id]], total_cents=1450,
+                 discounted_cents=1088)
+
+
+def as_tuple(order: Order) -> tuple:
+    return (order.id, order.drink_ids, order.topping_ids, order.total_cents, order.discounted_cents, order.created_at)
+
+
+def test_snapshot_roundtrip(tmp_path) -> None:
+    """
+    Test that the drinks, toppings and orders of a snapshot file are read back as they were written.
+
+    Example:
+        >>> write_snapshot("catalog.snapshot", [Drink(id=1, name="Latte", price=5)], [])
+        >>> assert SnapshotFile("catalog.snapshot").drinks()[0].name == "Latte"
+    """
+    drinks = [Drink(id=1, name="Black Coffee", price=4), Drink(id=3, name="Café Mocha", price=6.5, toppings=[2, 4])]
+    toppings = [Topping(id=2, name="Milk", price=2), Topping(id=4, name="Chocolate Sauce", price=0.5)]
+    repository = ColumnarOrderRepository()
+    for order_id in range(1, 4):
+        repository.add(make_order(order_id))
+    path = str(tmp_path / "catalog.snapshot")
+    write_snapshot(path, drinks, toppings, repository.copy_columns())
+
+    snapshot = SnapshotFile(path)
+    assert [vars(drink) for drink in snapshot.drinks()] == [vars(drink) for drink in drinks]
+    assert [vars(topping) for topping in snapshot.toppings()] == [vars(topping) for topping in toppings]
+    loaded = ColumnarOrderRepository()
+    loaded.load_base(snapshot.order_columns())
+    assert [as_tuple(order) for order in loaded] == [as_tuple(order) for order in repository]
+
+
+def test_snapshot_without_orders_or_of_another_format(tmp_path) -> None:
+    """
+    Test that a snapshot may leave out the orders, and that files which are not snapshots are refused.
+    """
+    path = str(tmp_path / "catalog.snapshot")
+    write_snapshot(path, [], [])
+    assert SnapshotFile(path).order_columns() is None
+
+    (tmp_path / "catalog.json").write_text('{"drinks": []}')
+    with pytest.raises(ValueError):
+        SnapshotFile(str(tmp_path / "catalog.json"))
+
+
+def test_orders_after_a_snapshot(tmp_path) -> None:
+    """
+    Test that orders can be added, replaced and deleted on top of the orders of a snapshot file, which stays unchanged.
+    """
+    repository = ColumnarOrderRepository()
+    for order_id in range(1, 4):
+        repository.add(make_order(order_id))
+    path = str(tmp_path / "orders.snapshot")
+    write_snapshot(path, [], [], repository.copy_columns())
+
+    loaded = ColumnarOrderRepository()
+    loaded.load_base(SnapshotFile(path).order_columns())
+    assert loaded.allocate_id() == 4
+    loaded.add(make_order(4))
+    assert [order.id for order in loaded.page(skip=2, limit=2)] == [3, 4]
+    assert loaded.delete(2).id == 2
+    assert [order.id for order in loaded] == [1, 3, 4]
+    assert loaded.amount_totals() == (3 * 1450, 3 * 1088)
+    assert len(SnapshotFile(path).order_columns().ids) == 3
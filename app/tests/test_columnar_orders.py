@@ -0,0 +1,87 @@
+import threading
+from datetime import datetime
+from datetime import timezone
+
+from app.api.storage.columnar import ColumnarOrderRepository
+from app.models.orders import Order
+
+
+def make_order(order_id: int, drink_ids: list[list[int]] = None, topping_ids: list[list[int]] = None) -> Order:
+    return Order(id=order_id, drink_ids=drink_ids or [[1]], topping_ids=topping_ids or [], total_cents=550,
+                 discounted_cents=450, created_at=datetime(2024, 7, 1, 12, 30, tzinfo=timezone.utc))
+
+
+def test_orders_keep_their_shape() -> None:
+    """
+    Test that an order read back from the columns equals the order which was added, including lines without toppings.
+
+    Example:
+        >>> repository = ColumnarOrderRepository()
+        >>> repository.add(make_order(1, drink_ids=[[1, 2], [3]], topping_ids=[[4]]))
+        >>> assert repository.get(1).topping_ids == [[4]]
+    """
+    repository = ColumnarOrderRepository()
+    repository.add(make_order(1, drink_ids=[[1, 2], [3], [4]], topping_ids=[[4], [], [1, 2, 3]]))
+    repository.add(make_order(2, drink_ids=[[2], [3]], topping_ids=[[1]]))
+
+    first = repository.get(1)
+    assert first.drink_ids == [[1, 2], [3], [4]]
+    assert first.topping_ids == [[4], [], [1, 2, 3]]
+    assert first.total_amount == 5.5
+    assert first.discounted_amount == 4.5
+    assert first.created_at == datetime(2024, 7, 1, 12, 30, tzinfo=timezone.utc)
+    assert repository.get(2).drink_ids == [[2], [3]]
+    assert repository.get(2).topping_ids == [[1]]
+    assert repository.get(3) is None
+
+
+def test_paging_deleting_and_replacing() -> None:
+    """
+    Test paging through the orders while orders are deleted, replaced and added out of ID order.
+    """
+    repository = ColumnarOrderRepository()
+    for order_id in (1, 2, 4, 5):
+        repository.add(make_order(order_id, drink_ids=[[order_id]]))
+
+    assert repository.delete(2).drink_ids == [[2]]
+    assert repository.delete(2) is None
+    assert [order.id for order in repository.page(skip=0, limit=10)] == [1, 4, 5]
+
+    repository.add(make_order(3, drink_ids=[[3]]))
+    repository.add(make_order(4, drink_ids=[[40]]))
+    assert [order.id for order in repository.page_after(after_id=1, limit=2)] == [3, 4]
+    assert repository.get(4).drink_ids == [[40]]
+    assert [order.id for order in repository] == [1, 3, 4, 5]
+    assert len(repository) == 4
+    assert sorted(repository.get_many([5, 1, 9])) == [1, 5]
+    assert repository.allocate_id() == 6
+
+
+def test_concurrent_orders_stay_in_id_order() -> None:
+    """
+    Test that orders created from several threads at once are appended in ID order, and that replacing and deleting
+    orders between them keeps every line with its order.
+    """
+    repository = ColumnarOrderRepository()
+
+    def create_orders():
+        for _ in range(200):
+            repository.add_new(lambda order_id: make_order(order_id, drink_ids=[[order_id], [order_id + 1]],
+                                                           topping_ids=[[order_id]]))
+
+    threads = [threading.Thread(target=create_orders) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert [order.id for order in repository] == list(range(1, 801))
+
+    for order_id in range(2, 800, 3):
+        repository.delete(order_id)
+    repository.add(make_order(5, drink_ids=[[50]], topping_ids=[[5], [6]]))
+    orders = list(repository)
+    # Order 5 was deleted, and is added again.
+    assert len(orders) == 800 - len(range(2, 800, 3)) + 1
+    assert repository.get(5).topping_ids == [[5], [6]]
+    assert all(order.drink_ids == [[order.id], [order.id + 1]] and order.topping_ids == [[order.id]]
+               for order in orders if order.id != 5)
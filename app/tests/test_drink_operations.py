@@ -1,11 +1,20 @@
 import pytest
 
+from app.api.crud_operations.drink_operations import ToppingInUseError
+from app.api.crud_operations.drink_operations import UnknownToppingsError
 from app.api.crud_operations.drink_operations import create_drink
 from app.api.crud_operations.drink_operations import delete_drink
+from app.api.crud_operations.drink_operations import delete_topping_from_catalog
 from app.api.crud_operations.drink_operations import get_drink
 from app.api.crud_operations.drink_operations import get_drinks
+from app.api.crud_operations.drink_operations import get_drinks_using_topping
+from app.api.crud_operations.drink_operations import import_drinks
+from app.api.crud_operations.drink_operations import search_drinks
 from app.api.crud_operations.drink_operations import update_drink
+from app.api.crud_operations.topping_operations import create_topping
+from app.api.imports import CatalogImportError
 from app.api.schemas.drinks import DrinkCreate
+from app.api.schemas.drinks import DrinkImport
 from app.api.schemas.drinks import DrinkUpdate
 
 
@@ -78,3 +87,61 @@ def test_delete_drink(setup_drinks) -> None:
     deleted_drink = delete_drink(4)
     assert deleted_drink.name == "Green Tea"
     assert deleted_drink.price == 4.0
+
+
+def test_delete_topping_listed_by_drinks() -> None:
+    """
+    Test that a topping listed by drinks is only deleted with cascade, which removes it from those drinks.
+
+    Example:
+        >>> delete_topping_from_catalog(2, cascade=True)
+        >>> assert get_drinks_using_topping(2) == []
+    """
+    vanilla = create_topping(name="Vanilla", price=1)
+    caramel = create_topping(name="Caramel", price=1)
+    latte = create_drink(DrinkCreate(name="Vanilla Latte", price=5, toppings=[vanilla.id, caramel.id]))
+    create_drink(DrinkCreate(name="Caramel Latte", price=5, toppings=[caramel.id]))
+    update_drink(latte.id, DrinkUpdate(toppings=[vanilla.id]))
+    assert [drink.name for drink in get_drinks_using_topping(vanilla.id)] == ["Vanilla Latte"]
+    assert [drink.name for drink in get_drinks_using_topping(caramel.id)] == ["Caramel Latte"]
+
+    with pytest.raises(UnknownToppingsError):
+        create_drink(DrinkCreate(name="Mystery Latte", price=5, toppings=[vanilla.id, 10_000]))
+    with pytest.raises(ToppingInUseError) as error:
+        delete_topping_from_catalog(vanilla.id)
+    assert error.value.drink_ids == [latte.id]
+    assert delete_topping_from_catalog(vanilla.id, cascade=True).name == "Vanilla"
+    assert get_drink(latte.id).toppings == []
+    assert get_drinks_using_topping(vanilla.id) == []
+
+
+def test_import_drinks() -> None:
+    """
+    Test that an import creates and replaces drinks together, and that nothing of it is applied if a row is invalid.
+
+    Example:
+        >>> drinks = import_drinks([DrinkImport(name="Chai Latte", price=4.5)])
+        >>> assert get_drink(drinks[0].id).name == "Chai Latte"
+    """
+    cinnamon = create_topping(name="Cinnamon", price=0.5)
+    chai = create_drink(DrinkCreate(name="Chai", price=4))
+    drinks = import_drinks([
+        DrinkImport(name="Cinnamon Roll Latte", price=6, toppings=[cinnamon.id]),
+        DrinkImport(id=chai.id, name="Dirty Chai", price=5, toppings=[cinnamon.id]),
+    ])
+    assert drinks[1].id == chai.id
+    assert get_drink(chai.id).name == "Dirty Chai"
+    assert [drink.id for drink in get_drinks_using_topping(cinnamon.id)] == [chai.id, drinks[0].id]
+    assert [drink.id for drink in search_drinks("cinnamon roll")] == [drinks[0].id]
+
+    with pytest.raises(CatalogImportError) as error:
+        import_drinks([
+            DrinkImport(name="Spiced Latte", price=5, toppings=[cinnamon.id, 10_000]),
+            DrinkImport(id=chai.id, name="Iced Chai", price=5),
+            DrinkImport(id=chai.id, name="Hot Chai", price=5),
+            DrinkImport(id=100_000, name="Ghost Chai", price=5),
+        ])
+    assert sorted(error.value.errors) == [0, 2, 3]
+    assert isinstance(error.value.errors[0], UnknownToppingsError)
+    assert get_drink(chai.id).name == "Dirty Chai"
+    assert search_drinks("spiced") == []
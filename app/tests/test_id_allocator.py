@@ -0,0 +1,57 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from app.api.storage.ids import CounterIdAllocator
+from app.api.storage.ids import LeasedIdAllocator
+
+
+def test_counter_id_allocator_is_thread_safe() -> None:
+    """
+    Test that IDs allocated from many threads at once are all unique.
+
+    Example:
+        >>> allocator = CounterIdAllocator()
+        >>> assert allocator.allocate() == 1
+    """
+    allocator = CounterIdAllocator()
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        ids = list(executor.map(lambda _: allocator.allocate(), range(10000)))
+    assert sorted(ids) == list(range(1, 10001))
+
+
+def test_counter_id_allocator_skips_observed_ids() -> None:
+    """
+    Test that IDs stored without being allocated are never handed out.
+    """
+    allocator = CounterIdAllocator()
+    allocator.observe(4)
+    assert allocator.allocate() == 5
+
+
+def test_leased_id_allocator_leases_blocks() -> None:
+    """
+    Test that IDs are handed out from leased blocks, leasing a new block only once the current one is used up.
+    """
+    leases = []
+    last_id = 0
+
+    def lease(count: int) -> range:
+        nonlocal last_id
+        leases.append(count)
+        last_id += count
+        return range(last_id - count + 1, last_id + 1)
+
+    allocator = LeasedIdAllocator(lease, block_size=10)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        ids = list(executor.map(lambda _: allocator.allocate(), range(25)))
+    assert sorted(ids) == list(range(1, 26))
+    assert len(leases) == 3
+
+
+def test_leased_id_allocator_skips_observed_ids() -> None:
+    """
+    Test that an ID stored inside the current block is skipped.
+    """
+    allocator = LeasedIdAllocator(lambda count: range(1, count + 1), block_size=10)
+    assert allocator.allocate() == 1
+    allocator.observe(4)
+    assert allocator.allocate() == 5
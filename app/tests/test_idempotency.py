@@ -0,0 +1,79 @@
+import threading
+
+import pytest
+
+from app.api.idempotency import ENTRY_OVERHEAD_BYTES
+from app.api.idempotency import IdempotencyCache
+from app.api.idempotency import IdempotencyKeyReusedError
+from app.api.idempotency import fingerprint
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_idempotency_cache_replays_and_evicts() -> None:
+    """
+    Test that responses are replayed, that the least recently used are dropped to stay within the byte budget, and
+    that responses expire.
+
+    Example:
+        >>> cache = IdempotencyCache()
+        >>> cache.run("key", fingerprint(b"{}"), lambda: (200, b"{}"))
+        (200, b'{}', False)
+    """
+    clock = FakeClock()
+    # Room for two entries with a 5 byte key and an 8 byte body.
+    cache = IdempotencyCache(max_bytes=2 * (ENTRY_OVERHEAD_BYTES + 5 + 8), ttl=60, clock=clock)
+    request = fingerprint(b"order")
+    assert cache.run("key-1", request, lambda: (200, b"12345678")) == (200, b"12345678", False)
+    cache.run("key-2", request, lambda: (200, b"12345678"))
+    # Reading the first key makes the second the least recently used.
+    assert cache.run("key-1", request, lambda: (200, b"other")) == (200, b"12345678", True)
+    cache.run("key-3", request, lambda: (200, b"12345678"))
+    assert len(cache) == 2
+    assert cache.run("key-2", request, lambda: (200, b"again")) == (200, b"again", False)
+
+    with pytest.raises(IdempotencyKeyReusedError):
+        cache.run("key-2", fingerprint(b"another order"), lambda: (200, b""))
+    # Server errors are not kept, and every response expires.
+    assert cache.run("key-4", request, lambda: (503, b"down"))[2] is False
+    assert cache.run("key-4", request, lambda: (200, b"up")) == (200, b"up", False)
+    clock.now = 61
+    assert cache.run("key-4", request, lambda: (200, b"later")) == (200, b"later", False)
+    assert len(cache) == 1
+
+
+def test_idempotency_cache_coalesces_requests_in_flight() -> None:
+    """
+    Test that requests with the same key, arriving while the first is processed, wait for its response.
+    """
+    cache = IdempotencyCache()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def process() -> tuple[int, bytes]:
+        calls.append(1)
+        started.set()
+        release.wait()
+        return 200, b"placed"
+
+    responses = []
+    first = threading.Thread(target=lambda: responses.append(cache.run("key", "order", process)))
+    first.start()
+    started.wait()
+    others = [threading.Thread(target=lambda: responses.append(cache.run("key", "order", process)))
+              for _ in range(5)]
+    for thread in others:
+        thread.start()
+    release.set()
+    for thread in [first, *others]:
+        thread.join()
+
+    assert len(calls) == 1
+    assert sorted(responses) == [(200, b"placed", False)] + [(200, b"placed", True)] * 5
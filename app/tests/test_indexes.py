@@ -0,0 +1,57 @@
+from app.api.storage.indexes import ReferenceIndex
+from app.api.storage.indexes import SearchIndex
+
+
+def test_reference_index() -> None:
+    """
+    Test that replacing and removing a referring item updates the items referring to an ID.
+
+    Example:
+        >>> index = ReferenceIndex()
+        >>> index.set(1, [2])
+        >>> index.referrers(2)
+        [1]
+    """
+    index = ReferenceIndex()
+    index.set(1, [2, 3])
+    index.set(4, [3])
+    index.set(1, [2])
+    assert index.referrers(3) == [4]
+    index.remove(4)
+    assert index.referrers(3) == []
+    index.rebuild([(5, [3]), (6, [3, 2])])
+    assert (index.referrers(2), index.referrers(3)) == ([6], [5, 6])
+
+
+def test_search_index() -> None:
+    """
+    Test searching by whole words, the start of a word and a price range, and that replaced and removed items are no
+    longer found by their old name or price.
+
+    Example:
+        >>> index = SearchIndex()
+        >>> index.add(1, "Vanilla Latte", 550)
+        >>> index.search("vanilla lat")
+        [1]
+    """
+    index = SearchIndex()
+    index.rebuild([(1, "Vanilla Latte", 550), (2, "Latte", 500), (3, "Caramel Latte Macchiato", 650)])
+    index.add(4, "Lemon Tea", 300)
+    assert index.search("LAT") == [1, 2, 3]
+    assert index.search("latte ca") == [3]
+    assert index.search("lat", min_price_cents=510) == [1, 3]
+    assert index.search("lat", limit=2) == [1, 2]
+    assert index.search("tea lat") == []
+    assert index.search(min_price_cents=400, max_price_cents=600) == [2, 1]
+
+    index.add(2, "Flat White", 700)
+    assert (index.search("lat"), index.search("fl")) == ([1, 3], [2])
+    assert index.search(min_price_cents=400, max_price_cents=600) == [1]
+    index.remove(3)
+    assert index.search("macchiato") == []
+    assert len(index) == 3
+
+    index.add_many([(1, "Iced Tea", 350), (5, "Oat Latte", 520)])
+    assert (index.search("tea"), index.search("lat"), index.search("vanilla")) == ([1, 4], [5], [])
+    assert index.search(max_price_cents=400) == [4, 1]
+    assert len(index) == 4
@@ -0,0 +1,50 @@
+import json
+import logging
+import queue
+
+from app.logging_setup import LOG_RECORDS_DROPPED
+from app.logging_setup import DroppingQueueHandler
+from app.logging_setup import JsonFormatter
+from app.logging_setup import SamplingFilter
+
+
+def make_record(message: str, *args, level: int = logging.INFO, sampled: bool = False) -> logging.LogRecord:
+    record = logging.LogRecord("app.test", level, __file__, 1, message, args, None)
+    record.sampled = sampled
+    return record
+
+
+def test_json_formatter() -> None:
+    """
+    Test that a record is formatted as one line of JSON, with its arguments merged into the message.
+
+    Example:
+        >>> JsonFormatter().format(make_record("Updating drink: %s", 1))
+    """
+    entry = json.loads(JsonFormatter().format(make_record("Updating drink: %s", 1)))
+    assert entry["message"] == "Updating drink: 1"
+    assert entry["level"] == "INFO"
+    assert entry["logger"] == "app.test"
+
+
+def test_sampling_filter_keeps_warnings() -> None:
+    """
+    Test that sampled records are dropped at a sample rate of 0, while other records and warnings are kept.
+    """
+    sampling_filter = SamplingFilter(rate=0)
+    assert not sampling_filter.filter(make_record("Fetching drinks", sampled=True))
+    assert sampling_filter.filter(make_record("Creating drink"))
+    assert sampling_filter.filter(make_record("Fetching drinks", level=logging.WARNING, sampled=True))
+
+
+def test_full_queue_drops_records() -> None:
+    """
+    Test that records logged while the queue is full are dropped and counted, instead of blocking.
+    """
+    handler = DroppingQueueHandler(queue.Queue(maxsize=1))
+    dropped = sum(value for _, _, value in LOG_RECORDS_DROPPED.samples())
+
+    handler.handle(make_record("first"))
+    handler.handle(make_record("second"))
+    assert handler.queue.qsize() == 1
+    assert sum(value for _, _, value in LOG_RECORDS_DROPPED.samples()) == dropped + 1
@@ -0,0 +1,44 @@
+from app.api.storage.memory import InMemoryRepository
+from app.models.toppings import Topping
+
+
+def test_repository_lookup_and_delete() -> None:
+    """
+    Test looking up and deleting items by their ID.
+
+    Example:
+        >>> repository = InMemoryRepository()
+        >>> repository.add(Topping(id=1, name="Milk", price=2))
+        >>> assert repository.delete(1).name == "Milk"
+        >>> assert repository.get(1) is None
+    """
+    repository = InMemoryRepository()
+    repository.add(Topping(id=1, name="Milk", price=2))
+    repository.add(Topping(id=2, name="Lemon", price=2))
+    assert repository.get(2).name == "Lemon"
+    assert repository.delete(1).name == "Milk"
+    assert repository.get(1) is None
+    assert repository.delete(1) is None
+
+
+def test_repository_ids_are_not_reused() -> None:
+    """
+    Test that a deleted ID is never handed out again.
+    """
+    repository = InMemoryRepository()
+    repository.add(Topping(id=1, name="Milk", price=2))
+    repository.add(Topping(id=2, name="Lemon", price=2))
+    repository.delete(2)
+    assert repository.allocate_id() == 3
+
+
+def test_repository_paging_is_stable_after_delete() -> None:
+    """
+    Test that pages keep insertion order once items have been deleted.
+    """
+    repository = InMemoryRepository()
+    for topping_id in range(1, 6):
+        repository.add(Topping(id=topping_id, name=f"Topping {topping_id}", price=1))
+    repository.delete(2)
+    assert [t.id for t in repository.page(skip=0, limit=3)] == [1, 3, 4]
+    assert [t.id for t in repository.page(skip=3, limit=3)] == [5]
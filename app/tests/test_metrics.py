@@ -0,0 +1,58 @@
+import threading
+
+from fastapi.testclient import TestClient
+
+from app.api.metrics import Counter
+from app.api.metrics import Histogram
+from app.api.metrics import render_prometheus
+
+
+def test_metrics_are_merged_across_threads() -> None:
+    """
+    Test that values recorded by different threads are added up when the metrics are collected.
+
+    Example:
+        >>> requests = Counter("requests_total", "Requests.", registry=[])
+        >>> requests.inc()
+    """
+    registry = []
+    requests = Counter("requests_total", "Requests.", ("route",), registry=registry)
+    latency = Histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0), registry=registry)
+
+    def record():
+        for _ in range(100):
+            requests.inc(("/drinks/{drink_id}",))
+            latency.observe(0.5)
+
+    threads = [threading.Thread(target=record) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    text = render_prometheus(registry)
+    assert "# TYPE requests_total counter" in text
+    assert 'requests_total{route="/drinks/{drink_id}"} 400' in text
+    assert 'latency_seconds_bucket{le="0.1"} 0' in text
+    assert 'latency_seconds_bucket{le="1"} 400' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 400' in text
+    assert "latency_seconds_sum 200" in text
+    assert "latency_seconds_count 400" in text
+
+
+def test_metrics_endpoint(setup_fastapi_test_app: TestClient) -> None:
+    """
+    Test that requests and timed operations show up in the metrics, labelled by route template and operation.
+    """
+    # Neither request changes any data, so the other tests are not affected.
+    setup_fastapi_test_app.delete("/admin/drinks/999")
+    setup_fastapi_test_app.post("/customer/order-drinks/", json={"drink_ids": [[999]], "topping_ids": [[1]]})
+
+    response = setup_fastapi_test_app.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'http_requests_total{method="DELETE",route="/admin/drinks/{drink_id}",status="404"}' in response.text
+    assert 'http_request_duration_seconds_count{method="POST",route="/customer/order-drinks/"}' in response.text
+    assert 'operation_duration_seconds_count{operation="pricing.price_order"}' in response.text
+    assert 'operation_duration_seconds_count{operation="drinks.get_drinks_by_ids"}' in response.text
+    assert "http_requests_in_flight 1" in response.text
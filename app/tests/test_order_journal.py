@@ -0,0 +1,145 @@
+import errno
+import os
+import threading
+from datetime import datetime
+from datetime import timezone
+
+import pytest
+
+from app.api.storage.columnar import ColumnarOrderRepository
+from app.api.storage.journal import JOURNAL_COMMITS
+from app.api.storage.journal import JournalError
+from app.api.storage.journal import OrderJournal
+from app.api.storage.journal import decode_orders
+from app.api.storage.journal import encode_order
+from app.models.orders import Order
+
+
+def make_order(order_id: int) -> Order:
+    return Order(id=order_id, drink_ids=[[1, 2], [3]], topping_ids=[[order_id]], total_cents=1450,
+                 discounted_cents=1088, created_at=datetime(2024, 5, 1, 12, 30, 15, 250000, tzinfo=timezone.utc))
+
+
+def as_tuple(order: Order) -> tuple:
+    return (order.id, order.drink_ids, order.topping_ids, order.total_cents, order.discounted_cents, order.created_at)
+
+
+def commits() -> int:
+    return sum(value for _, _, value in JOURNAL_COMMITS.samples())
+
+
+def test_encode_and_decode_orders() -> None:
+    """
+    Test that orders survive encoding, and that decoding stops before a record cut short by a crash.
+
+    Example:
+        >>> orders, length = decode_orders(encode_order(make_order(1)))
+        >>> assert orders[0].topping_ids == [[1]]
+    """
+    data = encode_order(make_order(1)) + encode_order(make_order(2))
+    orders, length = decode_orders(data + encode_order(make_order(3))[:-1])
+    assert [as_tuple(order) for order in orders] == [as_tuple(make_order(1)), as_tuple(make_order(2))]
+    assert length == len(data)
+
+
+def test_journal_group_commit_and_replay(tmp_path) -> None:
+    """
+    Test that concurrent orders share fsyncs, and that replaying the journal restores every order.
+    """
+    repository = ColumnarOrderRepository()
+    journal = OrderJournal(str(tmp_path), repository, commit_window=0.01)
+    journal.replay()
+    commits_before = commits()
+
+    def place(first_id: int) -> None:
+        for order_id in range(first_id, first_id + 10):
+            journal.append(make_order(order_id))
+
+    threads = [threading.Thread(target=place, args=(first_id,)) for first_id in range(1, 200, 10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    journal.close()
+    assert commits() - commits_before < 200
+    assert len(repository) == 200
+
+    restored = ColumnarOrderRepository()
+    assert OrderJournal(str(tmp_path), restored).replay() == 200
+    assert [as_tuple(order) for order in restored] == [as_tuple(make_order(order_id)) for order_id in range(1, 201)]
+    assert restored.allocate_id() == 201
+
+
+def test_journal_snapshot(tmp_path) -> None:
+    """
+    Test that a snapshot replaces the segments before it, and that replay loads it and the segments after it.
+    """
+    repository = ColumnarOrderRepository()
+    journal = OrderJournal(str(tmp_path), repository, commit_window=0)
+    journal.replay()
+    for order_id in range(1, 6):
+        journal.append(make_order(order_id))
+    journal.snapshot()
+    for order_id in range(6, 9):
+        journal.append(make_order(order_id))
+    journal.close()
+
+    assert sorted(os.listdir(tmp_path)) == ["orders-00000002.journal", "orders-00000002.snapshot"]
+    restored = ColumnarOrderRepository()
+    assert OrderJournal(str(tmp_path), restored).replay() == 8
+    assert [as_tuple(order) for order in restored] == [as_tuple(make_order(order_id)) for order_id in range(1, 9)]
+
+
+def test_journal_write_error(tmp_path, monkeypatch) -> None:
+    """
+    Test that once an fsync fails, every order appended to the journal fails without being added to the repository,
+    and the journal can still be closed.
+    """
+    repository = ColumnarOrderRepository()
+    journal = OrderJournal(str(tmp_path), repository)
+    journal.replay()
+
+    def failing_fsync(fd: int) -> None:
+        raise OSError(errno.EIO, "Input/output error")
+
+    monkeypatch.setattr(os, "fsync", failing_fsync)
+    for order_id in (1, 2):
+        with pytest.raises(JournalError):
+            journal.append(make_order(order_id))
+    with pytest.raises(JournalError):
+        journal.append_new(make_order)
+    assert len(repository) == 0
+
+    closer = threading.Thread(target=journal.close, daemon=True)
+    closer.start()
+    closer.join(timeout=5)
+    assert not closer.is_alive()
+
+
+def test_journal_append_new(tmp_path) -> None:
+    """
+    Test that orders created with new IDs are only added to the repository once they are durable, in ID order.
+    """
+    repository = ColumnarOrderRepository()
+    journal = OrderJournal(str(tmp_path), repository, commit_window=0.01)
+    journal.replay()
+    durable = []
+
+    def place() -> None:
+        for _ in range(10):
+            order = journal.append_new(make_order)
+            # Once appended, the order is durable and already in the repository.
+            assert order.id in repository
+            durable.append(order.id)
+
+    threads = [threading.Thread(target=place) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    journal.close()
+    assert sorted(durable) == list(range(1, 101))
+    assert [order.id for order in repository] == list(range(1, 101))
+
+    restored = ColumnarOrderRepository()
+    assert OrderJournal(str(tmp_path), restored).replay() == 100
@@ -1,5 +1,8 @@
 from app.api.crud_operations.order_operations import create_order
+from app.api.crud_operations.order_operations import get_most_used_topping_ids
 from app.api.crud_operations.order_operations import get_orders
+from app.api.storage.memory import InMemoryRepository
+from app.models.toppings import Topping
 
 
 def test_create_order() -> None:
@@ -7,11 +10,11 @@ def test_create_order() -> None:
     Test creating a new order.
 
     Example:
-        >>> order = create_order(drink_ids=[[1, 3]], topping_ids=[[2, 1]], total_amount=16, discounted_amount=8)
+        >>> order = create_order(drink_ids=[[1, 3]], topping_ids=[[2, 1]], total_cents=1600, discounted_cents=800)
         >>> assert order.total_amount == 10
         >>> assert order.discounted_amount == 8
     """
-    order = create_order(drink_ids=[[2, 2]], topping_ids=[[1, 3]], total_amount=10, discounted_amount=8)
+    order = create_order(drink_ids=[[2, 2]], topping_ids=[[1, 3]], total_cents=1000, discounted_cents=800)
     assert order.total_amount == 10
     assert order.discounted_amount == 8
 
@@ -28,3 +31,19 @@ def test_get_orders(setup_orders) -> None:
     orders = get_orders(skip=0, limit=1)
     assert len(orders) == 1
     assert orders[0].total_amount == 10.0
+
+
+def test_get_most_used_topping_ids() -> None:
+    """
+    Test that topping usage is counted as orders are created, and ranked most used first.
+
+    Example:
+        >>> create_order(drink_ids=[[1]], topping_ids=[[4, 4]], total_cents=800, discounted_cents=800)
+        >>> assert get_most_used_topping_ids(k=1) == [4]
+    """
+    create_order(drink_ids=[[1], [2]], topping_ids=[[4, 4], [4, 2]], total_cents=1500, discounted_cents=1500)
+    assert get_most_used_topping_ids(k=1) == [4]
+    assert get_most_used_topping_ids(k=2, only={1, 2}) == [1, 2]
+    toppings = InMemoryRepository()
+    toppings.add(Topping(id=2, name="Lemon", price=0.5))
+    assert get_most_used_topping_ids(only=toppings) == [2]
@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+from app.api.order_pipeline import OrderPipeline
+from app.api.order_pipeline import OrderPipelineFullError
+from app.api.order_pipeline import OrderPipelineStoppedError
+from app.api.pricing.engine import InvalidOrderError
+from app.api.schemas.orders import OrderCreate
+
+
+def test_order_pipeline() -> None:
+    """
+    Test that the order pipeline places and rejects orders in the background, turns orders away once it is full or
+    stopped, and passes placed orders to its subscribers.
+
+    Example:
+        >>> pipeline = OrderPipeline(capacity=10, workers=1)
+        >>> pipeline.start()
+        >>> ticket = pipeline.submit(OrderCreate(drink_ids=[[1]], topping_ids=[[]]))
+        >>> await ticket.done.wait()
+        >>> assert ticket.status == "placed"
+    """
+    pipeline = OrderPipeline(capacity=3, workers=2)
+    placed = []
+    pipeline.subscribe(placed.append)
+
+    async def place_orders():
+        pipeline.start()
+        tickets = [
+            pipeline.submit(OrderCreate(drink_ids=[[1]], topping_ids=[[1]])),
+            pipeline.submit(OrderCreate(drink_ids=[[999]], topping_ids=[[]])),
+            pipeline.submit(OrderCreate(drink_ids=[[2], [3]], topping_ids=[[2], []])),
+        ]
+        with pytest.raises(OrderPipelineFullError) as error:
+            pipeline.submit(OrderCreate(drink_ids=[[1]], topping_ids=[[]]))
+        assert error.value.retry_after >= 1
+        with pytest.raises(InvalidOrderError):
+            pipeline.submit(OrderCreate(drink_ids=[[]], topping_ids=[[]]))
+        await asyncio.wait_for(asyncio.gather(*(ticket.done.wait() for ticket in tickets)), 5)
+        await pipeline.stop()
+        return tickets
+
+    tickets = asyncio.run(place_orders())
+    assert [ticket.status for ticket in tickets] == ["placed", "rejected", "placed"]
+    assert tickets[1].status_code == 404
+    assert tickets[2].order.total_cents == 1400
+    # Orders are persisted by two workers, so subscribers may get them in either order.
+    assert sorted(order.id for order in placed) == sorted([tickets[0].order.id, tickets[2].order.id])
+    assert pipeline.get(tickets[0].ticket_id) is tickets[0]
+    assert (pipeline.pending, pipeline.latencies["persistence"].count) == (0, 2)
+    with pytest.raises(OrderPipelineStoppedError):
+        pipeline.submit(OrderCreate(drink_ids=[[1]], topping_ids=[[]]))
@@ -0,0 +1,153 @@
+from datetime import datetime
+from datetime import timezone
+
+import pytest
+
+from app.api.pricing.engine import ItemNotFoundError
+from app.api.pricing.engine import calculate_price
+from app.api.pricing.engine import price_order
+from app.api.pricing.rules import DEFAULT_DISCOUNT_RULES
+from app.api.pricing.rules import DiscountEngine
+from app.api.pricing.rules import DiscountRule
+from app.api.pricing.rules import compile_plan
+from app.api.pricing.rules import load_discount_rules
+from app.api.schemas.orders import OrderCreate
+from app.models.money import percentage_of
+
+# Prices in cents.
+DRINK_PRICES = {1: 400, 2: 500, 3: 600}
+TOPPING_PRICES = {1: 200, 2: 300}
+
+
+def test_calculate_price_without_discount() -> None:
+    """
+    Test pricing a small order, which gets no discount.
+
+    Example:
+        >>> price = calculate_price([[1]], [[1]], DRINK_PRICES, TOPPING_PRICES)
+        >>> assert price.total_amount == 6
+        >>> assert price.discounted_amount == 6
+    """
+    price = calculate_price([[1]], [[1]], DRINK_PRICES, TOPPING_PRICES)
+    assert price.total_amount == 6
+    assert price.discounted_amount == 6
+
+
+def test_calculate_price_percentage_discount() -> None:
+    """
+    Test that orders above the threshold get 25% off.
+    """
+    price = calculate_price([[2, 3]], [[1, 2]], DRINK_PRICES, TOPPING_PRICES)
+    assert price.total_amount == 16
+    assert price.discounted_amount == 12
+
+
+def test_calculate_price_cheapest_line_free() -> None:
+    """
+    Test that orders with three or more lines get their cheapest line for free, when that is the better discount.
+    """
+    price = calculate_price([[1], [1], [1]], [[1], [], []], DRINK_PRICES, TOPPING_PRICES)
+    assert price.line_totals == [600, 400, 400]
+    assert price.total_amount == 14
+    assert price.discounts == {"25_percent_above_12": 350, "cheapest_line_free": 400}
+    assert price.applied_rules == ["cheapest_line_free"]
+    assert price.discounted_amount == 10
+
+
+def test_calculate_price_rounds_percentage_discount_half_up() -> None:
+    """
+    Test that the 25% discount is calculated in whole cents, with half a cent rounded in favour of the customer.
+
+    Example:
+        >>> percentage_of(1301, 25)
+        325
+    """
+    # 25% of 13.01 is 3.2525, which rounds to 3.25 off.
+    price = calculate_price([[1]], [[1]], {1: 1101}, {1: 200})
+    assert price.total_cents == 1301
+    assert price.discounted_cents == 976
+    # 25% of 12.02 is 3.005, which rounds half up to 3.01 off.
+    price = calculate_price([[1]], [[1]], {1: 1002}, {1: 200})
+    assert price.discounted_cents == 901
+    assert price.discounted_amount == 9.01
+
+
+def test_calculate_price_item_rules() -> None:
+    """
+    Test that item rules only discount the drinks and toppings they name, and that stackable rules add up.
+
+    Example:
+        >>> rule = DiscountRule(name="half_price_latte", kind="item_percentage", percent=50, drink_ids=[2])
+        >>> plan = compile_plan([rule], now=datetime.now(timezone.utc))
+        >>> calculate_price([[2]], [[]], DRINK_PRICES, TOPPING_PRICES, plan=plan).discounted_cents
+        250
+    """
+    rules = [
+        DiscountRule(name="half_price_latte", kind="item_percentage", percent=50, drink_ids=[2]),
+        DiscountRule(name="cheap_milk", kind="item_amount", amount_cents=500, topping_ids=[1], stackable=True),
+        *load_discount_rules(),
+    ]
+    plan = compile_plan(rules, now=datetime.now(timezone.utc))
+    assert set(plan.drink_rules) == {2}
+    assert set(plan.topping_rules) == {1}
+
+    # Two lattes with milk: 50% off the lattes competes with 25% off the order, and milk costs nothing on top.
+    price = calculate_price([[2], [2]], [[1], [1]], DRINK_PRICES, TOPPING_PRICES, plan=plan)
+    assert price.total_cents == 1400
+    assert price.discounts == {"25_percent_above_12": 350, "half_price_latte": 500, "cheap_milk": 400}
+    assert price.applied_rules == ["cheap_milk", "half_price_latte"]
+    assert price.discounted_cents == 500
+
+
+def test_discount_engine_time_windows_and_tiers() -> None:
+    """
+    Test that rules only apply within their hours and to their loyalty tiers, and that plans are compiled again
+    when a rule starts or stops applying.
+    """
+    engine = DiscountEngine([
+        DiscountRule(name="happy_hour", kind="order_percentage", percent=50, hours=(15, 17)),
+        DiscountRule(name="gold", kind="order_percentage", percent=10, tiers=["gold"], stackable=True),
+    ])
+    before = datetime(2024, 5, 1, 14, 30, tzinfo=timezone.utc)
+    during = datetime(2024, 5, 1, 16, 0, tzinfo=timezone.utc)
+
+    plan = engine.plan(now=before)
+    assert plan.order_rules == []
+    assert plan.valid_until == datetime(2024, 5, 1, 15, 0, tzinfo=timezone.utc)
+    assert engine.plan(now=before) is plan
+    assert [rule.name for rule in engine.plan(now=during).order_rules] == ["happy_hour"]
+    assert [rule.name for rule in engine.plan(tier="gold", now=during).order_rules] == ["happy_hour", "gold"]
+
+    price = calculate_price([[1]], [[]], DRINK_PRICES, TOPPING_PRICES, plan=engine.plan(tier="gold", now=during))
+    assert price.discounted_cents == 400 - 200 - 40
+
+    # Tiers no rule names share the plan of orders without a tier, instead of each getting a plan of their own.
+    assert engine.plan(tier="platinum", now=during) is engine.plan(now=during)
+    assert len(engine._plans) == 2
+
+
+def test_load_discount_rules(tmp_path) -> None:
+    """
+    Test that rules are read from a JSON file, that the defaults apply without one, and that names must be unique.
+    """
+    assert [rule.name for rule in load_discount_rules()] == [rule["name"] for rule in DEFAULT_DISCOUNT_RULES]
+
+    path = tmp_path / "rules.json"
+    path.write_text('[{"name": "launch", "kind": "order_percentage", "percent": 10, '
+                    '"starts_at": "2024-05-01T00:00:00", "ends_at": "2024-05-08T00:00:00"}]')
+    rule, = load_discount_rules(str(path))
+    assert rule.starts_at == datetime(2024, 5, 1, tzinfo=timezone.utc)
+    assert rule.is_active(datetime(2024, 5, 3, tzinfo=timezone.utc))
+    assert not rule.is_active(datetime(2024, 5, 8, tzinfo=timezone.utc))
+
+    path.write_text('[{"name": "twice", "kind": "order_percentage"}, {"name": "twice", "kind": "cheapest_line_free"}]')
+    with pytest.raises(ValueError, match="unique"):
+        load_discount_rules(str(path))
+
+
+def test_price_order_unknown_drink(setup_drinks, setup_toppings) -> None:
+    """
+    Test that pricing an order with an unknown drink raises an error naming the drink.
+    """
+    with pytest.raises(ItemNotFoundError, match="Drink with id 999 not found"):
+        price_order(OrderCreate(drink_ids=[[1], [999]], topping_ids=[[1]]))
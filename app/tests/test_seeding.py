@@ -0,0 +1,33 @@
+import json
+
+from app.api.seeding import load_seed_file
+from app.api.seeding import seed_items
+from app.api.storage.memory import InMemoryRepository
+from app.api.storage.snapshots import SnapshotPublisher
+
+
+def test_seed_from_file_is_idempotent(tmp_path) -> None:
+    """
+    Test that seeding from a snapshot file only adds the items which do not exist yet.
+
+    Example:
+        >>> drinks, toppings = load_seed_file("catalog.json")
+        >>> seed_items(DRINKS, DRINKS_SNAPSHOT, drinks)
+    """
+    seed_file = tmp_path / "catalog.json"
+    seed_file.write_text(json.dumps({
+        "drinks": [{"id": 7, "name": "Flat White", "price": 5, "toppings": [1]}],
+        "toppings": [{"id": 3, "name": "Cinnamon", "price": 1}],
+    }))
+    drinks, toppings = load_seed_file(str(seed_file))
+    assert drinks[0].name == "Flat White"
+    assert drinks[0].toppings == [1]
+    assert toppings[0].name == "Cinnamon"
+
+    repository = InMemoryRepository()
+    publisher = SnapshotPublisher(repository)
+    assert seed_items(repository, publisher, drinks) == 1
+    assert seed_items(repository, publisher, drinks) == 0
+    assert len(publisher.current) == 1
+    # The IDs of seeded items are never handed out again.
+    assert repository.allocate_id() == 8
@@ -0,0 +1,59 @@
+from app.api.storage.memory import InMemoryRepository
+from app.api.storage.snapshots import SnapshotPublisher
+from app.models.toppings import Topping
+
+
+def test_snapshot_is_not_changed_by_writes() -> None:
+    """
+    Test that a snapshot taken by a reader keeps its items while a writer publishes a new one.
+
+    Example:
+        >>> publisher = SnapshotPublisher(InMemoryRepository())
+        >>> assert len(publisher.current) == 0
+    """
+    repository = InMemoryRepository()
+    repository.add(Topping(id=1, name="Milk", price=2))
+    publisher = SnapshotPublisher(repository)
+    snapshot = publisher.current
+
+    repository.add(Topping(id=2, name="Lemon", price=2))
+    publisher.publish()
+    assert [t.id for t in snapshot.page(skip=0, limit=10)] == [1]
+    assert [t.id for t in publisher.current.page(skip=0, limit=10)] == [1, 2]
+
+
+def test_snapshot_refresh_only_publishes_changes() -> None:
+    """
+    Test that refreshing only builds a new snapshot once the repository has changed.
+    """
+    repository = InMemoryRepository()
+    publisher = SnapshotPublisher(repository)
+    snapshot = publisher.current
+    assert publisher.refresh() is snapshot
+
+    repository.add(Topping(id=1, name="Milk", price=2))
+    assert publisher.refresh() is not snapshot
+    assert len(publisher.current) == 1
+
+
+def test_snapshot_refresh_subscribers_skip_local_publishes() -> None:
+    """
+    Test that subscribers for refreshes only are called once a refresh finds a change made elsewhere, and not when a
+    writer publishes its own change.
+    """
+    repository = InMemoryRepository()
+    publisher = SnapshotPublisher(repository)
+    published = []
+    refreshed = []
+    publisher.subscribe(published.append)
+    publisher.subscribe(refreshed.append, refreshes_only=True)
+
+    repository.add(Topping(id=1, name="Milk", price=2))
+    publisher.publish()
+    assert len(published) == 1
+    assert refreshed == []
+
+    repository.add(Topping(id=2, name="Lemon", price=2))
+    snapshot = publisher.refresh()
+    assert published[-1] is snapshot
+    assert refreshed == [snapshot]
@@ -0,0 +1,85 @@
+import pytest
+
+from app.api.storage.sqlite import SQLiteConnectionPool
+from app.api.storage.sqlite import SQLiteRepository
+from app.api.storage.tables import DRINK_TABLE
+from app.api.storage.tables import TOPPING_TABLE
+from app.models.drinks import Drink
+
+
+@pytest.fixture
+def drink_repository(tmp_path) -> SQLiteRepository[Drink]:
+    """
+    Fixture to create an SQLite drink repository in a temporary database file.
+    """
+    pool = SQLiteConnectionPool(str(tmp_path / "coffee_store.db"), size=2)
+    yield SQLiteRepository(pool, DRINK_TABLE)
+    pool.close()
+
+
+def test_sqlite_repository_round_trip(drink_repository) -> None:
+    """
+    Test that a drink is stored and read back with all its details.
+
+    Example:
+        >>> drink_repository.add(Drink(id=1, name="Latte", price=5, toppings=[1, 2]))
+        >>> assert drink_repository.get(1).toppings == [1, 2]
+    """
+    drink_repository.add(Drink(id=1, name="Latte", price=5, toppings=[1, 2]))
+    drink = drink_repository.get(1)
+    assert drink.name == "Latte"
+    assert drink.price == 5
+    assert drink.toppings == [1, 2]
+    assert 1 in drink_repository
+    assert len(drink_repository) == 1
+
+
+def test_sqlite_repository_get_many_and_page(drink_repository) -> None:
+    """
+    Test looking up several drinks at once, and paging through them in ID order.
+    """
+    for drink_id in range(1, 6):
+        drink_repository.add(Drink(id=drink_id, name=f"Drink {drink_id}", price=drink_id))
+    assert sorted(drink_repository.get_many([2, 4, 99])) == [2, 4]
+    assert [d.id for d in drink_repository.page(skip=1, limit=2)] == [2, 3]
+    assert [d.id for d in drink_repository] == [1, 2, 3, 4, 5]
+
+
+def test_sqlite_repository_delete_does_not_reuse_ids(drink_repository) -> None:
+    """
+    Test that deleting the last drink does not hand its ID out again.
+    """
+    drink_repository.add(Drink(id=1, name="Latte", price=5))
+    drink_repository.add(Drink(id=2, name="Mocha", price=6))
+    assert drink_repository.delete(2).name == "Mocha"
+    assert drink_repository.get(2) is None
+    assert drink_repository.allocate_id() == 3
+
+
+def test_sqlite_repositories_sharing_a_database_allocate_unique_ids(tmp_path) -> None:
+    """
+    Test that two repositories on the same database file, like two worker processes, never allocate the same ID.
+    """
+    pools = [SQLiteConnectionPool(str(tmp_path / "coffee_store.db"), size=1) for _ in range(2)]
+    repositories = [SQLiteRepository(pool, DRINK_TABLE, id_block_size=3) for pool in pools]
+    ids = [repository.allocate_id() for _ in range(5) for repository in repositories]
+    assert len(set(ids)) == len(ids)
+    for pool in pools:
+        pool.close()
+
+
+def test_sqlite_pool_is_opened_on_first_use(tmp_path) -> None:
+    """
+    Test that creating a pool and its repositories does not touch the database file, and that the tables of every
+    repository exist once the pool is first used, including a repository created after that.
+    """
+    path = tmp_path / "coffee_store.db"
+    pool = SQLiteConnectionPool(str(path), size=1)
+    drinks = SQLiteRepository(pool, DRINK_TABLE)
+    assert not path.exists()
+
+    assert len(drinks) == 0
+    assert path.exists()
+    toppings = SQLiteRepository(pool, TOPPING_TABLE)
+    assert len(toppings) == 0
+    pool.close()
@@ -1,6 +1,13 @@
+import csv
+import io
+import json
+
 import pytest
 from fastapi.testclient import TestClient
 
+from app.api.pricing.engine import get_discount_engine
+from app.api.pricing.rules import DiscountRule
+
 
 @pytest.mark.parametrize(
     "endpoint_to_test_for, expected_status_code",
@@ -59,6 +66,9 @@ def test_create_topping(setup_fastapi_test_app: TestClient, topping_input_data:
         ({"drink_ids": [[1]], "topping_ids": [[1]]}, 200),
         ({"drink_ids": [[]], "topping_ids": [[]]}, 422),
         ({"drink_ids": [[999]], "topping_ids": [[1]]}, 404),
+        ({"drink_ids": [[2 ** 31]], "topping_ids": [[1]]}, 422),
+        ({"drink_ids": [[1] * 101], "topping_ids": [[1]]}, 422),
+        ({"drink_ids": [[1]] * 1001, "topping_ids": [[1]] * 1001}, 422),
     ]
 )
 def test_create_order(setup_fastapi_test_app: TestClient, order_data: dict, expected_status_code: int) -> None:
@@ -71,3 +81,261 @@ def test_create_order(setup_fastapi_test_app: TestClient, order_data: dict, expe
         order = response.json()
         assert "total_amount" in order
         assert "discounted_amount" in order
+
+
+def test_order_loyalty_tier_is_not_taken_from_the_request(setup_fastapi_test_app: TestClient) -> None:
+    """
+    Test that a loyalty tier sent with an order does not make the discounts of that tier apply.
+    """
+    discount_engine = get_discount_engine()
+    rules = discount_engine.rules
+    discount_engine.set_rules([DiscountRule(name="gold", kind="order_percentage", percent=50, tiers=["gold"])])
+    try:
+        order = {"drink_ids": [[1]], "topping_ids": [[1]]}
+        plain = setup_fastapi_test_app.post("/customer/order-drinks/", json=order).json()
+        claimed = setup_fastapi_test_app.post("/customer/order-drinks/", json={**order, "loyalty_tier": "gold"}).json()
+    finally:
+        discount_engine.set_rules(rules)
+    assert claimed["discounted_amount"] == plain["discounted_amount"] == plain["total_amount"]
+
+
+@pytest.mark.parametrize("endpoint_to_test_for", ["/customer/drinks/", "/customer/toppings/", "/admin/drinks/"])
+def test_catalog_etag(setup_fastapi_test_app: TestClient, endpoint_to_test_for: str) -> None:
+    """
+    Test that catalog endpoints send an ETag, and answer "304 Not Modified" when the client already has the response.
+    """
+    response = setup_fastapi_test_app.get(endpoint_to_test_for)
+    etag = response.headers["etag"]
+    response = setup_fastapi_test_app.get(endpoint_to_test_for, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+
+
+def test_catalog_etag_changes_with_catalog(setup_fastapi_test_app: TestClient) -> None:
+    """
+    Test that changing the catalog gives the catalog endpoints a new ETag.
+    """
+    etag = setup_fastapi_test_app.get("/customer/toppings/?limit=100").headers["etag"]
+    setup_fastapi_test_app.post("/admin/toppings/", json={"name": "Cinnamon", "price": 0.5})
+    response = setup_fastapi_test_app.get("/customer/toppings/?limit=100", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert "Cinnamon" in [topping["name"] for topping in response.json()]
+
+
+@pytest.mark.parametrize("endpoint_to_test_for", ["/customer/drinks/", "/customer/orders/", "/admin/toppings/"])
+def test_cursor_pagination(setup_fastapi_test_app: TestClient, endpoint_to_test_for: str) -> None:
+    """
+    Test paging through a list endpoint with cursors, which visits every item once, in ID order.
+    """
+    setup_fastapi_test_app.post("/customer/order-drinks/", json={"drink_ids": [[1]], "topping_ids": [[1]]})
+    setup_fastapi_test_app.post("/customer/order-drinks/", json={"drink_ids": [[2]], "topping_ids": [[2]]})
+    everything = setup_fastapi_test_app.get(endpoint_to_test_for, params={"limit": 1000}).json()
+
+    ids = []
+    params = {"limit": 2}
+    while True:
+        response = setup_fastapi_test_app.get(endpoint_to_test_for, params=params)
+        ids.extend(item["id"] for item in response.json())
+        if "x-next-cursor" not in response.headers:
+            break
+        params["after"] = response.headers["x-next-cursor"]
+
+    assert ids == [item["id"] for item in everything]
+    assert ids == sorted(ids)
+    assert setup_fastapi_test_app.get(endpoint_to_test_for, params={"limit": 1001}).status_code == 422
+    assert setup_fastapi_test_app.get(endpoint_to_test_for, params={"skip": -1}).status_code == 422
+
+
+def test_invalid_cursor(setup_fastapi_test_app: TestClient) -> None:
+    """
+    Test that a cursor which was not made by the API is rejected.
+    """
+    response = setup_fastapi_test_app.get("/customer/orders/", params={"after": "not-a-cursor"})
+    assert response.status_code == 422
+
+
+def test_export_orders(setup_fastapi_test_app: TestClient) -> None:
+    """
+    Test exporting orders as NDJSON and CSV, within an ID range.
+    """
+    order_data = {"drink_ids": [[3]], "topping_ids": [[2]]}
+    order = setup_fastapi_test_app.post("/customer/order-drinks/", json=order_data).json()
+
+    response = setup_fastapi_test_app.get("/admin/orders/export", params={"min_id": order["id"]})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    exported = [json.loads(line) for line in response.text.splitlines()]
+    assert exported == [order]
+
+    response = setup_fastapi_test_app.get("/admin/orders/export",
+                                          params={"format": "csv", "min_id": order["id"], "max_id": order["id"]})
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [int(row["id"]) for row in rows] == [order["id"]]
+
+    response = setup_fastapi_test_app.get("/admin/orders/export", params={"since": "2999-01-01T00:00:00"})
+    assert response.text == ""
+
+
+def test_create_orders_in_bulk(setup_fastapi_test_app: TestClient) -> None:
+    """
+    Test POST /customer/order-drinks/bulk, where invalid orders are rejected without failing the others.
+    """
+    orders = [
+        {"drink_ids": [[1]], "topping_ids": [[1]]},
+        {"drink_ids": [[999]], "topping_ids": [[1]]},
+        {"drink_ids": [[]], "topping_ids": [[]]},
+        {"drink_ids": [[2], [3]], "topping_ids": [[2], []]},
+    ]
+    response = setup_fastapi_test_app.post("/customer/order-drinks/bulk", json=orders)
+    assert response.status_code == 200
+    results = response.json()
+    assert [result["status_code"] for result in results] == [200, 404, 422, 200]
+    assert results[1]["detail"] == "Drink with id 999 not found"
+    assert results[3]["order"]["total_amount"] == 14
+
+
+def test_order_totals(setup_fastapi_test_app: TestClient) -> None:
+    """
+    Test that the order totals add up the amounts of new orders exactly.
+    """
+    before = setup_fastapi_test_app.get("/admin/orders/totals").json()
+    # Mocha with chocolate sauce and Hazelnut syrup is 14, above the threshold, so 25% off makes it 10.5.
+    setup_fastapi_test_app.post("/customer/order-drinks/", json={"drink_ids": [[3]], "topping_ids": [[3, 2]]})
+    after = setup_fastapi_test_app.get("/admin/orders/totals").json()
+
+    assert after["order_count"] == before["order_count"] + 1
+    assert round(after["total_amount"] - before["total_amount"], 2) == 14
+    assert round(after["discounted_amount"] - before["discounted_amount"], 2) == 10.5
+
+
+def test_analytics(setup_fastapi_test_app: TestClient) -> None:
+    """
+    Test that the analytics count new orders as they are placed, and that rebuilding them from the order history gives
+    the same totals.
+    """
+    before = setup_fastapi_test_app.get("/admin/analytics/summary").json()
+    setup_fastapi_test_app.post("/customer/order-drinks/", json={"drink_ids": [[3]], "topping_ids": [[3, 2]]})
+    after = setup_fastapi_test_app.get("/admin/analytics/summary").json()
+
+    assert after["order_count"] == before["order_count"] + 1
+    assert round(after["discount_amount"] - before["discount_amount"], 2) == 3.5
+    assert setup_fastapi_test_app.post("/admin/analytics/rebuild").json() == after
+    pairings = setup_fastapi_test_app.get("/admin/analytics/pairings", params={"drink_id": 3}).json()
+    assert {pairing["topping_id"] for pairing in pairings} >= {2, 3}
+    daily = setup_fastapi_test_app.get("/admin/analytics/daily").json()
+    assert sum(day["order_count"] for day in daily) == after["order_count"]
+
+
+def test_delete_topping_used_by_drinks(setup_fastapi_test_app: TestClient) -> None:
+    """
+    Test that the drinks listing a topping are listed, and that deleting the topping needs cascade while they do.
+    """
+    topping = setup_fastapi_test_app.post("/admin/toppings/", json={"name": "Oat Milk", "price": 1}).json()
+    drink = setup_fastapi_test_app.post("/admin/drinks/", json={"name": "Oat Latte", "price": 5,
+                                                                "toppings": [topping["id"]]}).json()
+    response = setup_fastapi_test_app.post("/admin/drinks/", json={"name": "Ghost Latte", "price": 5,
+                                                                   "toppings": [100_000]})
+    assert response.status_code == 422
+
+    drinks = setup_fastapi_test_app.get(f"/admin/toppings/{topping['id']}/drinks").json()
+    assert [listed["id"] for listed in drinks] == [drink["id"]]
+    assert setup_fastapi_test_app.delete(f"/admin/toppings/{topping['id']}").status_code == 409
+    response = setup_fastapi_test_app.delete(f"/admin/toppings/{topping['id']}", params={"cascade": True})
+    assert response.status_code == 200
+    assert setup_fastapi_test_app.get(f"/admin/toppings/{topping['id']}/drinks").status_code == 404
+
+
+def test_search_catalog(setup_fastapi_test_app: TestClient) -> None:
+    """
+    Test that new drinks and toppings are found by the start of a word of their name, and by price.
+    """
+    setup_fastapi_test_app.post("/admin/drinks/", json={"name": "Pumpkin Spice Latte", "price": 6.25, "toppings": []})
+    setup_fastapi_test_app.post("/admin/toppings/", json={"name": "Pumpkin Syrup", "price": 1.25})
+
+    results = setup_fastapi_test_app.get("/customer/search/", params={"q": "pumpk"}).json()
+    assert [drink["name"] for drink in results["drinks"]] == ["Pumpkin Spice Latte"]
+    assert [topping["name"] for topping in results["toppings"]] == ["Pumpkin Syrup"]
+    results = setup_fastapi_test_app.get("/customer/search/", params={"q": "pumpkin", "kind": "drinks",
+                                                                      "min_price": 6.25, "max_price": 6.25}).json()
+    assert [drink["price"] for drink in results["drinks"]] == [6.25]
+    assert results["toppings"] == []
+
+
+def test_place_order_with_idempotency_key(setup_fastapi_test_app: TestClient) -> None:
+    """
+    Test that retrying an order with the same Idempotency-Key returns the first order instead of placing another.
+    """
+    order = {"drink_ids": [[1]], "topping_ids": [[]]}
+    headers = {"Idempotency-Key": "2b1f9a7e-retry-test"}
+    first = setup_fastapi_test_app.post("/customer/order-drinks/", json=order, headers=headers)
+    retry = setup_fastapi_test_app.post("/customer/order-drinks/", json=order, headers=headers)
+
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json()
+    assert retry.headers["idempotent-replayed"] == "true"
+    response = setup_fastapi_test_app.post("/customer/order-drinks/", json={**order, "drink_ids": [[2]]},
+                                           headers=headers)
+    assert response.status_code == 422
+
+
+def test_import_catalog_in_bulk(setup_fastapi_test_app: TestClient) -> None:
+    """
+    Test POST /admin/toppings/bulk and /admin/drinks/bulk with CSV and JSON, and that an import with an invalid row
+    is reported row by row and not applied at all.
+    """
+    csv_body = "id,name,price\n,Maple Syrup,1.5\n,Sea Salt Foam,1\n"
+    response = setup_fastapi_test_app.post("/admin/toppings/bulk", content=csv_body,
+                                           headers={"Content-Type": "text/csv"})
+    assert response.status_code == 200
+    maple, foam = (result["id"] for result in response.json())
+    assert all(result["created"] for result in response.json())
+
+    tea = setup_fastapi_test_app.post("/admin/drinks/", json={"name": "Salted Tea", "price": 3}).json()
+    drinks = [
+        {"name": "Maple Latte", "price": 5.5, "toppings": [maple]},
+        {"id": tea["id"], "name": "Sea Salt Tea", "price": 3.5, "toppings": [foam]},
+    ]
+    response = setup_fastapi_test_app.post("/admin/drinks/bulk", json=drinks)
+    assert response.status_code == 200
+    assert [(result["status_code"], result["created"]) for result in response.json()] == [(200, True), (200, False)]
+    results = setup_fastapi_test_app.get("/customer/search/", params={"q": "sea salt t"}).json()
+    assert [drink["id"] for drink in results["drinks"]] == [tea["id"]]
+
+    csv_body = f"name,price,toppings\nMaple Mocha,6,{maple};{foam}\nFree Latte,0,\nGhost Latte,5,100000\n"
+    response = setup_fastapi_test_app.post("/admin/drinks/bulk", content=csv_body,
+                                           headers={"Content-Type": "text/csv"})
+    assert response.status_code == 422
+    assert [result["status_code"] for result in response.json()] == [424, 422, 424]
+    response = setup_fastapi_test_app.post("/admin/drinks/bulk", json=[drinks[0], {**drinks[1], "id": 100_000},
+                                                                       {"name": "Ghost Latte", "price": 5,
+                                                                        "toppings": [100_000]}])
+    assert [result["status_code"] for result in response.json()] == [424, 404, 422]
+    assert setup_fastapi_test_app.get("/customer/search/", params={"q": "maple mocha"}).json()["drinks"] == []
+    assert setup_fastapi_test_app.post("/admin/drinks/bulk", json={"name": "Latte"}).status_code == 422
+
+    # The body is read by the route itself, but is still described in the OpenAPI schema.
+    request_body = setup_fastapi_test_app.get("/openapi.json").json()["paths"]["/admin/toppings/bulk"]["post"][
+        "requestBody"]
+    assert sorted(request_body["content"]) == ["application/json", "text/csv"]
+    assert "price" in request_body["content"]["application/json"]["schema"]["items"]["properties"]
+
+
+def test_submit_order_to_pipeline(setup_fastapi_test_app: TestClient) -> None:
+    """
+    Test that an order submitted to the order pipeline is accepted right away, and can be polled until it is placed.
+    """
+    response = setup_fastapi_test_app.post("/customer/order-drinks/async",
+                                           json={"drink_ids": [[1]], "topping_ids": [[2]]})
+    assert response.status_code == 202
+    assert response.json()["status"] == "queued"
+
+    ticket = setup_fastapi_test_app.get(response.headers["location"], params={"wait": 5}).json()
+    assert (ticket["status"], ticket["status_code"]) == ("placed", 200)
+    assert ticket["order"]["drink_ids"] == [[1]]
+    assert setup_fastapi_test_app.get("/customer/order-drinks/async/unknown").status_code == 404
+    response = setup_fastapi_test_app.post("/customer/order-drinks/async", json={"drink_ids": [], "topping_ids": []})
+    assert response.status_code == 422
+    stats = setup_fastapi_test_app.get("/admin/orders/pipeline").json()
+    assert stats["running"] and stats["pending"] == 0
+    assert {stage["stage"]: stage["count"] for stage in stats["stages"]}["persistence"] >= 1
@@ -1,5 +1,8 @@
+import threading
+
 import pytest
 
+from app.api.crud_operations.catalog_lock import CATALOG_LOCK
 from app.api.crud_operations.topping_operations import create_topping
 from app.api.crud_operations.topping_operations import get_topping
 from app.api.crud_operations.topping_operations import get_toppings
@@ -71,3 +74,20 @@ def test_update_topping(setup_toppings) -> None:
     updated_topping = update_topping(1, name="Soy Milk", price=2.5)
     assert updated_topping.name == "Soy Milk"
     assert updated_topping.price == 2.5
+
+
+def test_update_does_not_bring_back_a_deleted_topping(setup_toppings) -> None:
+    """
+    Test that a topping deleted while it is being updated stays deleted, as updates wait for the catalog lock.
+    """
+    assert get_topping(2) is not None
+    results = []
+    with CATALOG_LOCK:
+        updater = threading.Thread(target=lambda: results.append(update_topping(2, name="Oat Milk")))
+        updater.start()
+        updater.join(timeout=0.1)
+        assert updater.is_alive()
+        delete_topping(2)
+    updater.join(timeout=5)
+    assert results == [None]
+    assert get_topping(2) is None
@@ -0,0 +1,173 @@
+"""
+An in-process load generator, sending requests straight to the ASGI application without any network in between.
+
+Run with, e.g.:
+
+    python -m benchmarks.load --output load.json
+    python -m benchmarks.load --requests 5000 --concurrency 64 --endpoint "GET /customer/drinks/?limit=50"
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+# The load generator places orders, so it always runs against in-memory storage.
+os.environ["COFFEE_STORE_STORAGE_BACKEND"] = "memory"
+
+from app.main import app  # noqa: E402
+from benchmarks.report import write_report  # noqa: E402
+
+DEFAULT_ENDPOINTS = [
+    "GET /customer/drinks/",
+    "GET /customer/toppings/",
+    "GET /customer/orders/",
+    "GET /admin/most-used-toppings/",
+    'POST /customer/order-drinks/ {"drink_ids": [[1], [2], [3]], "topping_ids": [[1], [2, 3], []]}',
+]
+
+
+class ASGIClient:
+    """
+    Sends HTTP requests to an ASGI application by calling it directly.
+    """
+
+    def __init__(self, asgi_app):
+        self._app = asgi_app
+
+    async def request(self, method: str, target: str, body: bytes = b"",
+                      headers: dict[str, str] | None = None) -> tuple[int, bytes]:
+        path, _, query = target.partition("?")
+        request_headers = [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()]
+        if body:
+            request_headers += [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": query.encode(),
+            "root_path": "",
+            "headers": request_headers,
+            "client": ("127.0.0.1", 50000),
+            "server": ("127.0.0.1", 8100),
+        }
+        received = False
+        status_code = 0
+        chunks = []
+
+        async def receive():
+            nonlocal received
+            if received:
+                # Wait like a client which keeps the connection open, until the application is done.
+                await asyncio.Event().wait()
+            received = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        async def send(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        await self._app(scope, receive, send)
+
+        return status_code, b"".join(chunks)
+
+
+def parse_endpoint(endpoint: str) -> tuple[str, str, bytes]:
+    """
+    Parse an endpoint given as "METHOD /path?query [JSON body]".
+    """
+    method, _, rest = endpoint.partition(" ")
+    target, _, body = rest.partition(" ")
+
+    return method.upper(), target, json.dumps(json.loads(body)).encode() if body else b""
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+
+    return sorted_values[index]
+
+
+async def load_endpoint(client: ASGIClient, endpoint: str, requests: int, concurrency: int) -> dict:
+    """
+    Send the given number of requests to one endpoint, with the given number of requests in flight at a time.
+
+    Returns:
+
+        dict: The latency percentiles in milliseconds, the requests per second, and the count of each status code.
+    """
+    method, target, body = parse_endpoint(endpoint)
+    latencies = []
+    status_codes: dict[int, int] = {}
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            status_code, _ = await client.request(method, target, body)
+            latencies.append(time.perf_counter() - start)
+            status_codes[status_code] = status_codes.get(status_code, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "name": endpoint,
+        "params": {"requests": requests, "concurrency": concurrency},
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+        "requests_per_second": round(requests / elapsed, 1),
+        "status_codes": {str(code): count for code, count in sorted(status_codes.items())},
+    }
+
+
+async def run(endpoints: list[str], requests: int, concurrency: int, warmup: int) -> list[dict]:
+    client = ASGIClient(app)
+    results = []
+    # Start the application like a server would, which seeds the catalog.
+    async with app.router.lifespan_context(app):
+        for endpoint in endpoints:
+            if warmup:
+                await load_endpoint(client, endpoint, warmup, concurrency)
+            results.append(await load_endpoint(client, endpoint, requests, concurrency))
+
+    return results
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="In-process load generator for the coffee store API.")
+    parser.add_argument("--endpoint", dest="endpoints", action="append",
+                        help='An endpoint to load, as "METHOD /path?query [JSON body]". Can be repeated. '
+                             "Default: the catalog, order and most used toppings endpoints.")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per endpoint.")
+    parser.add_argument("--concurrency", type=int, default=32, help="Requests in flight at a time.")
+    parser.add_argument("--warmup", type=int, default=200, help="Requests per endpoint sent before measuring.")
+    parser.add_argument("--output", default=None, help="Where to write the JSON report. Default: stdout.")
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run(args.endpoints or DEFAULT_ENDPOINTS, args.requests, args.concurrency, args.warmup))
+    for result in results:
+        print(f"{result['name'][:60]:<60} p50 {result['p50_ms']:>8.3f} ms  p95 {result['p95_ms']:>8.3f} ms  "
+              f"p99 {result['p99_ms']:>8.3f} ms  {result['requests_per_second']:>10.1f} req/s", file=sys.stderr)
+    write_report("load", results, args.output)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,341 @@
+"""
+Micro-benchmarks of the hot paths: catalog lookups and search, order pricing with growing numbers of discount rules and the
+most used toppings, rebuilding the order analytics, journaling orders, loading the order history on startup, and the
+memory footprint of the order history.
+
+Run with, e.g.:
+
+    python -m benchmarks.micro --output micro.json
+    python -m benchmarks.micro --catalog-sizes 10 1000 --order-sizes 10 10000000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from datetime import timezone
+from itertools import cycle
+
+# The benchmarks replace the stored catalog and orders, so they always run against in-memory storage.
+os.environ["COFFEE_STORE_STORAGE_BACKEND"] = "memory"
+
+from app.api import analytics  # noqa: E402
+from app.api.crud_operations.drink_operations import DRINKS  # noqa: E402
+from app.api.crud_operations.drink_operations import DRINKS_SNAPSHOT  # noqa: E402
+from app.api.crud_operations.drink_operations import get_drink  # noqa: E402
+from app.api.crud_operations.drink_operations import rebuild_drink_indexes  # noqa: E402
+from app.api.crud_operations.drink_operations import search_drinks  # noqa: E402
+from app.api.crud_operations.order_operations import ORDERS  # noqa: E402
+from app.api.crud_operations.order_operations import TOPPING_USAGE  # noqa: E402
+from app.api.crud_operations.order_operations import create_order  # noqa: E402
+from app.api.crud_operations.topping_operations import TOPPINGS  # noqa: E402
+from app.api.crud_operations.topping_operations import TOPPINGS_SNAPSHOT  # noqa: E402
+from app.api.crud_operations.topping_operations import get_topping  # noqa: E402
+from app.api.pricing.engine import calculate_price  # noqa: E402
+from app.api.pricing.engine import price_order  # noqa: E402
+from app.api.pricing.engine import price_orders  # noqa: E402
+from app.api.pricing.rules import DiscountRule  # noqa: E402
+from app.api.pricing.rules import compile_plan  # noqa: E402
+from app.api.pricing.rules import load_discount_rules  # noqa: E402
+from app.api.routers.admin import calculate_most_used_toppings_route  # noqa: E402
+from app.api.schemas.orders import OrderCreate  # noqa: E402
+from app.api.storage.binary_snapshot import SnapshotFile  # noqa: E402
+from app.api.storage.binary_snapshot import write_snapshot  # noqa: E402
+from app.api.storage.columnar import ColumnarOrderRepository  # noqa: E402
+from app.api.storage.journal import OrderJournal  # noqa: E402
+from app.api.storage.journal import encode_order  # noqa: E402
+from app.api.storage.memory import InMemoryRepository  # noqa: E402
+from app.models.drinks import Drink  # noqa: E402
+from app.models.orders import Order  # noqa: E402
+from app.models.toppings import Topping  # noqa: E402
+from benchmarks.report import measure  # noqa: E402
+from benchmarks.report import write_report  # noqa: E402
+
+DEFAULT_CATALOG_SIZES = [10, 100, 1_000, 10_000, 100_000]
+# Up to 10M orders is supported, but takes minutes and gigabytes to set up, so it has to be asked for.
+DEFAULT_ORDER_SIZES = [10, 1_000, 100_000, 1_000_000]
+DEFAULT_ORDER_LINES = [1, 10, 100, 500]
+DEFAULT_MEMORY_ORDER_SIZES = [1_000, 100_000]
+DEFAULT_RULE_COUNTS = [0, 10, 100, 500]
+DEFAULT_BACKFILL_ORDER_SIZES = [10_000, 100_000]
+DEFAULT_JOURNAL_THREADS = [1, 16, 64]
+DEFAULT_SNAPSHOT_ORDER_SIZES = [10_000, 100_000]
+# The words drink names are made of, so searches match a realistic share of the catalog.
+NAME_WORDS = ["vanilla", "caramel", "hazelnut", "pumpkin", "iced", "hot", "oat", "double", "latte", "mocha",
+              "espresso", "cappuccino", "tea", "chai", "matcha", "americano"]
+
+
+def seed_catalog(size: int) -> None:
+    """
+    Replace the catalog with the given number of drinks and of toppings.
+    """
+    DRINKS.clear()
+    TOPPINGS.clear()
+    for item_id in range(1, size + 1):
+        DRINKS.add(Drink(id=item_id, name=f"{random.choice(NAME_WORDS)} {random.choice(NAME_WORDS)} {item_id}",
+                         price=random.randint(2, 8)))
+        TOPPINGS.add(Topping(id=item_id, name=f"Topping {item_id}", price=random.randint(1, 3)))
+    DRINKS_SNAPSHOT.publish()
+    TOPPINGS_SNAPSHOT.publish()
+
+
+def random_order(catalog_size: int, lines: int) -> OrderCreate:
+    return OrderCreate(
+        drink_ids=[[random.randint(1, catalog_size)] for _ in range(lines)],
+        topping_ids=[random.sample(range(1, catalog_size + 1), min(2, catalog_size)) for _ in range(lines)],
+    )
+
+
+def bench_lookups(catalog_sizes: list[int], min_time: float) -> list[dict]:
+    results = []
+    for size in catalog_sizes:
+        seed_catalog(size)
+        random_ids = cycle([random.randint(1, size) for _ in range(1000)])
+        # The last item is where a linear scan would be slowest.
+        for name, lookup in (("get_drink", get_drink), ("get_topping", get_topping)):
+            results.append({"name": name, "params": {"catalog_size": size, "id": "last"},
+                            **measure(lambda: lookup(size), min_time=min_time)})
+            results.append({"name": name, "params": {"catalog_size": size, "id": "random"},
+                            **measure(lambda: lookup(next(random_ids)), min_time=min_time)})
+    return results
+
+
+def bench_catalog_search(catalog_sizes: list[int], min_time: float) -> list[dict]:
+    """
+    Measure searching the drinks by the start of a word, by several words, and by price, returning one page.
+    """
+    results = []
+    for size in catalog_sizes:
+        seed_catalog(size)
+        rebuild_drink_indexes()
+        for search, params in (
+            ({"query": "van"}, "prefix"),
+            ({"query": "vanilla lat"}, "words"),
+            ({"min_price_cents": 400, "max_price_cents": 500}, "price"),
+            ({"query": "mo", "max_price_cents": 300}, "prefix_and_price"),
+        ):
+            results.append({"name": "search_drinks", "params": {"catalog_size": size, "search": params},
+                            **measure(lambda: search_drinks(**search, limit=20), min_time=min_time)})
+    return results
+
+
+def bench_pricing(catalog_sizes: list[int], order_lines: list[int], min_time: float) -> list[dict]:
+    results = []
+    for size in catalog_sizes:
+        seed_catalog(size)
+        for lines in order_lines:
+            order = random_order(size, lines)
+            results.append({"name": "price_order", "params": {"catalog_size": size, "lines": lines},
+                            **measure(lambda: price_order(order), min_time=min_time)})
+        orders = [random_order(size, 5) for _ in range(100)]
+        results.append({"name": "price_orders", "params": {"catalog_size": size, "orders": 100, "lines": 5},
+                        **measure(lambda: price_orders(orders), min_time=min_time)})
+    return results
+
+
+def bench_discount_rules(rule_counts: list[int], catalog_size: int, min_time: float) -> list[dict]:
+    """
+    Measure pricing an order of 10 lines with the default discounts plus growing numbers of active item rules, each
+    discounting a few random drinks or toppings of the catalog.
+    """
+    results = []
+    drink_prices = {item_id: random.randint(200, 800) for item_id in range(1, catalog_size + 1)}
+    topping_prices = {item_id: random.randint(100, 300) for item_id in range(1, catalog_size + 1)}
+    order = random_order(catalog_size, 10)
+    now = datetime.now(timezone.utc)
+    for count in rule_counts:
+        rules = load_discount_rules()
+        for number in range(count):
+            ids = random.sample(range(1, catalog_size + 1), 3)
+            kind, percent, amount_cents = random.choice([("item_percentage", 10, 0), ("item_amount", 0, 50)])
+            rules.append(DiscountRule(name=f"rule_{number}", kind=kind, percent=percent, amount_cents=amount_cents,
+                                      drink_ids=ids if number % 2 else (), topping_ids=() if number % 2 else ids,
+                                      stackable=number % 5 == 0))
+        results.append({"name": "compile_plan", "params": {"rules": count},
+                        **measure(lambda: compile_plan(rules, now), min_time=min_time)})
+        plan = compile_plan(rules, now)
+        params = {"rules": count, "catalog_size": catalog_size, "lines": 10}
+        results.append({"name": "calculate_price", "params": params,
+                        **measure(lambda: calculate_price(order.drink_ids, order.topping_ids, drink_prices,
+                                                          topping_prices, plan=plan), min_time=min_time)})
+    return results
+
+
+def bench_most_used_toppings(order_sizes: list[int], catalog_size: int, min_time: float) -> list[dict]:
+    results = []
+    seed_catalog(catalog_size)
+    ORDERS.clear()
+    TOPPING_USAGE.clear()
+    created = 0
+    # The order history only grows, so each size adds the orders missing from the previous one.
+    for size in sorted(order_sizes):
+        for _ in range(size - created):
+            create_order(drink_ids=[[1]], topping_ids=[[random.randint(1, catalog_size)]], total_cents=500,
+                         discounted_cents=500)
+        created = size
+        for k in (None, 10):
+            results.append({"name": "calculate_most_used_toppings_route",
+                            "params": {"orders": size, "catalog_size": catalog_size, "k": k},
+                            **measure(lambda: calculate_most_used_toppings_route(k=k), min_time=min_time)})
+    return results
+
+
+def bench_rollup_backfill(order_sizes: list[int], min_time: float) -> list[dict]:
+    """
+    Measure rebuilding the order analytics from the order history, one order at a time and, if NumPy is installed,
+    over the order columns.
+    """
+    results = []
+    for size in order_sizes:
+        repository = ColumnarOrderRepository()
+        for order_id in range(1, size + 1):
+            repository.add(Order(id=order_id, drink_ids=[[random.randint(1, 20)]],
+                                 topping_ids=[[random.randint(1, 20), random.randint(1, 20)]], total_cents=700,
+                                 discounted_cents=600))
+        results.append({"name": "rebuild_rollups", "params": {"orders": size},
+                        **measure(lambda: analytics.rebuild_rollups(repository), min_time=min_time)})
+        if analytics.numpy is not None:
+            results.append({"name": "rebuild_rollups_from_columns", "params": {"orders": size},
+                            **measure(lambda: analytics.rebuild_rollups_from_columns(repository.copy_columns()),
+                                      min_time=min_time)})
+    return results
+
+
+def bench_order_journal(thread_counts: list[int], orders_per_thread: int = 200) -> list[dict]:
+    """
+    Measure the time per durable order when journaling orders from several threads at once, without and with a
+    commit window. The time is the wall time divided by the number of orders, i.e. the inverse of the rate.
+    """
+    results = []
+    for threads in thread_counts:
+        for commit_window in (0, 0.002):
+            with tempfile.TemporaryDirectory() as directory:
+                repository = ColumnarOrderRepository()
+                journal = OrderJournal(directory, repository, commit_window=commit_window)
+                journal.replay()
+
+                def place() -> None:
+                    for _ in range(orders_per_thread):
+                        order = Order(id=repository.allocate_id(), drink_ids=[[1]], topping_ids=[[2, 3]],
+                                      total_cents=700, discounted_cents=700)
+                        repository.add(order)
+                        journal.append(order)
+
+                workers = [threading.Thread(target=place) for _ in range(threads)]
+                start = time.perf_counter()
+                for worker in workers:
+                    worker.start()
+                for worker in workers:
+                    worker.join()
+                elapsed = time.perf_counter() - start
+                journal.close()
+            orders = threads * orders_per_thread
+            results.append({"name": "journal_append", "params": {"threads": threads, "commit_window": commit_window},
+                            "calls": orders, "per_call_us": round(elapsed / orders * 1e6, 3)})
+    return results
+
+
+def bench_snapshot_load(order_sizes: list[int], min_time: float) -> list[dict]:
+    """
+    Measure loading the order history on startup, by replaying an order journal, and by mapping a snapshot file.
+    """
+    results = []
+    for size in order_sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            repository = ColumnarOrderRepository()
+            # The journal segment is written in one go, which is what journaling the orders would leave behind.
+            with open(os.path.join(directory, "orders-00000001.journal"), "wb") as segment:
+                for order_id in range(1, size + 1):
+                    order = Order(id=order_id, drink_ids=[[random.randint(1, 20)]],
+                                  topping_ids=[[random.randint(1, 20), random.randint(1, 20)]], total_cents=700,
+                                  discounted_cents=600)
+                    repository.add(order)
+                    segment.write(encode_order(order))
+            snapshot_path = os.path.join(directory, "catalog.snapshot")
+            write_snapshot(snapshot_path, [], [], repository.copy_columns())
+
+            def replay() -> None:
+                journal = OrderJournal(directory, ColumnarOrderRepository())
+                journal.replay()
+                journal.close()
+
+            def load() -> None:
+                ColumnarOrderRepository().load_base(SnapshotFile(snapshot_path).order_columns())
+
+            results.append({"name": "load_orders_from_journal", "params": {"orders": size},
+                            **measure(replay, min_time=min_time)})
+            results.append({"name": "load_orders_from_snapshot", "params": {"orders": size},
+                            **measure(load, min_time=min_time)})
+    return results
+
+
+def bench_order_memory(order_sizes: list[int]) -> list[dict]:
+    """
+    Measure how many bytes each stored order takes, for every kind of in-memory order repository.
+    """
+    results = []
+    for size in order_sizes:
+        for repository_type in (InMemoryRepository, ColumnarOrderRepository):
+            tracemalloc.start()
+            repository = repository_type()
+            for order_id in range(1, size + 1):
+                repository.add(Order(id=order_id, drink_ids=[[random.randint(1, 4)]],
+                                     topping_ids=[[random.randint(1, 4), random.randint(1, 4)]], total_cents=700,
+                                     discounted_cents=700))
+            used, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            results.append({"name": "order_memory", "params": {"orders": size, "repository": repository_type.__name__},
+                            "bytes_per_order": round(used / size, 1)})
+            del repository
+    return results
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of the catalog, pricing and order hot paths.")
+    parser.add_argument("--catalog-sizes", type=int, nargs="+", default=DEFAULT_CATALOG_SIZES)
+    parser.add_argument("--order-sizes", type=int, nargs="+", default=DEFAULT_ORDER_SIZES)
+    parser.add_argument("--order-lines", type=int, nargs="+", default=DEFAULT_ORDER_LINES)
+    parser.add_argument("--memory-order-sizes", type=int, nargs="+", default=DEFAULT_MEMORY_ORDER_SIZES,
+                        help="The numbers of orders whose memory footprint is measured.")
+    parser.add_argument("--rule-counts", type=int, nargs="+", default=DEFAULT_RULE_COUNTS,
+                        help="The numbers of active item discount rules orders are priced with.")
+    parser.add_argument("--backfill-order-sizes", type=int, nargs="+", default=DEFAULT_BACKFILL_ORDER_SIZES,
+                        help="The numbers of orders the analytics are rebuilt from.")
+    parser.add_argument("--journal-threads", type=int, nargs="+", default=DEFAULT_JOURNAL_THREADS,
+                        help="The numbers of threads placing journaled orders at once.")
+    parser.add_argument("--snapshot-order-sizes", type=int, nargs="+", default=DEFAULT_SNAPSHOT_ORDER_SIZES,
+                        help="The numbers of orders loaded from a journal and from a snapshot file.")
+    parser.add_argument("--topping-catalog-size", type=int, default=1_000,
+                        help="The number of toppings used by the most used toppings benchmark.")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Seconds spent timing each benchmark.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Where to write the JSON report. Default: stdout.")
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)
+    results = [
+        *bench_lookups(args.catalog_sizes, args.min_time),
+        *bench_catalog_search(args.catalog_sizes, args.min_time),
+        *bench_pricing(args.catalog_sizes, args.order_lines, args.min_time),
+        *bench_discount_rules(args.rule_counts, 1_000, args.min_time),
+        *bench_most_used_toppings(args.order_sizes, args.topping_catalog_size, args.min_time),
+        *bench_rollup_backfill(args.backfill_order_sizes, args.min_time),
+        *bench_order_journal(args.journal_threads),
+        *bench_snapshot_load(args.snapshot_order_sizes, args.min_time),
+        *bench_order_memory(args.memory_order_sizes),
+    ]
+    for result in results:
+        value = (f"{result['per_call_us']:>12.3f} us" if "per_call_us" in result
+                 else f"{result['bytes_per_order']:>12.1f} bytes/order")
+        print(f"{result['name']:<40} {str(result['params']):<60} {value}", file=sys.stderr)
+    write_report("micro", results, args.output)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
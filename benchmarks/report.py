@@ -0,0 +1,156 @@
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from datetime import timezone
+from typing import Callable
+
+# The result field compared by default, per kind of report.
+DEFAULT_METRICS = {"micro": "per_call_us", "load": "p99_ms", "startup": "time_ms"}
+
+
+def measure(func: Callable[[], object], min_time: float = 0.2, repeat: int = 5) -> dict:
+    """
+    Time a function, calling it in a loop often enough for each of the timed runs to take a measurable time.
+
+    Args:
+
+        func (Callable[[], object]): The function to time.
+        min_time (float): The least time, in seconds, all timed runs together should take. Default is 0.2.
+        repeat (int): How many timed runs to make. The median and the best run are reported. Default is 5.
+
+    Returns:
+
+        dict: The time per call in microseconds, median and best, and the calls per second of the median run.
+    """
+    # Find how many calls make one run take long enough to time reliably.
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time / repeat:
+            break
+        loops *= 2 if elapsed == 0 else max(2, int(min_time / repeat / elapsed) + 1)
+
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        runs.append((time.perf_counter() - start) / loops)
+
+    median = statistics.median(runs)
+    return {
+        "per_call_us": round(median * 1e6, 3),
+        "best_us": round(min(runs) * 1e6, 3),
+        "calls_per_second": round(1 / median, 1) if median else None,
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_report(kind: str, results: list[dict], path: str | None) -> dict:
+    """
+    Wrap benchmark results with the commit and environment they were measured on, and write them as JSON.
+
+    Args:
+
+        kind (str): The kind of benchmark, e.g. "micro" or "load".
+        results (list[dict]): The results, each with a "name" and its "params".
+        path (str | None): Where to write the report. If None, it is printed to stdout.
+
+    Returns:
+
+        dict: The report.
+    """
+    report = {
+        "kind": kind,
+        "commit": git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if path is None:
+        print(text)
+    else:
+        with open(path, "w") as file:
+            file.write(text + "\n")
+
+    return report
+
+
+def _key(result: dict) -> tuple:
+    return result["name"], json.dumps(result.get("params", {}), sort_keys=True)
+
+
+def compare(old: dict, new: dict, metric: str, threshold: float) -> list[dict]:
+    """
+    Compare two reports of the same kind, and find the results which got slower by more than the threshold.
+
+    Args:
+
+        old (dict): The report to compare against, e.g. from the main branch.
+        new (dict): The report to check.
+        metric (str): The result field to compare, where higher is slower, e.g. "per_call_us" or "p99_ms".
+        threshold (float): The relative slowdown allowed, e.g. 0.1 for 10%.
+
+    Returns:
+
+        list[dict]: The regressions, with the old and new value and the relative change.
+    """
+    old_results = {_key(result): result for result in old["results"]}
+    regressions = []
+    for result in new["results"]:
+        previous = old_results.get(_key(result))
+        if previous is None or not previous.get(metric) or result.get(metric) is None:
+            continue
+        change = result[metric] / previous[metric] - 1
+        if change > threshold:
+            regressions.append({"name": result["name"], "params": result.get("params", {}), "old": previous[metric],
+                                "new": result[metric], "change": round(change, 3)})
+
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Compare two benchmark reports, and fail on regressions.")
+    parser.add_argument("old", help="The report to compare against.")
+    parser.add_argument("new", help="The report to check.")
+    parser.add_argument("--metric", default=None,
+                        help="The result field to compare. Default: per_call_us for micro, p99_ms for load and "
+                             "time_ms for startup reports.")
+    parser.add_argument("--threshold", type=float, default=0.1, help="The relative slowdown allowed. Default: 0.1.")
+    args = parser.parse_args(argv)
+
+    with open(args.old) as file:
+        old = json.load(file)
+    with open(args.new) as file:
+        new = json.load(file)
+    metric = args.metric or DEFAULT_METRICS[new["kind"]]
+
+    regressions = compare(old, new, metric, args.threshold)
+    for regression in regressions:
+        print(f"{regression['name']} {regression['params']}: {metric} {regression['old']} -> {regression['new']} "
+              f"({regression['change']:+.1%})")
+    print(f"{len(regressions)} regression(s) above {args.threshold:.0%} in {metric}, "
+          f"{old.get('commit')} -> {new.get('commit')}")
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+"""
+Profile the cold start of a worker: how long importing the application takes, which modules cost the most, and how
+long its startup takes before it serves requests. Fails if the import takes longer than the budget.
+
+Run with, e.g.:
+
+    python -m benchmarks.startup --output startup.json
+    python -m benchmarks.startup --budget-ms 800 --top 20
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from benchmarks.report import write_report
+
+# Imports the application and runs its startup in a fresh interpreter, printing how long each took in milliseconds.
+PROFILE_SCRIPT = """
+import asyncio
+import json
+import time
+
+start = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+
+
+async def startup():
+    lifespan = app.main.app.router.lifespan_context(app.main.app)
+    start = time.perf_counter()
+    await lifespan.__aenter__()
+    elapsed = time.perf_counter() - start
+    await lifespan.__aexit__(None, None, None)
+    return elapsed
+
+
+print(json.dumps({"import": (imported - start) * 1000, "startup": asyncio.run(startup()) * 1000}))
+"""
+
+
+def parse_import_times(output: str) -> dict[str, tuple[float, float]]:
+    """
+    Parse the output of `python -X importtime`.
+
+    Returns:
+
+        dict[str, tuple[float, float]]: The time, in milliseconds, each module took to import by itself and together
+            with the modules it imported, keyed by module name.
+    """
+    times = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        times[module.strip()] = (int(self_us) / 1000, int(cumulative_us) / 1000)
+
+    return times
+
+
+def profile_once() -> tuple[dict, dict[str, tuple[float, float]]]:
+    # Logs would mix with the timings on stdout.
+    env = {**os.environ, "COFFEE_STORE_LOG_LEVEL": "WARNING"}
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", PROFILE_SCRIPT], capture_output=True,
+                             text=True, env=env, check=True)
+
+    return json.loads(process.stdout.strip().splitlines()[-1]), parse_import_times(process.stderr)
+
+
+def profile(repeat: int, top: int) -> list[dict]:
+    """
+    Profile the cold start in fresh interpreters, and report the median of every timing.
+
+    Args:
+
+        repeat (int): How many interpreters to start.
+        top (int): How many of the most expensive modules to report.
+
+    Returns:
+
+        list[dict]: The import and startup time of the application, then the cost of the most expensive modules.
+    """
+    runs = [profile_once() for _ in range(repeat)]
+    results = [
+        {"name": name, "params": {}, "time_ms": round(statistics.median(timings[name] for timings, _ in runs), 3)}
+        for name in ("import", "startup")
+    ]
+
+    modules = {}
+    for _, import_times in runs:
+        for module, times in import_times.items():
+            modules.setdefault(module, []).append(times)
+    costs = {module: (statistics.median(self_ms for self_ms, _ in times),
+                      statistics.median(cumulative_ms for _, cumulative_ms in times))
+             for module, times in modules.items()}
+    # The modules of the application itself are always reported, the others only when they are among the most costly.
+    reported = sorted(costs, key=lambda module: costs[module][0], reverse=True)[:top]
+    reported += sorted(module for module in costs if module.split(".")[0] == "app" and module not in reported)
+    for module in reported:
+        results.append({"name": f"import {module}", "params": {},
+                        "self_ms": round(costs[module][0], 3), "time_ms": round(costs[module][1], 3)})
+
+    return results
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Profile the import and startup time of the coffee store API.")
+    parser.add_argument("--repeat", type=int, default=5, help="How many fresh interpreters to profile.")
+    parser.add_argument("--top", type=int, default=15, help="How many of the most expensive modules to report.")
+    parser.add_argument("--budget-ms", type=float, default=None,
+                        help="Fail if importing the application takes longer, in milliseconds.")
+    parser.add_argument("--output", default=None, help="Where to write the JSON report. Default: stdout.")
+    args = parser.parse_args(argv)
+
+    results = profile(args.repeat, args.top)
+    for result in results:
+        self_ms = f"self {result['self_ms']:>9.3f} ms" if "self_ms" in result else ""
+        print(f"{result['name']:<60} {result['time_ms']:>9.3f} ms  {self_ms}", file=sys.stderr)
+    write_report("startup", results, args.output)
+
+    import_ms = results[0]["time_ms"]
+    if args.budget_ms is not None and import_ms > args.budget_ms:
+        print(f"Importing the application took {import_ms:.1f} ms, over the budget of {args.budget_ms:.1f} ms",
+              file=sys.stderr)
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())